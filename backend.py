@@ -16,30 +16,37 @@ Author: Mikel Sagardia
 Date: 2023-02-07
 """
 
+import bisect
+import copy
+import functools
+import hashlib
+import importlib
+import importlib.util
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from os.path import isfile
 import pandas as pd
 import numpy as np
 
-from scipy.spatial.distance import cosine
-
-from sklearn.cluster import KMeans
-from sklearn.decomposition import NMF
-from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
-from sklearn.pipeline import Pipeline
-from sklearn.linear_model import LinearRegression
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error
-from sklearn.metrics import precision_recall_fscore_support
-from sklearn.preprocessing import LabelEncoder
-
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras import layers
-from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.metrics import RootMeanSquaredError
-from tensorflow.keras.losses import MeanSquaredError
+from scipy import sparse
+
+from ranking import select_top_k
+
+# Parquet engine; only looked up here, imported by pandas when a Parquet file is read
+HAS_PARQUET = importlib.util.find_spec("pyarrow") is not None
+
+# NOTE: the model dependencies (scikit-learn, TensorFlow/Keras)
+# are not imported here, but on first use with lazy_import(),
+# so that importing the backend does not pay for them.
 
 MODELS = ("1. Course Similarity",
           "2. User Profile",
@@ -48,6 +55,16 @@ MODELS = ("1. Course Similarity",
           "5. KNN",
           "6. NMF",
 )
+# Neural network models (model indices 6-8, see get_model_index()): not offered
+# in the app, but train() builds the RecommenderNet embeddings and their item
+# ANN index with them. Their training needs TensorFlow, see check_model_available();
+# their predictions need NumPy/scikit-learn only
+NN_MODELS = ("7. Neural Network",
+             "8. Regression with Embedding Features",
+             "9. Classification with Embedding Features",
+)
+ALL_MODELS = MODELS + NN_MODELS
+HAS_TENSORFLOW = importlib.util.find_spec("tensorflow") is not None
 DATA_ROOT = "data"
 FILEPATH_RATINGS = DATA_ROOT+"/ratings.csv"
 FILEPATH_COURSE_SIMS = DATA_ROOT+"/sim.csv"
@@ -55,8 +72,105 @@ FILEPATH_COURSES = DATA_ROOT+"/course_processed.csv"
 FILEPATH_BOWS = DATA_ROOT+"/courses_bows.csv"
 FILEPATH_COURSE_GENRES = DATA_ROOT+"/course_genre.csv"
 FILEPATH_USER_PROFILES = DATA_ROOT+"/user_profile.csv"
+FILEPATH_RATINGS_DB = DATA_ROOT+"/ratings.db"
+# Ratings storage: "sqlite" (indexed store, FILEPATH_RATINGS_DB)
+# or "csv" (FILEPATH_RATINGS rewritten on every new user)
+RATINGS_STORE = "sqlite"
+# Binary columnar versions of the datasets, written by convert_data.py:
+# tables are stored as Parquet, numeric matrices as .npy (memory-mapped)
+BINARY_FORMATS = {
+    FILEPATH_RATINGS: ".parquet",
+    FILEPATH_COURSE_SIMS: ".npy",
+    FILEPATH_COURSES: ".parquet",
+    FILEPATH_BOWS: ".parquet",
+    FILEPATH_COURSE_GENRES: ".parquet",
+    FILEPATH_USER_PROFILES: ".parquet",
+}
+# Process pool size of predict_batch() for the models without batched implementation
+PREDICT_WORKERS = os.cpu_count() or 1
+# Models whose predictions are computed with batched matrix operations (by model index)
+BATCHED_MODELS = (0, 1, 2, 3, 4, 5, 6)
+# Partitions scanned per query by the item embedding MIPS index
+ANN_NUM_PROBES = 4
+# Streaming training input of the RecommenderNet: encoded ratings on disk in shards
+ANN_SHARDS_ROOT = "ann_shards"
+ANN_SHARD_SIZE = 1000000 # records per shard file
+ANN_SHUFFLE_BUFFER = 100000 # records
+ANN_BATCH_SIZE = 32
+ANN_SPLIT_FRACTIONS = (0.8, 0.1, 0.1) # train, validation, test
+# Shards of previous ratings versions are removed only if unused for this long (s),
+# since a training job which started earlier may still read them
+ANN_SHARDS_RETENTION = 3600
+# Rating rows per chunk of the embedding feature gather (regression/classification with embeddings)
+EMBEDDING_CHUNK_SIZE = 1000000
+# Datasets loaded concurrently at startup by preload_datasets()
+PRELOAD_DATASETS = ("ratings", "course_sims", "courses", "bow", "course_genres", "user_profiles")
+PRELOAD_WORKERS = 4
+# Clustering of the user profiles: "batch" (in memory) or "streaming" (out-of-core, in chunks)
+CLUSTERING_MODE = "batch"
+CLUSTERING_CHUNK_SIZE = 100000 # user profiles per chunk
+STREAMING_KMEANS_EPOCHS = 3
+# Per-stage timing instrumentation (STAGE_TIMINGS); histogram bucket upper bounds in s
+TIMINGS_ENABLED = True
+TIMING_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Persistent store of training artifacts
+ARTIFACTS_ROOT = "artifacts"
+ARTIFACT_STORE_MAX_BYTES = 2 * 1024**3 # LRU eviction above this disk budget
+ARTIFACT_FORMAT_VERSION = 3
 RANDOM_SEED = 123
 NUM_GENRES = 14
+SIM_AGGREGATIONS = ("max", "mean", "sum")
+# Params which affect the training of each model (by model index)
+TRAINING_PARAMS = (
+    (), # 0: "Course Similarity"
+    (), # 1: "User Profile"
+    ("num_clusters", "pca_variance", "clustering_mode"), # 2: "Clustering"
+    ("num_clusters", "pca_variance", "clustering_mode"), # 3: "Clustering with PCA"
+    ("num_neighbors",), # 4: "KNN"
+    ("num_components",), # 5: "NMF"
+    ("num_components", "num_epochs"), # 6: "Neural Network"
+    ("num_components", "num_epochs"), # 7: "Regression with Embedding Features"
+    ("num_components", "num_epochs"), # 8: "Classification with Embedding Features"
+)
+# Datasets read by the training of each model (by model index)
+TRAINING_SOURCES = (
+    (),
+    (),
+    ("user_profiles", "ratings"),
+    ("user_profiles", "ratings"),
+    ("ratings",),
+    ("ratings",),
+    ("ratings", "bows"),
+    ("ratings", "bows"),
+    ("ratings", "bows"),
+)
+SCORE_DESCRIPTIONS = (
+    "Note: the score is the cosine similarity\
+        between the selected and the recommended\
+        courses.",
+    "Note: the score is the alignment (dot product)\
+        between the user profile built with the selected\
+        courses and the recommended ones.",
+    "Note: the score is the number of enrollments\
+        of each recommended course, which belongs to the user\
+        cluster of the interacting user.",
+    "Note: the score is the number of enrollments\
+        of each recommended course, which belongs to the user\
+        cluster of the interacting user.",
+    "Note: the score is the cosine similarity\
+        of the suggested course with respect to one\
+        of the selected courses.",
+    "Note: the score is the rating predicted\
+        by the Non-Negative Matrix Factorization (NMF) model.",
+    "Note: the score is the rating predicted\
+        by the neural network model.",
+    "Note: the score is the rating predicted\
+        by the regression model which works\
+        with the embeddings created by a neural network.",
+    "Note: the score is the rating x probability predicted\
+        by the classification model which works\
+        with the embeddings created by a neural network.",
+)
 MODEL_DESCRIPTIONS = (
     "Course similarities are built from course text descriptions using Bags-of-Words (BoW). \
         A similarity value is the projection of a course descriptor vector in the form of a BoW \
@@ -95,29 +209,539 @@ MODEL_DESCRIPTIONS = (
         classification model which predicts the rating given the embedding of a user and a course."
 )
 
+# Startup timings (s): first import of each lazily imported module
+# and load time of each preloaded dataset, see get_startup_report()
+IMPORT_TIMES = {}
+DATASET_LOAD_TIMES = {}
+# Streaming scaler + PCA fit of the user profiles, by data fingerprint
+PROFILE_TRANSFORMS = {}
+
+def lazy_import(module_name):
+    """Import a module on first use and record how long the import took.
+    Used for the model dependencies (scikit-learn, TensorFlow),
+    so that only the models actually trained/used pay for them.
+
+    Inputs:
+        module_name: str
+            Absolute module name, e.g., "sklearn.cluster".
+    Outputs:
+        module: module
+            Imported module.
+    """
+    module = sys.modules.get(module_name)
+    if module is None:
+        tic = time.perf_counter()
+        module = importlib.import_module(module_name)
+        IMPORT_TIMES.setdefault(module_name, time.perf_counter() - tic)
+    return module
+
+def __getattr__(name):
+    """Module attribute fallback: backend.RecommenderNet is still available,
+    but TensorFlow is imported only when it is accessed."""
+    if name == "RecommenderNet":
+        return lazy_import("recommender_net").RecommenderNet
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+class StageTimings:
+    """Wall-time and call counters of the backend stages
+    (dataset loading, scoring, thresholding, etc.), tagged with the model name.
+
+    Each stage has a counter (calls), a sum (s) and a histogram
+    with the TIMING_BUCKETS upper bounds, as in Prometheus. The stages
+    recorded by the current thread since the last request() call are kept
+    as the breakdown of the last request. Recording costs a lock and a few
+    additions; when disabled, stage() returns a shared no-op context.
+    Stages run in the process pool of predict_batch() are not recorded.
+    """
+
+    def __init__(self, enabled=TIMINGS_ENABLED, buckets=TIMING_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def record(self, stage, seconds, model_name=None):
+        """Record one call of a stage."""
+        current = getattr(self._local, "model_name", None)
+        if model_name is None:
+            model_name = current or ""
+        key = (stage, model_name)
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {"count": 0,
+                                            "sum": 0.0,
+                                            "buckets": [0] * (len(self.buckets) + 1)}
+            stats["count"] += 1
+            stats["sum"] += seconds
+            stats["buckets"][bucket] += 1
+        if current is not None:
+            self._local.last_request.append((stage, seconds))
+
+    @contextmanager
+    def _timed(self, stage, model_name):
+        tic = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - tic, model_name)
+
+    def stage(self, stage, model_name=None):
+        """Context manager which times a stage; the model name defaults
+        to the one of the current request."""
+        if not self.enabled:
+            return NULL_CONTEXT
+        return self._timed(stage, model_name)
+
+    @contextmanager
+    def request(self, model_name):
+        """Scope of a train/predict request of the current thread:
+        it sets the model name of the nested stages and starts
+        a new last-request breakdown (nested requests extend the outer one)."""
+        outer = getattr(self._local, "model_name", None)
+        if outer is None:
+            self._local.last_request = []
+        self._local.model_name = model_name
+        try:
+            yield
+        finally:
+            self._local.model_name = outer
+
+    def last_request(self):
+        """Get the stage breakdown of the last request of the current thread.
+
+        Outputs:
+            breakdown_df: pd.DataFrame
+                Columns: stage, calls, seconds; in order of first completion.
+        """
+        breakdown = {}
+        for stage, seconds in getattr(self._local, "last_request", None) or []:
+            calls, total = breakdown.get(stage, (0, 0.0))
+            breakdown[stage] = (calls + 1, total + seconds)
+        rows = [(stage, calls, seconds) for stage, (calls, seconds) in breakdown.items()]
+
+        return pd.DataFrame(rows, columns=["stage", "calls", "seconds"])
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def to_dict(self):
+        """Get the counters and histograms as a JSON-serializable dict:
+        a list of stages with count, sum (s) and cumulative bucket counts."""
+        with self._lock:
+            items = [(key, dict(stats, buckets=list(stats["buckets"])))
+                     for key, stats in sorted(self._stats.items())]
+        stages = []
+        for (stage, model_name), stats in items:
+            cumulative = np.cumsum(stats["buckets"]).tolist()
+            stages.append({"stage": stage,
+                           "model": model_name,
+                           "count": stats["count"],
+                           "sum": stats["sum"],
+                           "buckets": {str(le): n for le, n in zip(self.buckets + ("+Inf",), cumulative)}})
+        return {"stages": stages}
+
+    def to_prometheus(self, metric="backend_stage_seconds"):
+        """Get the histograms in the Prometheus text exposition format."""
+        lines = [f"# HELP {metric} Wall time of the backend stages.",
+                 f"# TYPE {metric} histogram"]
+        for entry in self.to_dict()["stages"]:
+            labels = f'stage="{entry["stage"]}",model="{entry["model"]}"'
+            for le, n in entry["buckets"].items():
+                lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {n}')
+            lines.append(f"{metric}_sum{{{labels}}} {entry['sum']}")
+            lines.append(f"{metric}_count{{{labels}}} {entry['count']}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, filepath):
+        """Write the timings to a file: JSON if it ends with .json, Prometheus text otherwise."""
+        with open(filepath, "w") as f:
+            if filepath.endswith(".json"):
+                json.dump(self.to_dict(), f, indent=2)
+            else:
+                f.write(self.to_prometheus())
+
+NULL_CONTEXT = nullcontext()
+STAGE_TIMINGS = StageTimings()
+
+def timed_stage(stage):
+    """Decorator which records each call of a function as a stage of STAGE_TIMINGS."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not STAGE_TIMINGS.enabled:
+                return func(*args, **kwargs)
+            with STAGE_TIMINGS.stage(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class DatasetRegistry:
+    """Process-wide cache of the parsed datasets.
+
+    Each dataset is loaded once per process and the same in-memory
+    object is handed out afterwards; callers must treat it as read-only.
+    An entry is invalidated only when its file changes: the file is
+    stat'ed on each access (no data is read) and, if the mtime or size
+    changed, the content hash is compared to the one of the cached version
+    (hashes are computed only after the first change, to keep cold loads cheap).
+    Hits and misses are counted to verify that the hot path does no disk I/O.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key):
+        with self._lock:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+    def get(self, name, filepath, loader):
+        """Get a dataset, loading it with loader() on a miss.
+
+        Inputs:
+            name: str
+                Dataset name; several datasets can derive from the same file.
+            filepath: str
+                File the dataset is loaded from, used for change detection.
+            loader: callable
+                Function without arguments which loads/parses the dataset.
+        Outputs:
+            dataset: object
+                Parsed dataset, shared by all callers.
+        """
+        key = (name, filepath)
+        with self._key_lock(key):
+            stat = os.stat(filepath)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry["signature"] == signature:
+                    self.hits += 1
+                    return entry["dataset"]
+                # File touched: reload only if the content changed
+                digest = file_digest(filepath)
+                if entry["digest"] == digest:
+                    entry["signature"] = signature
+                    self.hits += 1
+                    return entry["dataset"]
+            else:
+                digest = None
+            self.misses += 1
+            with STAGE_TIMINGS.stage("load_" + name):
+                dataset = loader()
+            self._entries[key] = {"signature": signature,
+                                  "digest": digest,
+                                  "dataset": dataset}
+            return dataset
+
+    def invalidate(self, filepath=None):
+        """Drop the cached datasets of a file, or all if filepath is None."""
+        with self._lock:
+            for key in list(self._entries):
+                if filepath is None or key[1] == filepath:
+                    del self._entries[key]
+
+    def stats(self):
+        """Get the cache counters and the cached dataset names."""
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "entries": sorted(name for name, _ in self._entries)}
+
+DATASETS = DatasetRegistry()
+
+def file_digest(filepath, chunk_size=1 << 20):
+    """Compute the BLAKE2 hash of a file content."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_binary_filepath(filepath, extension=None):
+    """Get the path of the binary version of a CSV dataset,
+    e.g., data/ratings.csv -> data/ratings.parquet."""
+    if extension is None:
+        extension = BINARY_FORMATS[filepath]
+    return os.path.splitext(filepath)[0] + extension
+
+def find_binary_filepath(filepath):
+    """Get the binary version of a CSV dataset if it can be used:
+    it must exist, be readable (Parquet needs pyarrow)
+    and not be older than the CSV file, which might have been updated.
+    Otherwise, None is returned and the CSV should be used."""
+    extension = BINARY_FORMATS.get(filepath)
+    if extension is None or (extension == ".parquet" and not HAS_PARQUET):
+        return None
+    binary_filepath = get_binary_filepath(filepath, extension)
+    if not isfile(binary_filepath):
+        return None
+    if isfile(filepath) and os.stat(filepath).st_mtime_ns > os.stat(binary_filepath).st_mtime_ns:
+        return None
+    return binary_filepath
+
+def load_table(name, filepath):
+    """Load a table dataset, from Parquet if available, else from CSV."""
+    binary_filepath = find_binary_filepath(filepath)
+    if binary_filepath is not None:
+        return DATASETS.get(name, binary_filepath,
+                            lambda: pd.read_parquet(binary_filepath))
+    return DATASETS.get(name, filepath,
+                        lambda: pd.read_csv(filepath))
+
+# Source file fingerprint of each rating store (by absolute path)
+# already checked by this process, see sync_ratings_store()
+VERIFIED_RATINGS_SOURCES = {}
+# Read-only connections to the rating stores, kept per thread,
+# see get_ratings_store_version()
+RATINGS_STORE_READERS = threading.local()
+RATINGS_STORE_TRIGGERS = {
+    "ratings_insert": "AFTER INSERT",
+    "ratings_update": "AFTER UPDATE",
+    "ratings_delete": "AFTER DELETE",
+}
+
+def get_ratings_source_fingerprint():
+    """Get the source file of the rating store (the binary version of the ratings
+    if it can be used, else the CSV) and its content hash; (None, None) if there is none."""
+    filepath = find_binary_filepath(FILEPATH_RATINGS) or FILEPATH_RATINGS
+    if not isfile(filepath):
+        return None, None
+    return filepath, get_file_fingerprint(filepath)
+
+def connect_ratings_store():
+    """Open a connection to the SQLite rating store.
+    The store is created and filled with the ratings CSV/Parquet
+    the first time, and filled again if that source file is later
+    edited or replaced (the ratings added since, e.g. by add_new_ratings(),
+    are then discarded); the import runs in a write transaction,
+    so concurrent processes import it only once.
+    The store keeps the hash of its source file and a version counter,
+    increased by triggers on every insert, update and delete,
+    see get_source_fingerprint().
+
+    Outputs:
+        conn: sqlite3.Connection
+            Connection in autocommit mode; transactions are explicit.
+    """
+    source_filepath, source_fingerprint = get_ratings_source_fingerprint()
+    conn = sqlite3.connect(FILEPATH_RATINGS_DB, timeout=30.0, isolation_level=None)
+
+    def is_up_to_date(info):
+        # Without a source file, the store is the only copy of the ratings
+        return "imported" in info and (source_fingerprint is None or info.get("source") == source_fingerprint)
+
+    try:
+        if is_up_to_date(dict(conn.execute("SELECT key, value FROM store_info").fetchall())):
+            VERIFIED_RATINGS_SOURCES[os.path.abspath(FILEPATH_RATINGS_DB)] = source_fingerprint
+            return conn
+    except sqlite3.OperationalError:
+        # Tables not created yet
+        pass
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS ratings "
+                     "(user INTEGER NOT NULL, item TEXT NOT NULL, rating REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ratings_user ON ratings (user)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ratings_item ON ratings (item)")
+        conn.execute("CREATE TABLE IF NOT EXISTS store_info (key TEXT PRIMARY KEY, value TEXT)")
+        info = dict(conn.execute("SELECT key, value FROM store_info").fetchall())
+        if not is_up_to_date(info):
+            # (Re-)import; the triggers are dropped meanwhile, not to count every imported row
+            for trigger in RATINGS_STORE_TRIGGERS:
+                conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            conn.execute("DELETE FROM ratings")
+            if source_filepath is not None and source_filepath.endswith(".parquet"):
+                ratings_df = pd.read_parquet(source_filepath)
+            else:
+                ratings_df = pd.read_csv(FILEPATH_RATINGS)
+            conn.executemany("INSERT INTO ratings (user, item, rating) VALUES (?, ?, ?)",
+                             zip(ratings_df['user'].astype(int).tolist(),
+                                 ratings_df['item'].astype(str).tolist(),
+                                 ratings_df['rating'].astype(float).tolist()))
+            conn.executemany("INSERT OR REPLACE INTO store_info (key, value) VALUES (?, ?)",
+                             [("imported", source_filepath),
+                              ("source", source_fingerprint),
+                              ("version", str(int(info.get("version", 0)) + 1))])
+        for trigger, event in RATINGS_STORE_TRIGGERS.items():
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS {trigger} {event} ON ratings BEGIN "
+                         "UPDATE store_info SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'; "
+                         "END")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        conn.close()
+        raise
+    VERIFIED_RATINGS_SOURCES[os.path.abspath(FILEPATH_RATINGS_DB)] = source_fingerprint
+
+    return conn
+
+def sync_ratings_store():
+    """Create or re-import the rating store if needed, see connect_ratings_store().
+    Once checked by this process, this costs a stat() of the source file only."""
+    _, source_fingerprint = get_ratings_source_fingerprint()
+    db_filepath = os.path.abspath(FILEPATH_RATINGS_DB)
+    if not isfile(db_filepath) or VERIFIED_RATINGS_SOURCES.get(db_filepath, False) != source_fingerprint:
+        connect_ratings_store().close()
+
+def get_ratings_store_version():
+    """Get the version of the rating store: source file hash + change counter.
+    The store_info table is read with a connection kept by the calling thread,
+    opened again only if the store file is replaced.
+
+    Outputs:
+        version: str
+    """
+    sync_ratings_store()
+    db_filepath = os.path.abspath(FILEPATH_RATINGS_DB)
+    stat = os.stat(db_filepath)
+    connections = getattr(RATINGS_STORE_READERS, "connections", None)
+    if connections is None:
+        connections = RATINGS_STORE_READERS.connections = {}
+    key = (db_filepath, stat.st_dev, stat.st_ino)
+    conn = connections.get(key)
+    if conn is None:
+        for previous_key in [k for k in connections if k[0] == db_filepath]:
+            connections.pop(previous_key).close()
+        conn = sqlite3.connect(db_filepath, timeout=30.0, isolation_level=None)
+        connections[key] = conn
+    info = dict(conn.execute("SELECT key, value FROM store_info "
+                             "WHERE key IN ('source', 'version')").fetchall())
+
+    return f"{info.get('source')}:{info.get('version')}"
+
+def export_ratings(filepath=None):
+    """Bulk export of the rating store, in insertion order.
+    This is the path used for training: one sequential scan.
+
+    Inputs:
+        filepath: str
+            Optional; if passed, the ratings are also written to
+            this file (Parquet if it ends with .parquet, else CSV).
+    Outputs:
+        ratings_df: pd.DataFrame
+            Ratings: user, item, rating.
+    """
+    conn = connect_ratings_store()
+    try:
+        rows = conn.execute("SELECT user, item, rating FROM ratings ORDER BY rowid").fetchall()
+    finally:
+        conn.close()
+    ratings_df = pd.DataFrame.from_records(rows, columns=['user', 'item', 'rating'])
+    ratings_df = ratings_df.astype({'user': np.int64, 'rating': np.float64})
+    if filepath is not None:
+        if filepath.endswith(".parquet"):
+            ratings_df.to_parquet(filepath, index=False)
+        else:
+            ratings_df.to_csv(filepath, index=False)
+
+    return ratings_df
+
+FILE_FINGERPRINTS = {}
+
+def get_file_fingerprint(filepath):
+    """Get the content hash of a file; it is recomputed
+    only if the file mtime or size changed since the last call."""
+    stat = os.stat(filepath)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = FILE_FINGERPRINTS.get(filepath)
+    if cached is None or cached[0] != signature:
+        cached = (signature, file_digest(filepath))
+        FILE_FINGERPRINTS[filepath] = cached
+    return cached[1]
+
 def load_ratings():
     """Load ratings dataframe: user, course, rating (2/3)."""
-    return pd.read_csv(FILEPATH_RATINGS)
+    if RATINGS_STORE == "sqlite":
+        sync_ratings_store()
+        return DATASETS.get("ratings", FILEPATH_RATINGS_DB, export_ratings)
+    return load_table("ratings", FILEPATH_RATINGS)
+
+def load_user_ratings(user_ids):
+    """Load the ratings of some users only;
+    with the SQLite store, this is an indexed lookup.
+
+    Inputs:
+        user_ids: list
+            User ids.
+    Outputs:
+        user_ratings_df: pd.DataFrame
+            Ratings of the users: user, item, rating.
+    """
+    user_ids = [int(user_id) for user_id in user_ids]
+    if RATINGS_STORE != "sqlite":
+        ratings_df = load_ratings()
+        return ratings_df[ratings_df['user'].isin(user_ids)]
+    conn = connect_ratings_store()
+    try:
+        rows = []
+        # Stay below the SQLite limit of host parameters
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start+500]
+            placeholders = ",".join("?" * len(chunk))
+            rows += conn.execute("SELECT user, item, rating FROM ratings "
+                                 f"WHERE user IN ({placeholders}) ORDER BY rowid",
+                                 chunk).fetchall()
+    finally:
+        conn.close()
+    user_ratings_df = pd.DataFrame.from_records(rows, columns=['user', 'item', 'rating'])
+    user_ratings_df = user_ratings_df.astype({'user': np.int64, 'rating': np.float64})
+
+    return user_ratings_df
+
+def load_course_sim_matrix():
+    """Load course similarity matrix: course vs. course, numpy.array.
+    If the .npy version exists it is memory-mapped (read-only),
+    so that all processes share the same pages."""
+    binary_filepath = find_binary_filepath(FILEPATH_COURSE_SIMS)
+    if binary_filepath is not None:
+        return DATASETS.get("course_sim_matrix", binary_filepath,
+                            lambda: np.load(binary_filepath, mmap_mode="r"))
+    return DATASETS.get("course_sim_matrix", FILEPATH_COURSE_SIMS,
+                        lambda: pd.read_csv(FILEPATH_COURSE_SIMS).to_numpy())
 
 def load_course_sims():
     """Load course similarities dataframe: course vs. course."""
-    return pd.read_csv(FILEPATH_COURSE_SIMS)
+    binary_filepath = find_binary_filepath(FILEPATH_COURSE_SIMS)
+    if binary_filepath is not None:
+        def loader():
+            sim_matrix = load_course_sim_matrix()
+            columns = [str(i) for i in range(sim_matrix.shape[1])]
+            return pd.DataFrame(sim_matrix, columns=columns, copy=False)
+        return DATASETS.get("course_sims", binary_filepath, loader)
+    return DATASETS.get("course_sims", FILEPATH_COURSE_SIMS,
+                        lambda: pd.read_csv(FILEPATH_COURSE_SIMS))
 
 def load_courses():
     """Load courses dataframe: course, title, description."""
-    df = pd.read_csv(FILEPATH_COURSES)
-    df['TITLE'] = df['TITLE'].str.title()
-    return df
+    binary_filepath = find_binary_filepath(FILEPATH_COURSES)
+    filepath = FILEPATH_COURSES if binary_filepath is None else binary_filepath
+    def loader():
+        if binary_filepath is None:
+            df = pd.read_csv(FILEPATH_COURSES)
+        else:
+            df = pd.read_parquet(binary_filepath)
+        df['TITLE'] = df['TITLE'].str.title()
+        return df
+    return DATASETS.get("courses", filepath, loader)
 
 def load_bow():
     """Load course bags-of-words (BoW) descriptors:
     course index and name, token, bow-count."""
-    return pd.read_csv(FILEPATH_BOWS)
+    return load_table("bow", FILEPATH_BOWS)
 
 def load_course_genres():
     """Load course genre table:
     course index, title, 14 binary genre features."""
-    return pd.read_csv(FILEPATH_COURSE_GENRES)
+    return load_table("course_genres", FILEPATH_COURSE_GENRES)
 
 def load_user_profiles(get_df=True):
     """Load user profiles table:
@@ -127,14 +751,14 @@ def load_user_profiles(get_df=True):
     We can get the dataset or not, depending on
     the value of the get_df flag.
     """
-    if not isfile(FILEPATH_USER_PROFILES):
+    if not isfile(FILEPATH_USER_PROFILES) and find_binary_filepath(FILEPATH_USER_PROFILES) is None:
         course_genres_df = load_course_genres()
         ratings_df = load_ratings()
         build_user_profiles(course_genres_df,
                             ratings_df,
                             FILEPATH_USER_PROFILES)
     if get_df:
-        return pd.read_csv(FILEPATH_USER_PROFILES)
+        return load_table("user_profiles", FILEPATH_USER_PROFILES)
     else:
         return None
 
@@ -143,24 +767,32 @@ def get_model_index(model_name):
 
     Inputs:
         model_name: str
-            Name of the model, contained in the MODELS tuple.
+            Name of the model, contained in the ALL_MODELS tuple.
 
     Outputs:
         index: int
-            Index of the model name in the MODELS tuple.
+            Index of the model name in the ALL_MODELS tuple.
     """
     index = None
-    for i in range(len(MODELS)):
-        if model_name == MODELS[i]:
+    for i in range(len(ALL_MODELS)):
+        if model_name == ALL_MODELS[i]:
             index = i
             break
     return index
 
+def check_model_available(model_name):
+    """Raise an ImportError if a model cannot be trained in this environment."""
+    if model_name in NN_MODELS and not HAS_TENSORFLOW:
+        raise ImportError(f"Model {model_name} requires TensorFlow, which is not installed")
+
 def add_new_ratings(new_courses):
-    """The ratings.csv table is extended with the choices
+    """The ratings table is extended with the choices
     of the new interactive user. All selected courses
     are rated with 3.0. This function is called after train()
     but before predict().
+    With the SQLite store, the new id is allocated and the rows
+    are appended in one write transaction, so concurrent sessions
+    get different ids and the cost is O(new rows).
 
     Inputs:
         new_courses: list
@@ -172,6 +804,24 @@ def add_new_ratings(new_courses):
     res_dict = {}
     new_id = None
     if len(new_courses) > 0:
+        if RATINGS_STORE == "sqlite":
+            conn = connect_ratings_store()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                # Create a new user id, max id + 1 (index lookup)
+                max_id = conn.execute("SELECT MAX(user) FROM ratings").fetchone()[0]
+                new_id = 0 if max_id is None else max_id + 1
+                conn.executemany("INSERT INTO ratings (user, item, rating) VALUES (?, ?, ?)",
+                                 [(new_id, str(course), 3.0) for course in new_courses])
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+            DATASETS.invalidate(FILEPATH_RATINGS_DB)
+            return new_id
         # Create a new user id, max id + 1
         ratings_df = load_ratings()
         new_id = ratings_df['user'].max() + 1
@@ -182,7 +832,8 @@ def add_new_ratings(new_courses):
         res_dict['rating'] = ratings
         new_df = pd.DataFrame(res_dict)
         updated_ratings = pd.concat([ratings_df, new_df])
-        updated_ratings.to_csv(DATA_ROOT+"/ratings.csv", index=False)
+        updated_ratings.to_csv(FILEPATH_RATINGS, index=False)
+        DATASETS.invalidate(FILEPATH_RATINGS)
         
     return new_id
 
@@ -198,219 +849,398 @@ def get_doc_dicts():
         id_idx_dict: dict
             Key: course id, str; value: course index, int.
     """
-    bow_df = load_bow()
-    grouped_df = bow_df.groupby(['doc_index', 'doc_id']).max().reset_index(drop=False)
-    idx_id_dict = grouped_df[['doc_id']].to_dict()['doc_id']
-    id_idx_dict = {v: k for k, v in idx_id_dict.items()}
-    del grouped_df
+    def loader():
+        bow_df = load_bow()
+        grouped_df = bow_df.groupby(['doc_index', 'doc_id']).max().reset_index(drop=False)
+        idx_id_dict = grouped_df[['doc_id']].to_dict()['doc_id']
+        id_idx_dict = {v: k for k, v in idx_id_dict.items()}
+        del grouped_df
+        return idx_id_dict, id_idx_dict
+    filepath = find_binary_filepath(FILEPATH_BOWS) or FILEPATH_BOWS
+    idx_id_dict, id_idx_dict = DATASETS.get("doc_dicts", filepath, loader)
 
     return idx_id_dict, id_idx_dict
 
-class RecommenderNet(keras.Model):
-    
-    def __init__(self, num_users, num_items, embedding_size=16, **kwargs):
-        """Constructor.
-           :param int num_users: number of users
-           :param int num_items: number of items
-           :param int embedding_size: the size of embedding vector
-        """
-        super(RecommenderNet, self).__init__(**kwargs)
-        self.num_users = num_users
-        self.num_items = num_items
-        self.embedding_size = embedding_size
-        
-        # Define a user_embedding vector
-        # Input dimension is the num_users
-        # Output dimension is the embedding size
-        self.user_embedding_layer = layers.Embedding(
-            input_dim=num_users,
-            output_dim=embedding_size,
-            name='user_embedding_layer',
-            embeddings_initializer="he_normal",
-            embeddings_regularizer=keras.regularizers.l2(1e-6),
-        )
-        # Define a user bias layer
-        self.user_bias = layers.Embedding(
-            input_dim=num_users,
-            output_dim=1,
-            name="user_bias")
-        
-        # Define an item_embedding vector
-        # Input dimension is the num_items
-        # Output dimension is the embedding size
-        self.item_embedding_layer = layers.Embedding(
-            input_dim=num_items,
-            output_dim=embedding_size,
-            name='item_embedding_layer',
-            embeddings_initializer="he_normal",
-            embeddings_regularizer=keras.regularizers.l2(1e-6),
-        )
-        # Define an item bias layer
-        self.item_bias = layers.Embedding(
-            input_dim=num_items,
-            output_dim=1,
-            name="item_bias")
-        
-    def call(self, inputs):
-        """Method to be called during model fitting.
-           
-           :param inputs: user and item one-hot vectors
-        """
-        # Compute the user embedding vector
-        user_vector = self.user_embedding_layer(inputs[:, 0])
-        user_bias = self.user_bias(inputs[:, 0])
-        item_vector = self.item_embedding_layer(inputs[:, 1])
-        item_bias = self.item_bias(inputs[:, 1])
-        dot_user_item = tf.tensordot(user_vector, item_vector, 2)
-        # Add all the components (including bias)
-        x = dot_user_item + user_bias + item_bias
-        # Sigmoid output layer to output the probability
-        return tf.nn.relu(x)
-
-def encode_ratings(raw_data):
-    """Encode user-item ratings for the ANN training.
+def preload_datasets(names=PRELOAD_DATASETS, max_workers=PRELOAD_WORKERS):
+    """Load several datasets concurrently into the dataset cache (DATASETS),
+    e.g., at startup; parsing is mostly I/O and C code, so threads overlap well.
+    The load time of each dataset is recorded in DATASET_LOAD_TIMES.
 
     Inputs:
-        raw_data: pd.DataFrame
-            Table with user-course/item ratings
+        names: tuple
+            Dataset names, see PRELOAD_DATASETS.
+        max_workers: int
+            Thread pool size.
     Outputs:
-        encoded_data: pd.DataFrame
-            Encoded table in which user & item ids are mapped to integers.
-        user_idx2id_dict: dict
-            User mappings.
-        course_idx2id_dict: dict
-            Course/item mappings
+        load_times: dict
+            Load time (s) of each dataset; cache hits are (nearly) free.
     """
-    
-    encoded_data = raw_data.copy()
-    
-    # Mapping user ids to indices
-    user_list = encoded_data["user"].unique().tolist()
-    user_id2idx_dict = {x: i for i, x in enumerate(user_list)}
-    user_idx2id_dict = {i: x for i, x in enumerate(user_list)}
-    
-    # Mapping course ids to indices
-    course_list = encoded_data["item"].unique().tolist()
-    course_id2idx_dict = {x: i for i, x in enumerate(course_list)}
-    course_idx2id_dict = {i: x for i, x in enumerate(course_list)}
+    loaders = {
+        "ratings": load_ratings,
+        "course_sims": load_course_sims,
+        "courses": load_courses,
+        "bow": load_bow,
+        "course_genres": load_course_genres,
+        "user_profiles": load_user_profiles,
+        "doc_dicts": get_doc_dicts,
+    }
+
+    def timed_load(name):
+        tic = time.perf_counter()
+        loaders[name]()
+        return time.perf_counter() - tic
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        load_times = dict(zip(names, executor.map(timed_load, names)))
+    DATASET_LOAD_TIMES.update(load_times)
+
+    return load_times
+
+def get_startup_report():
+    """Get the startup timings recorded so far: the first import
+    of each lazily imported module and the load time of each preloaded dataset.
+    The imports done by `import backend` itself can be measured with
+    startup_report.py (python -X importtime).
 
-    # Convert original user ids to idx
-    encoded_data["user"] = encoded_data["user"].map(user_id2idx_dict)
-    # Convert original course ids to idx
-    encoded_data["item"] = encoded_data["item"].map(course_id2idx_dict)
-    # Convert rating to int
-    encoded_data["rating"] = encoded_data["rating"].values.astype("int")
+    Outputs:
+        report_df: pd.DataFrame
+            Columns: kind ("module"/"dataset"), name, seconds.
+    """
+    rows = [("module", name, seconds) for name, seconds in IMPORT_TIMES.items()]
+    rows += [("dataset", name, seconds) for name, seconds in DATASET_LOAD_TIMES.items()]
 
-    return encoded_data, user_idx2id_dict, course_idx2id_dict
+    return pd.DataFrame(rows, columns=["kind", "name", "seconds"])
 
-def generate_train_test_datasets_ann(dataset, scale=True):
-    """Scale and split dataset for training ANNs.
+def build_ratings_matrix(ratings_df, item_ids=None):
+    """Build the sparse users x items ratings matrix (CSR)
+    shared by the collaborative models, with stable index maps:
+    users and items are sorted by id, as in ratings_df.pivot().
 
-    Args:
-        dataset: pd.DataFrame
-            Table with features (user & item) and target (rating).
-        scale: bool
-            Whether to scale target or not. Defaults to True.
+    Inputs:
+        ratings_df: pd.DataFrame
+            Table with user-course/item ratings.
+        item_ids: list
+            Optional, fixed item/column order (e.g., the one of a trained model);
+            ratings of other items are ignored.
+    Outputs:
+        ratings_matrix: dict
+            "matrix": scipy.sparse.csr_matrix (n_users, n_items),
+            "user_ids", "item_ids": numpy.array with the id of each row/column,
+            "user_id2idx_dict", "item_id2idx_dict": dict id -> row/column index.
+    """
+    user_ids, user_positions = np.unique(ratings_df['user'].to_numpy(), return_inverse=True)
+    if item_ids is None:
+        item_ids, item_positions = np.unique(ratings_df['item'].to_numpy(), return_inverse=True)
+    else:
+        item_ids = np.asarray(item_ids)
+        item_positions = pd.Index(item_ids).get_indexer(ratings_df['item'])
+    ratings = ratings_df['rating'].to_numpy(dtype=np.float64)
+    found = item_positions >= 0
+    matrix = sparse.csr_matrix((ratings[found],
+                                (user_positions[found], item_positions[found])),
+                               shape=(len(user_ids), len(item_ids)))
+    ratings_matrix = {
+        "matrix": matrix,
+        "user_ids": user_ids,
+        "item_ids": item_ids,
+        "user_id2idx_dict": {user: i for i, user in enumerate(user_ids.tolist())},
+        "item_id2idx_dict": {item: i for i, item in enumerate(item_ids.tolist())},
+    }
+
+    return ratings_matrix
+
+def get_user_ratings_row(ratings_matrix, user_id):
+    """Get the ratings of a user as a sparse row of the ratings matrix.
 
-    Returns:
-        x_train, x_val, x_test, y_train, y_val, y_test: np.array
-            Scaled and splitted features and target.
+    Inputs:
+        ratings_matrix: dict
+            Ratings matrix, see build_ratings_matrix().
+        user_id: int
+            User id.
+    Outputs:
+        row: scipy.sparse.csr_matrix (1, n_items)
+            User ratings; empty if the user is unknown.
     """
-    min_rating = min(dataset["rating"])
-    max_rating = max(dataset["rating"])
+    matrix = ratings_matrix["matrix"]
+    user_idx = ratings_matrix["user_id2idx_dict"].get(user_id)
+    if user_idx is None:
+        return sparse.csr_matrix((1, matrix.shape[1]))
 
-    dataset = dataset.sample(frac=1, random_state=42)
-    x = dataset[["user", "item"]].values
-    if scale:
-        y = dataset["rating"].apply(lambda x: (x - min_rating) / (max_rating - min_rating)).values
+    return matrix[user_idx]
+
+def iter_rating_chunks(chunk_size=ANN_SHARD_SIZE):
+    """Read the ratings in chunks of rows, without loading them whole:
+    a cursor over the SQLite store, else Parquet row batches or CSV chunks.
+
+    Inputs:
+        chunk_size: int
+            Number of rows per chunk.
+    Outputs:
+        chunks: generator of pd.DataFrame
+            Rating chunks: user, item, rating.
+    """
+    if RATINGS_STORE == "sqlite":
+        conn = connect_ratings_store()
+        try:
+            cursor = conn.execute("SELECT user, item, rating FROM ratings ORDER BY rowid")
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield pd.DataFrame.from_records(rows, columns=['user', 'item', 'rating'])
+        finally:
+            conn.close()
+        return
+    binary_filepath = find_binary_filepath(FILEPATH_RATINGS)
+    if binary_filepath is not None:
+        parquet_file = lazy_import("pyarrow.parquet").ParquetFile(binary_filepath)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
     else:
-        y = dataset["rating"].values
+        yield from pd.read_csv(FILEPATH_RATINGS, chunksize=chunk_size)
+
+# Record of the encoded rating shards: fixed length, little-endian
+ANN_RECORD_DTYPE = np.dtype([("user", "<i4"), ("item", "<i4"), ("rating", "<f4")])
+
+def write_ann_shards(shard_dir,
+                     shard_size=ANN_SHARD_SIZE,
+                     split_fractions=ANN_SPLIT_FRACTIONS,
+                     random_state=RANDOM_SEED):
+    """Encode the ratings for the RecommenderNet training and write them
+    to disk in shards, streaming: the ratings are never loaded whole.
+    A first pass collects the user/item ids and the rating range;
+    a second pass maps the ids to embedding rows, scales the ratings to [0, 1],
+    assigns each rating to the train/validation/test split at random
+    and appends it to the current shard of its split.
+    The rows of each chunk are permuted before writing, since the store
+    is ordered by user and the training shuffle buffer is bounded.
 
-    # Assuming training on 80% of the data and validating on 10%, and testing 10%
-    train_indices = int(0.8 * dataset.shape[0])
-    test_indices = int(0.9 * dataset.shape[0])
+    Inputs:
+        shard_dir: str
+            Output directory, written atomically; if a concurrent process
+            wrote it meanwhile (same ratings), its version is kept.
+        shard_size: int
+            Records per shard file; also the chunk size of the ratings scan.
+        split_fractions: tuple
+            Fractions of the train, validation and test splits.
+        random_state: int
+            Seed of the split and the permutations.
+    Outputs:
+        manifest: dict
+            "num_users", "num_items", "min_rating", "max_rating",
+            "splits": {split: {"files": [str], "num_records": int}},
+            "user_ids", "item_ids": numpy.array, id of each embedding row.
+    """
+    # Pass 1: ids (in order of appearance) and rating range
+    user_ids, item_ids = [], []
+    min_rating, max_rating = np.inf, -np.inf
+    for chunk in iter_rating_chunks(shard_size):
+        user_ids.append(chunk['user'].unique())
+        item_ids.append(chunk['item'].astype(str).unique())
+        min_rating = min(min_rating, chunk['rating'].min())
+        max_rating = max(max_rating, chunk['rating'].max())
+    user_index = pd.Index(pd.unique(np.concatenate(user_ids)) if user_ids else [])
+    item_index = pd.Index(pd.unique(np.concatenate(item_ids)) if item_ids else [])
+    rating_range = (max_rating - min_rating) or 1.0
+
+    # Pass 2: encode and write the shards
+    tmp_dir = f"{shard_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    rng = np.random.default_rng(random_state)
+    split_names = ("train", "validation", "test")
+    cumulative_fractions = np.cumsum(split_fractions[:-1])
+    splits = {split: {"files": [], "num_records": 0} for split in split_names}
+    shard_files = {}
+    try:
+        for chunk in iter_rating_chunks(shard_size):
+            records = np.empty(len(chunk), dtype=ANN_RECORD_DTYPE)
+            records["user"] = user_index.get_indexer(chunk['user'])
+            records["item"] = item_index.get_indexer(chunk['item'].astype(str))
+            records["rating"] = (chunk['rating'].to_numpy(dtype=np.float64) - min_rating) / rating_range
+            records = records[rng.permutation(len(records))]
+            split_codes = np.searchsorted(cumulative_fractions, rng.random(len(records)), side='right')
+            for code, split in enumerate(split_names):
+                split_records = records[split_codes == code]
+                while len(split_records) > 0:
+                    # Open a new shard when the current one is full
+                    num_written = splits[split]["num_records"] % shard_size
+                    if num_written == 0:
+                        if split in shard_files:
+                            shard_files[split].close()
+                        filename = f"{split}-{len(splits[split]['files']):05d}.bin"
+                        shard_files[split] = open(os.path.join(tmp_dir, filename), "wb")
+                        splits[split]["files"].append(filename)
+                    num_records = min(shard_size - num_written, len(split_records))
+                    split_records[:num_records].tofile(shard_files[split])
+                    splits[split]["num_records"] += num_records
+                    split_records = split_records[num_records:]
+    finally:
+        for shard_file in shard_files.values():
+            shard_file.close()
+    manifest = {"num_users": len(user_index),
+                "num_items": len(item_index),
+                "min_rating": float(min_rating),
+                "max_rating": float(max_rating),
+                "splits": splits}
+    np.save(os.path.join(tmp_dir, "user_ids.npy"), user_index.to_numpy(dtype=np.int64))
+    np.save(os.path.join(tmp_dir, "item_ids.npy"), item_index.to_numpy(dtype=str))
+    with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    try:
+        os.replace(tmp_dir, shard_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if load_ann_shards(shard_dir) is None:
+            raise
+
+    return load_ann_shards(shard_dir)
+
+def load_ann_shards(shard_dir):
+    """Load the manifest of the rating shards written by write_ann_shards(),
+    with the split files as full paths; None if there are none."""
+    manifest_filepath = os.path.join(shard_dir, "manifest.json")
+    if not isfile(manifest_filepath):
+        return None
+    with open(manifest_filepath) as f:
+        manifest = json.load(f)
+    for split in manifest["splits"].values():
+        split["files"] = [os.path.join(shard_dir, filename) for filename in split["files"]]
+    manifest["user_ids"] = np.load(os.path.join(shard_dir, "user_ids.npy"))
+    manifest["item_ids"] = np.load(os.path.join(shard_dir, "item_ids.npy"))
 
-    x_train, x_val, x_test, y_train, y_val, y_test = (
-        x[:train_indices],
-        x[train_indices:test_indices],
-        x[test_indices:],
-        y[:train_indices],
-        y[train_indices:test_indices],
-        y[test_indices:],
-    )
-    return x_train, x_val, x_test, y_train, y_val, y_test
+    return manifest
 
-def train_ann(ratings_df, embedding_size, epochs):
-    """Instantiate and train ANN model.
+def get_ann_shards(shard_size=ANN_SHARD_SIZE):
+    """Get the rating shards of the current ratings, writing them
+    only if the ratings changed since they were written;
+    each call marks them as used (manifest mtime),
+    see remove_stale_ann_shards().
+
+    Outputs:
+        manifest: dict
+            See write_ann_shards().
+    """
+    key_str = json.dumps({"ratings": get_source_fingerprint("ratings"),
+                          "shard_size": shard_size,
+                          "split_fractions": ANN_SPLIT_FRACTIONS,
+                          "seed": RANDOM_SEED}, sort_keys=True, default=str)
+    key = hashlib.sha256(key_str.encode("utf-8")).hexdigest()[:16]
+    shard_dir = os.path.join(ANN_SHARDS_ROOT, key)
+    manifest = load_ann_shards(shard_dir)
+    if manifest is None:
+        manifest = write_ann_shards(shard_dir, shard_size)
+    else:
+        os.utime(os.path.join(shard_dir, "manifest.json"))
+    remove_stale_ann_shards(shard_dir)
+
+    return manifest
+
+def remove_stale_ann_shards(current_dir, retention=ANN_SHARDS_RETENTION):
+    """Remove the shard directories of previous versions of the ratings:
+    only finished ones (with a manifest; *.tmp directories are being written
+    by another process), last used before the current one
+    and not used for retention seconds.
+
+    Inputs:
+        current_dir: str
+            Shard directory of the current ratings, kept.
+        retention: float
+            Minimum time (s) since the last use of a removed directory.
+    """
+    current_used = os.stat(os.path.join(current_dir, "manifest.json")).st_mtime
+    now = time.time()
+    for name in os.listdir(ANN_SHARDS_ROOT):
+        shard_dir = os.path.join(ANN_SHARDS_ROOT, name)
+        if name.endswith(".tmp") or os.path.samefile(shard_dir, current_dir):
+            continue
+        try:
+            last_used = os.stat(os.path.join(shard_dir, "manifest.json")).st_mtime
+        except OSError:
+            continue
+        if last_used < current_used and now - last_used > retention:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+
+def train_ann(embedding_size,
+              epochs,
+              batch_size=ANN_BATCH_SIZE,
+              shuffle_buffer=ANN_SHUFFLE_BUFFER):
+    """Instantiate and train ANN model, streaming
+    the encoded ratings from disk (see get_ann_shards())
+    with a tf.data pipeline: bounded shuffle buffer, batching, prefetch.
 
     Inputs:
-        ratings_df: pd.DataFrame
-            Dataframe with user-time-ratings.
         embedding_size: int
             Size of the latent embedding components.
         epochs: int
             Number of epochs.
+        batch_size: int
+            Training batch size.
+        shuffle_buffer: int
+            Records in the shuffle buffer.
 
     Outputs:
         res_dict: dict
-            Dictionary with training artifacts.
+            Dictionary with training artifacts;
+            "throughput" has the examples/s of each epoch.
         model: class RecommenderNet
             Keras ANN, trained.
     """
     res_dict = dict()
     
-    # Encode ratings table to integers
-    encoded_data, user_idx2id_dict, course_idx2id_dict = encode_ratings(ratings_df)
-    # Scale dataset and split it to train/val/test
-    X = generate_train_test_datasets_ann(encoded_data)
-    x_train, x_val, x_test, y_train, y_val, y_test = X
-    # Get size for ANN
-    num_users = len(ratings_df['user'].unique())
-    num_items = len(ratings_df['item'].unique())
-    # Instantiate ANN
-    model = RecommenderNet(num_users, num_items, embedding_size)
-    model.compile(optimizer=Adam(learning_rate = .003),
-                    loss=MeanSquaredError(), 
-                    metrics=[RootMeanSquaredError()])
+    # Encoded ratings, split to train/val/test, in shards on disk
+    manifest = get_ann_shards()
+    splits = manifest["splits"]
+    user_idx2id_dict = dict(enumerate(manifest["user_ids"].tolist()))
+    course_idx2id_dict = dict(enumerate(manifest["item_ids"].tolist()))
+    # Instantiate ANN (TensorFlow is imported here, on first use)
+    recommender_net = lazy_import("recommender_net")
+    model = recommender_net.RecommenderNet(manifest["num_users"], manifest["num_items"], embedding_size)
+    model.compile(optimizer=recommender_net.Adam(learning_rate = .003),
+                    loss=recommender_net.MeanSquaredError(), 
+                    metrics=[recommender_net.RootMeanSquaredError()])
+    train_dataset = recommender_net.make_ratings_dataset(splits["train"]["files"],
+                                                         batch_size,
+                                                         shuffle_buffer=shuffle_buffer,
+                                                         seed=RANDOM_SEED)
+    val_dataset = recommender_net.make_ratings_dataset(splits["validation"]["files"], batch_size)
+    test_dataset = recommender_net.make_ratings_dataset(splits["test"]["files"], batch_size)
+    throughput = recommender_net.ThroughputCallback(splits["train"]["num_records"])
     
     # Train ANN
     #train_me = False
     train_me = True
     if train_me:
-        run_hist = model.fit(x_train,
-                            y_train,
-                            validation_data=(x_val, y_val),
+        run_hist = model.fit(train_dataset,
+                            validation_data=val_dataset,
                             epochs=epochs,
-                            shuffle=True)
+                            callbacks=[throughput])
     
+    for epoch in throughput.epochs:
+        STAGE_TIMINGS.record("ann_epoch", epoch["seconds"])
     # Evaluate trained ANN
-    rmse = model.evaluate(x_test,y_test,verbose=0)
+    rmse = model.evaluate(test_dataset, verbose=0)
 
     # Extract embeddings
     # Create a dataframe of the user features
     user_latent_features = model.get_layer('user_embedding_layer').get_weights()[0]
     user_columns = [f"UFeature{i}" for i in range(user_latent_features.shape[1])]
     user_embeddings_df = pd.DataFrame(data=user_latent_features, columns = user_columns)
-    user_embeddings_df['user'] = user_embeddings_df.index
-    # Shift column 'user' to first position
-    first_column = user_embeddings_df.pop('user')
-    user_embeddings_df.insert(0, 'user', first_column)
     # Decode user ids
-    user_embeddings_df['user'] = user_embeddings_df['user'].replace(user_idx2id_dict)
+    user_embeddings_df.insert(0, 'user', manifest["user_ids"])
     # Create a dataframe of the item features
     item_latent_features = model.get_layer('item_embedding_layer').get_weights()[0]
     item_columns = [f"CFeature{i}" for i in range(item_latent_features.shape[1])]
     item_embeddings_df = pd.DataFrame(data=item_latent_features, columns = item_columns)
-    item_embeddings_df['item'] = item_embeddings_df.index
-    # Shift column 'item' to first position
-    first_column = item_embeddings_df.pop('item')
-    item_embeddings_df.insert(0, 'item', first_column)
-    # Decode user ids
-    item_embeddings_df['item'] = item_embeddings_df['item'].replace(course_idx2id_dict)
+    # Decode item ids
+    item_embeddings_df.insert(0, 'item', manifest["item_ids"])
 
     # Pack all results
-    #res_dict["model"] = model
+    # The Keras model itself is not stored: it is not hashable/picklable;
+    # its weights are exported as plain arrays for the NumPy scorer instead
     res_dict["rmse"] = rmse
+    res_dict["throughput"] = throughput.epochs
+    res_dict["serving"] = export_recommender_net(model, user_idx2id_dict, course_idx2id_dict)
     res_dict["user_idx2id_dict"] = user_idx2id_dict
     res_dict["course_idx2id_dict"] = course_idx2id_dict
     res_dict["user_embeddings_df"] = user_embeddings_df
@@ -418,64 +1248,442 @@ def train_ann(ratings_df, embedding_size, epochs):
 
     return res_dict, model
 
-def predict_ann_values(model,
-                       unselected_course_ids,
-                       new_id,
-                       training_artifacts):
-    """Given the trained model and new user & selected courses,
-    predict ratings for the unselected courses.
+def export_recommender_net(model, user_idx2id_dict, course_idx2id_dict):
+    """Export a trained RecommenderNet to its serving form:
+    the embedding and bias weights and the id maps as plain arrays,
+    which can be scored without TensorFlow, see score_recommender_net().
 
     Inputs:
         model: class RecommenderNet
             Keras ANN, trained.
-        unselected_course_ids: list
-            List of unselected courses.
-        new_id: int
-            Index of the new user.
-        training_artifacts: dict
-            Training artifacts.
-    Outputs:
-        result: dict
-            Rating prediction for each unselected course.
-    """
-    result = {}
-    # Get and modify mapping dictionaries
-    course_idx2id_dict = training_artifacts["course_idx2id_dict"]
-    user_idx2id_dict = training_artifacts["user_idx2id_dict"]
-    course_id2idx_dict = {v:k for k,v in course_idx2id_dict.items()}    
-    user_id2idx_dict = {v:k for k,v in user_idx2id_dict.items()}    
-    # Create dataframe with user data
-    courses = list(unselected_course_ids)
-    users = [new_id]*len(courses)
-    data_dict = {"user": users, "item": courses}
-    data_df = pd.DataFrame(data_dict, columns=["user", "item"])
-    # Encode data
-    data_df['item'] = data_df['item'].map(course_id2idx_dict)
-    data_df['user'] = data_df['user'].map(user_id2idx_dict)
-    data_df = data_df.dropna()
-    # Extract data matrix
-    x = data_df[["user", "item"]].values
-    # Predict
-    pred = model.predict(x)
-    # Pack and decode
-    data_df["ratings"] = pred.ravel()
-    data_df['item'] = data_df['item'].map(course_idx2id_dict)
-    data_df['user'] = data_df['user'].map(user_idx2id_dict)
-    courses = data_df['item'].to_list()
-    ratings = data_df["ratings"].to_list()
-    result = {courses[i]: ratings[i] for i in range(len(courses))}
-    
-    return result
+        user_idx2id_dict: dict
+            User mappings: embedding row -> user id.
+        course_idx2id_dict: dict
+            Course/item mappings: embedding row -> course id.
+    Outputs:
+        serving: dict
+            "user_embeddings": numpy.array (n_users, embedding_size),
+            "user_biases": numpy.array (n_users,),
+            "item_embeddings": numpy.array (n_items, embedding_size),
+            "item_biases": numpy.array (n_items,),
+            "user_ids": numpy.array (n_users,), user id of each row,
+            "item_ids": numpy.array (n_items,), course id of each row.
+    """
+    serving = {
+        "user_embeddings": model.get_layer('user_embedding_layer').get_weights()[0].astype(np.float32),
+        "user_biases": model.get_layer('user_bias').get_weights()[0].ravel().astype(np.float32),
+        "item_embeddings": model.get_layer('item_embedding_layer').get_weights()[0].astype(np.float32),
+        "item_biases": model.get_layer('item_bias').get_weights()[0].ravel().astype(np.float32),
+        "user_ids": np.array([user_idx2id_dict[i] for i in range(len(user_idx2id_dict))]),
+        "item_ids": np.array([str(course_idx2id_dict[i]) for i in range(len(course_idx2id_dict))]),
+    }
+
+    return serving
+
+def save_recommender_net(serving, filepath):
+    """Save the serving form of a RecommenderNet to an .npz file
+    (plain arrays, no pickled objects)."""
+    np.savez(filepath, **serving)
+
+def load_recommender_net(filepath):
+    """Load the serving form of a RecommenderNet saved with save_recommender_net()."""
+    with np.load(filepath, allow_pickle=False) as data:
+        serving = {key: data[key] for key in data.files}
+
+    return serving
+
+def score_recommender_net(serving, user_indices, item_indices=None):
+    """Predict the ratings of users with the serving form of a RecommenderNet;
+    same computation as RecommenderNet.call(), in NumPy:
+    relu(user_vector . item_vector + user_bias + item_bias).
+
+    Inputs:
+        serving: dict
+            RecommenderNet serving form, see export_recommender_net().
+        user_indices: numpy.array (n_users,)
+            Embedding rows of the users.
+        item_indices: numpy.array (n_items,)
+            Embedding rows of the items; None scores all items.
+    Outputs:
+        scores: numpy.array (n_users, n_items)
+            Predicted (scaled) ratings.
+    """
+    item_embeddings = serving["item_embeddings"]
+    item_biases = serving["item_biases"]
+    if item_indices is not None:
+        item_embeddings = item_embeddings[item_indices]
+        item_biases = item_biases[item_indices]
+    user_indices = np.asarray(user_indices, dtype=np.int64)
+    scores = serving["user_embeddings"][user_indices] @ item_embeddings.T
+    scores += serving["user_biases"][user_indices][:, None]
+    scores += item_biases[None, :]
+
+    return np.maximum(scores, 0)
+
+def compute_recommender_net_recommendations_batch(serving,
+                                                  user_ids,
+                                                  enrolled_course_ids_list,
+                                                  id_idx_dict,
+                                                  top_k=None,
+                                                  threshold=None):
+    """Predict the ratings of the unselected courses of a batch of users
+    with the serving form of a RecommenderNet (no TensorFlow needed).
+    Users unknown to the model get no recommendations.
+
+    Inputs:
+        serving: dict
+            RecommenderNet serving form, see export_recommender_net().
+        user_ids: list
+            User ids.
+        enrolled_course_ids_list: list
+            List of selected course ids, one list per user.
+        id_idx_dict: dict
+            Course id -> index dictionary; only these courses are recommended.
+        top_k: int
+            Number of courses per user; None returns all unselected courses.
+        threshold: float
+            Minimum predicted rating; None keeps all.
+    Outputs:
+        res_list: list
+            One dict per user; key: course id, str; value: predicted rating.
+    """
+    item_ids = serving["item_ids"]
+    user_rows = pd.Index(serving["user_ids"]).get_indexer(user_ids)
+    known = user_rows >= 0
+    scores = np.full((len(user_ids), len(item_ids)), -np.inf)
+    if known.any():
+        scores[known] = score_recommender_net(serving, user_rows[known])
+    # Mask out the courses not in the catalogue and the selected ones
+    scores[:, ~np.isin(item_ids, list(id_idx_dict))] = -np.inf
+    item_id2idx_dict = {item_id: i for i, item_id in enumerate(item_ids.tolist())}
+    for row, enrolled_course_ids in enumerate(enrolled_course_ids_list):
+        seen = [item_id2idx_dict[course] for course in enrolled_course_ids
+                if course in item_id2idx_dict]
+        scores[row, seen] = -np.inf
+
+    return score_rows_to_dicts(scores, dict(enumerate(item_ids.tolist())), top_k, threshold)
+
+def build_ragged_indices(index_lists):
+    """Pack several lists of indices into a ragged array,
+    i.e., one flat array of values and an offsets array
+    (as in the CSR format): the indices of user i are
+    values[offsets[i]:offsets[i+1]].
+
+    Inputs:
+        index_lists: list
+            List of lists/arrays of int indices, one per user.
+    Outputs:
+        values: numpy.array (n_total,)
+            Concatenated indices.
+        offsets: numpy.array (n_users+1,)
+            Start/end position of each user in values.
+    """
+    lengths = np.array([len(indices) for indices in index_lists], dtype=np.int64)
+    offsets = np.zeros(len(index_lists)+1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    if offsets[-1] > 0:
+        values = np.concatenate([np.asarray(indices, dtype=np.int64)
+                                 for indices in index_lists])
+    else:
+        values = np.zeros(0, dtype=np.int64)
+
+    return values, offsets
+
+def build_item_ann_index(item_embeddings,
+                         item_ids,
+                         item_biases=None,
+                         num_partitions=None,
+                         num_iterations=10,
+                         random_state=RANDOM_SEED):
+    """Build an approximate maximum-inner-product search (MIPS) index
+    over the item embeddings, in NumPy only.
+
+    The MIPS problem is reduced to a nearest-neighbor search:
+    items are augmented as [v, b, sqrt(M^2 - |[v, b]|^2)], with M the
+    largest norm, and queries as [u, 1, 0]; then q.x = u.v + b for all items
+    and all augmented items have the same norm. The augmented items are
+    partitioned with k-means (inverted file); a query scores the partition
+    centroids and only the items of the num_probes best partitions are
+    scored exactly. More probes give higher recall and higher latency.
+
+    Inputs:
+        item_embeddings: numpy.array (n_items, embedding_size)
+            Item embedding vectors.
+        item_ids: list
+            Course id of each row.
+        item_biases: numpy.array (n_items,)
+            Optional item biases, added to the inner product.
+        num_partitions: int
+            Number of k-means partitions; defaults to sqrt(n_items).
+        num_iterations: int
+            Number of k-means (Lloyd) iterations.
+        random_state: int
+            Seed of the centroid initialization.
+    Outputs:
+        ann_index: dict
+            Index arrays: "item_vectors", "item_ids", "centroids",
+            "order" (items sorted by partition), "offsets" (partition bounds).
+    """
+    item_embeddings = np.asarray(item_embeddings, dtype=np.float32)
+    num_items = item_embeddings.shape[0]
+    if item_biases is None:
+        item_biases = np.zeros(num_items, dtype=np.float32)
+    item_vectors = np.hstack([item_embeddings,
+                              np.asarray(item_biases, dtype=np.float32).reshape(-1, 1)])
+    # MIPS -> nearest neighbor transformation
+    norms2 = np.sum(item_vectors.astype(np.float64)**2, axis=1)
+    augmented = np.hstack([item_vectors,
+                           np.sqrt(np.maximum(norms2.max() - norms2, 0.0)).reshape(-1, 1)])
+    # Partition with k-means (Lloyd iterations)
+    if num_partitions is None:
+        num_partitions = int(np.ceil(np.sqrt(num_items)))
+    num_partitions = max(1, min(num_partitions, num_items))
+    rng = np.random.default_rng(random_state)
+    centroids = augmented[rng.choice(num_items, num_partitions, replace=False)]
+    for _ in range(num_iterations):
+        # Largest inner product == smallest distance, all items have the same norm
+        labels = np.argmax(augmented @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, augmented)
+        counts = np.bincount(labels, minlength=num_partitions)
+        non_empty = counts > 0
+        centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+    labels = np.argmax(augmented @ centroids.T, axis=1)
+    order = np.argsort(labels, kind="stable")
+    offsets = np.zeros(num_partitions + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=num_partitions), out=offsets[1:])
+    ann_index = {
+        "item_vectors": item_vectors, # (n_items, embedding_size+1): [v, b]
+        "item_ids": np.asarray(item_ids),
+        "centroids": centroids.astype(np.float32), # (n_partitions, embedding_size+2)
+        "order": order,
+        "offsets": offsets,
+    }
+
+    return ann_index
+
+def query_item_ann_index(ann_index, user_vector, k=10, num_probes=ANN_NUM_PROBES):
+    """Find the (approximate) top-k items of a user vector
+    by inner product (+ item bias) with the MIPS index.
 
-def course_similarity_recommendations(idx_id_dict, 
+    Inputs:
+        ann_index: dict
+            Index, see build_item_ann_index().
+        user_vector: numpy.array (embedding_size,)
+            User embedding.
+        k: int
+            Number of items returned.
+        num_probes: int
+            Number of partitions scanned; the larger, the higher
+            the recall and the latency. None scans all (exact).
+    Outputs:
+        item_ids: numpy.array (<=k,)
+            Course ids, sorted by descending score.
+        scores: numpy.array (<=k,)
+            Inner product + item bias of each returned item.
+    """
+    query = np.append(np.asarray(user_vector, dtype=np.float32), np.float32(1.0))
+    centroids = ann_index["centroids"]
+    offsets = ann_index["offsets"]
+    # Select the partitions with the largest centroid inner products
+    partitions, _ = select_top_k(centroids[:, :-1] @ query, num_probes)
+    candidates = np.concatenate([ann_index["order"][offsets[p]:offsets[p+1]]
+                                 for p in partitions[0].tolist()])
+    # Exact scores of the candidates
+    candidate_scores = ann_index["item_vectors"][candidates] @ query
+    top_positions, top_scores = select_top_k(candidate_scores, k)
+    item_indices = candidates[top_positions[0]]
+
+    return ann_index["item_ids"][item_indices], top_scores[0]
+
+def compute_ann_recall_report(ann_index,
+                              user_vectors,
+                              k=10,
+                              num_probes_list=(1, 2, 4, 8, None)):
+    """Measure the recall@k of the MIPS index against brute force,
+    and the mean query latency, for several numbers of probes.
+
+    Inputs:
+        ann_index: dict
+            Index, see build_item_ann_index().
+        user_vectors: numpy.array (n_users, embedding_size)
+            Query user embeddings.
+        k: int
+            Number of items retrieved per user.
+        num_probes_list: tuple
+            Numbers of probes evaluated; None means all partitions.
+    Outputs:
+        report_df: pd.DataFrame
+            Columns: num_probes, recall_at_k, ann_ms, brute_force_ms.
+    """
+    user_vectors = np.asarray(user_vectors, dtype=np.float32)
+    queries = np.hstack([user_vectors, np.ones((user_vectors.shape[0], 1), dtype=np.float32)])
+    item_vectors = ann_index["item_vectors"]
+    # Brute force top-k
+    tic = time.perf_counter()
+    exact = [set(select_top_k(item_vectors @ query, k)[0][0].tolist()) for query in queries]
+    brute_force_ms = 1000 * (time.perf_counter() - tic) / max(len(queries), 1)
+    id_idx_dict = {item: i for i, item in enumerate(ann_index["item_ids"].tolist())}
+    rows = []
+    for num_probes in num_probes_list:
+        hits = 0
+        tic = time.perf_counter()
+        results = [query_item_ann_index(ann_index, user_vector, k, num_probes)[0]
+                   for user_vector in user_vectors]
+        ann_ms = 1000 * (time.perf_counter() - tic) / max(len(queries), 1)
+        for result, exact_items in zip(results, exact):
+            hits += len(exact_items.intersection(id_idx_dict[item] for item in result.tolist()))
+        expected = sum(len(exact_items) for exact_items in exact)
+        rows.append({"num_probes": num_probes if num_probes is not None else len(ann_index["centroids"]),
+                     "recall_at_k": hits / max(expected, 1),
+                     "ann_ms": ann_ms,
+                     "brute_force_ms": brute_force_ms})
+    report_df = pd.DataFrame(rows, columns=["num_probes", "recall_at_k", "ann_ms", "brute_force_ms"])
+
+    return report_df
+
+def course_similarity_scores(sim_matrix,
+                             enrolled_indices,
+                             offsets=None,
+                             aggregation="max"):
+    """Score all courses for a batch of users with the course similarity matrix.
+    The rows of the enrolled courses are gathered from the matrix and
+    reduced column-wise for each user; enrolled courses are masked out.
+
+    Inputs:
+        sim_matrix: numpy.array (n_courses, n_courses)
+            Similarity matrix between courses.
+        enrolled_indices: numpy.array (n_total,)
+            Course indices of the enrolled courses of all users,
+            concatenated (ragged array values).
+        offsets: numpy.array (n_users+1,)
+            Start/end positions of each user in enrolled_indices;
+            if None, all indices belong to a single user.
+        aggregation: str
+            Column-wise reduction, one of SIM_AGGREGATIONS: "max", "mean" or "sum".
+    Outputs:
+        scores: numpy.array (n_users, n_courses)
+            Score of each course for each user; enrolled courses
+            and users without enrolled courses get -inf.
+    """
+    if aggregation not in SIM_AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation: {aggregation}; use one of {SIM_AGGREGATIONS}.")
+    sim_matrix = np.asarray(sim_matrix)
+    enrolled_indices = np.asarray(enrolled_indices, dtype=np.int64)
+    if offsets is None:
+        offsets = np.array([0, len(enrolled_indices)], dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    num_users = len(offsets) - 1
+    num_courses = sim_matrix.shape[1]
+    scores = np.full((num_users, num_courses), -np.inf)
+    if len(enrolled_indices) == 0:
+        return scores
+    lengths = np.diff(offsets)
+    has_courses = lengths > 0
+    # Gather the rows of all enrolled courses: (n_total, n_courses)
+    rows = sim_matrix[enrolled_indices].astype(np.float64, copy=False)
+    # Reduce the rows of each user segment; reduceat needs valid, non-empty segments
+    starts = offsets[:-1][has_courses]
+    if aggregation == "max":
+        reduced = np.maximum.reduceat(rows, starts, axis=0)
+    else:
+        reduced = np.add.reduceat(rows, starts, axis=0)
+        if aggregation == "mean":
+            reduced /= lengths[has_courses][:, None]
+    scores[has_courses] = reduced
+    # Mask out the enrolled courses
+    user_positions = np.repeat(np.arange(num_users), lengths)
+    scores[user_positions, enrolled_indices] = -np.inf
+
+    return scores
+
+@timed_stage("rank")
+def score_rows_to_dicts(scores, idx_id_dict, top_k=None, threshold=None):
+    """Convert a (users x courses) score matrix into one
+    dictionary per user with the top courses sorted by descending score.
+    Columns without course id, -inf scores (masked courses)
+    and scores below the threshold are dropped.
+
+    Inputs:
+        scores: numpy.array (n_users, n_courses)
+            Score matrix; columns are course indices.
+        idx_id_dict: dict
+            Key: course index, int; value: course id, str.
+        top_k: int
+            Number of courses per user; None returns all.
+        threshold: float
+            Minimum score; None keeps all.
+    Outputs:
+        res_list: list
+            One dict per user; key: course id, str; value: score.
+    """
+    scores = np.atleast_2d(scores)
+    known = np.full(scores.shape[1], -np.inf)
+    known_indices = [idx for idx in idx_id_dict if idx < scores.shape[1]]
+    known[known_indices] = 0.0
+    top_indices, top_scores = select_top_k(scores + known, top_k, threshold)
+    res_list = []
+    for indices, values in zip(top_indices, top_scores):
+        valid = values > -np.inf
+        res_list.append({idx_id_dict[idx]: value
+                         for idx, value in zip(indices[valid].tolist(),
+                                               values[valid].tolist())})
+
+    return res_list
+
+def course_similarity_recommendations_batch(idx_id_dict,
+                                            id_idx_dict,
+                                            enrolled_course_ids_list,
+                                            sim_matrix,
+                                            aggregation="max",
+                                            top_k=None,
+                                            threshold=None):
+    """Batched version of course_similarity_recommendations:
+    all users are scored with one gather + reduction on the similarity matrix.
+
+    Inputs:
+        idx_id_dict: dict
+            Key: course index, int; value: course id, str.
+        id_idx_dict: dict
+            Key: course id, str; value: course index, int.
+        enrolled_course_ids_list: list
+            List of lists of enrolled course ids, one per user.
+        sim_matrix: numpy.array
+            Similarity matrix between courses.
+        aggregation: str
+            Column-wise reduction: "max", "mean" or "sum".
+        top_k: int
+            Number of courses returned per user; None returns all.
+        threshold: float
+            Minimum similarity; None keeps all.
+    Outputs:
+        res_list: list
+            One dict per user; key: course id, str; value: similarity.
+            Dicts are sorted by descending similarity.
+    """
+    # Unknown course ids are ignored, as are courses without an id
+    index_lists = [[id_idx_dict[course] for course in enrolled_course_ids
+                    if course in id_idx_dict]
+                   for enrolled_course_ids in enrolled_course_ids_list]
+    enrolled_indices, offsets = build_ragged_indices(index_lists)
+    scores = course_similarity_scores(sim_matrix,
+                                      enrolled_indices,
+                                      offsets,
+                                      aggregation)
+
+    return score_rows_to_dicts(scores, idx_id_dict, top_k, threshold)
+
+def course_similarity_recommendations(idx_id_dict,
                                       id_idx_dict,
-                                      enrolled_course_ids, 
-                                      sim_matrix):
+                                      enrolled_course_ids,
+                                      sim_matrix,
+                                      aggregation="max",
+                                      top_k=None):
     """Use the course similarity matrix computed from course text BoWs
     to get a dictionary of similar courses for a given course list.
     The result dictionary contains a key for each unselected course
     and an associated similarity value.
-    
+
     Inputs:
         idx_id_dict: dict
             Key: course index, int; value: course id, str.
@@ -485,57 +1693,185 @@ def course_similarity_recommendations(idx_id_dict,
             List of selected courses, i.e., user enrolled courses.
         sim_matrix: numpy.array
             Similarity matrix between courses.
+        aggregation: str
+            How the similarities to the enrolled courses are combined:
+            "max" (default), "mean" or "sum".
+        top_k: int
+            Number of courses returned; None returns all.
     Outputs:
         res: dict
             Key: course id, str; value: similarity.
     """
-    all_courses = set(idx_id_dict.values())
-    unselected_course_ids = all_courses.difference(enrolled_course_ids)
-    # Create a dictionary to store your recommendation results
-    res = {}
-    # First find all enrolled courses for user
-    for enrolled_course in enrolled_course_ids:
-        for unselected_course in unselected_course_ids:
-            if enrolled_course in id_idx_dict and unselected_course in id_idx_dict:
-                idx1 = id_idx_dict[enrolled_course]
-                idx2 = id_idx_dict[unselected_course]
-                sim = sim_matrix[idx1][idx2]
-                if unselected_course not in res:
-                    res[unselected_course] = sim
-                else:
-                    if sim >= res[unselected_course]:
-                        res[unselected_course] = sim
-    res = {k: v for k, v in sorted(res.items(), key=lambda item: item[1], reverse=True)}
+    res = course_similarity_recommendations_batch(idx_id_dict,
+                                                  id_idx_dict,
+                                                  [enrolled_course_ids],
+                                                  sim_matrix,
+                                                  aggregation,
+                                                  top_k)[0]
 
     return res
 
+@timed_stage("genre_matrix")
+def build_course_genre_matrix(course_genres_df, idx_id_dict):
+    """Build the dense course genre matrix aligned with the course indices
+    of idx_id_dict (i.e., the doc_index order used everywhere else):
+    row i contains the genre descriptor of course idx_id_dict[i].
+    Courses missing in the genre table get a zero row.
+
+    Inputs:
+        course_genres_df: pd.DataFrame
+            Data frame with binary genre features for each course.
+        idx_id_dict: dict
+            Key: course index, int; value: course id, str.
+    Outputs:
+        genre_matrix: numpy.array (n_courses, NUM_GENRES=14)
+            Genre descriptors of all courses.
+    """
+    num_courses = max(idx_id_dict.keys()) + 1 if len(idx_id_dict) > 0 else 0
+    genres = course_genres_df.iloc[:, 2:].to_numpy(dtype=np.float64)
+    genre_matrix = np.zeros((num_courses, genres.shape[1]))
+    course_indices = np.fromiter(idx_id_dict.keys(), dtype=np.int64, count=len(idx_id_dict))
+    # Keep the first descriptor of duplicated courses
+    course_ids = pd.Index(course_genres_df.COURSE_ID)
+    first = ~course_ids.duplicated()
+    positions = course_ids[first].get_indexer(list(idx_id_dict.values()))
+    genres = genres[first]
+    found = positions >= 0
+    genre_matrix[course_indices[found]] = genres[positions[found]]
+
+    return genre_matrix
+
+@timed_stage("user_profiles")
+def create_user_profiles_batch(enrolled_indices,
+                               offsets,
+                               genre_matrix,
+                               ratings=None):
+    """Build the profiles of a batch of users by gathering
+    the genre rows of their courses and summing them scaled by the ratings.
+
+    Inputs:
+        enrolled_indices: numpy.array (n_total,)
+            Course indices of all users, concatenated (ragged array values).
+        offsets: numpy.array (n_users+1,)
+            Start/end positions of each user in enrolled_indices.
+        genre_matrix: numpy.array (n_courses, NUM_GENRES=14)
+            Genre descriptors of all courses, see build_course_genre_matrix().
+        ratings: numpy.array (n_total,)
+            Rating of each course; if None, the standard rating 3.0 is used.
+    Outputs:
+        user_profiles: numpy.array (n_users, NUM_GENRES=14)
+            Array with genre weights associated to each user.
+    """
+    enrolled_indices = np.asarray(enrolled_indices, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    num_users = len(offsets) - 1
+    user_profiles = np.zeros((num_users, genre_matrix.shape[1]))
+    if len(enrolled_indices) == 0:
+        return user_profiles
+    if ratings is None:
+        ratings = np.full(len(enrolled_indices), 3.0)
+    rows = genre_matrix[enrolled_indices] * np.asarray(ratings, dtype=np.float64)[:, None]
+    lengths = np.diff(offsets)
+    has_courses = lengths > 0
+    user_profiles[has_courses] = np.add.reduceat(rows, offsets[:-1][has_courses], axis=0)
+
+    return user_profiles
+
 def create_user_profile(enrolled_course_ids,
-                        course_genres_df):
+                        course_genres_df,
+                        genre_matrix=None,
+                        id_idx_dict=None):
     """Given a list of courses in which a user has enrolled,
     build a user profile based on the genres of those courses.
 
     Inputs:
         enrolled_course_ids: list
             List of selected courses, i.e., user enrolled courses.
-        sim_matrix: pd.DataFrame
+        course_genres_df: pd.DataFrame
             Data frame with binary genre features for each course.
+        genre_matrix: numpy.array (n_courses, NUM_GENRES=14)
+            Optional, precomputed genre matrix aligned with id_idx_dict;
+            if passed, course_genres_df is not used.
+        id_idx_dict: dict
+            Key: course id, str; value: course index, int.
+            Required if genre_matrix is passed.
     Outputs:
         user_profile: numpy.array (1, NUM_GENRES=14)
             Array with genre weights associated to the user.
     """
-    # Build profile
-    user_profile = np.zeros((1,NUM_GENRES))
-    standard_rating = 3.0
-    for enrolled_course in enrolled_course_ids:
-        course_descriptor = course_genres_df[course_genres_df.COURSE_ID == enrolled_course].iloc[:,2:].values
-        user_profile += standard_rating*course_descriptor 
+    if genre_matrix is None:
+        # Gather rows in the order of the genre table
+        genre_matrix = course_genres_df.iloc[:, 2:].to_numpy(dtype=np.float64)
+        positions = pd.Index(course_genres_df.COURSE_ID).get_indexer(list(enrolled_course_ids))
+        positions = positions[positions >= 0]
+    else:
+        positions = [id_idx_dict[course] for course in enrolled_course_ids
+                     if course in id_idx_dict]
+    user_profile = create_user_profiles_batch(positions,
+                                              [0, len(positions)],
+                                              genre_matrix)
 
     return user_profile
 
+def compute_user_profile_scores(user_profiles, genre_matrix):
+    """Score all courses for a batch of user profiles
+    with a single matrix multiplication: (users x genres) @ (genres x courses).
+
+    Inputs:
+        user_profiles: numpy.array (n_users, NUM_GENRES=14)
+            User profiles.
+        genre_matrix: numpy.array (n_courses, NUM_GENRES=14)
+            Genre descriptors of all courses.
+    Outputs:
+        scores: numpy.array (n_users, n_courses)
+            Alignment (dot product) of each course with each user profile.
+    """
+    return np.atleast_2d(user_profiles) @ genre_matrix.T
+
+def compute_user_profile_recommendations_batch(user_profiles,
+                                               idx_id_dict,
+                                               id_idx_dict,
+                                               enrolled_course_ids_list,
+                                               genre_matrix,
+                                               top_k=None,
+                                               threshold=None):
+    """Batched version of compute_user_profile_recommendations:
+    all profiles are scored with one GEMM and enrolled courses are masked out.
+
+    Inputs:
+        user_profiles: numpy.array (n_users, NUM_GENRES=14)
+            Array with genre weights associated to each user.
+        idx_id_dict: dict
+            Key: course index, int; value: course id, str.
+        id_idx_dict: dict
+            Key: course id, str; value: course index, int.
+        enrolled_course_ids_list: list
+            List of lists of enrolled course ids, one per user.
+        genre_matrix: numpy.array (n_courses, NUM_GENRES=14)
+            Genre descriptors of all courses, see build_course_genre_matrix().
+        top_k: int
+            Number of courses per user; None returns all.
+        threshold: float
+            Minimum score; None keeps all.
+    Outputs:
+        res_list: list
+            One dict per user; key: course id, str; value: score.
+    """
+    scores = compute_user_profile_scores(user_profiles, genre_matrix)
+    index_lists = [[id_idx_dict[course] for course in enrolled_course_ids
+                    if course in id_idx_dict]
+                   for enrolled_course_ids in enrolled_course_ids_list]
+    enrolled_indices, offsets = build_ragged_indices(index_lists)
+    user_positions = np.repeat(np.arange(len(index_lists)), np.diff(offsets))
+    scores[user_positions, enrolled_indices] = -np.inf
+
+    return score_rows_to_dicts(scores, idx_id_dict, top_k, threshold)
+
 def compute_user_profile_recommendations(user_profile,
                                          idx_id_dict, 
                                          enrolled_course_ids,
-                                         course_genres_df):
+                                         course_genres_df,
+                                         genre_matrix=None):
     """Given a list of courses in which a user has enrolled,
     build a user profile based on the genres of those courses
     and suggest courses aligned in the genre/topic space.
@@ -547,28 +1883,23 @@ def compute_user_profile_recommendations(user_profile,
             Key: course index, int; value: course id, str.
         enrolled_course_ids: list
             List of selected courses, i.e., user enrolled courses.
-        sim_matrix: pd.DataFrame
+        course_genres_df: pd.DataFrame
             Data frame with binary genre features for each course.
+        genre_matrix: numpy.array (n_courses, NUM_GENRES=14)
+            Optional, precomputed with build_course_genre_matrix();
+            if passed, course_genres_df is not used.
     Outputs:
         res: dict
             Key: course id, str; value: score.
     """
-    # Sets of attended/unattended courses
-    all_courses = set(idx_id_dict.values())
-    unselected_course_ids = all_courses.difference(enrolled_course_ids)
-    # Get course score
-    # FIXME: this could be one matrix multiplication
-    res = {}
-    for unselected_course in unselected_course_ids:
-        score = 0.0
-        course_descriptor = course_genres_df[course_genres_df.COURSE_ID == unselected_course].iloc[:,2:].values
-        score = np.dot(course_descriptor, user_profile.T)[0,0]
-        if unselected_course not in res:
-            res[unselected_course] = score
-        else:
-            if score >= res[unselected_course]:
-                res[unselected_course] = score    
-    res = {k: v for k, v in sorted(res.items(), key=lambda item: item[1], reverse=True)}
+    if genre_matrix is None:
+        genre_matrix = build_course_genre_matrix(course_genres_df, idx_id_dict)
+    id_idx_dict = {v: k for k, v in idx_id_dict.items()}
+    res = compute_user_profile_recommendations_batch(user_profile,
+                                                     idx_id_dict,
+                                                     id_idx_dict,
+                                                     [enrolled_course_ids],
+                                                     genre_matrix)[0]
 
     return res
 
@@ -591,19 +1922,16 @@ def build_user_profiles(course_genres_df,
     Outputs:
         None.
     """
-    user_ids = sorted(list(ratings_df.user.unique()))
-    num_genres = course_genres_df.shape[1]-2
-    user_matrix = np.zeros((len(user_ids), num_genres))
-    # For each user, get their course ratings
-    # and sum all one-hot encoded course descriptors scaled by the ratings
-    for i, user in enumerate(user_ids):
-        user_df = ratings_df.loc[ratings_df.user==user, :]
-        user_profile = np.zeros((1,num_genres))
-        user_courses = user_df["item"].to_list()
-        for course in user_courses:
-            rating = user_df.loc[user_df.item==course, "rating"].values[0]
-            user_profile += rating*course_genres_df[course_genres_df.COURSE_ID==course].iloc[:, 2:].values
-        user_matrix[i] = user_profile
+    # Users x courses rating matrix (CSR), columns in the order of the genre table;
+    # ratings of courses without genre descriptor are ignored
+    course_ids = pd.Index(course_genres_df.COURSE_ID)
+    first = ~course_ids.duplicated()
+    genres = course_genres_df.iloc[:, 2:].to_numpy(dtype=np.float64)[first]
+    ratings_matrix = build_ratings_matrix(ratings_df, item_ids=course_ids[first])
+    user_ids = ratings_matrix["user_ids"]
+    # Each user profile is the sum of the course descriptors scaled by the ratings,
+    # i.e., (users x courses) @ (courses x genres)
+    user_matrix = ratings_matrix["matrix"] @ genres
     # Pack everything in a dataframe and persist
     user_profiles_df = pd.DataFrame(data=user_matrix, columns=course_genres_df.columns[2:])
     user_id_df = pd.DataFrame(data=user_ids, columns=['user'], dtype=int)
@@ -630,6 +1958,10 @@ def cluster_users(user_profiles_df,
         res_dict: dict
             Dictionary with training artifacts, incl. model.
     """
+    StandardScaler = lazy_import("sklearn.preprocessing").StandardScaler
+    PCA = lazy_import("sklearn.decomposition").PCA
+    KMeans = lazy_import("sklearn.cluster").KMeans
+    Pipeline = lazy_import("sklearn.pipeline").Pipeline
     res_dict = dict()
     # FIXME: I no longer store/return PCA components,
     # so it's better to use Pipeline.fit() even with such a small pipeline...
@@ -668,6 +2000,213 @@ def cluster_users(user_profiles_df,
     
     return res_dict
 
+def iter_user_profile_chunks(chunk_size=CLUSTERING_CHUNK_SIZE):
+    """Read the user profiles table in chunks of rows, without loading it whole:
+    Parquet row batches if the binary version is available, else CSV chunks.
+    The table is built first if it does not exist, see load_user_profiles().
+
+    Inputs:
+        chunk_size: int
+            Number of rows per chunk.
+    Outputs:
+        chunks: generator of pd.DataFrame
+            User profile chunks: user id, genre features.
+    """
+    load_user_profiles(get_df=False)
+    binary_filepath = find_binary_filepath(FILEPATH_USER_PROFILES)
+    if binary_filepath is not None:
+        parquet_file = lazy_import("pyarrow.parquet").ParquetFile(binary_filepath)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(FILEPATH_USER_PROFILES, chunksize=chunk_size)
+
+def rebatch_chunks(chunks, min_rows):
+    """Merge consecutive chunks so that each has at least min_rows rows,
+    as required by the incremental estimators (e.g., a short last chunk
+    is merged into the previous one).
+
+    Inputs:
+        chunks: iterable of pd.DataFrame
+            Chunks of rows.
+        min_rows: int
+            Minimum number of rows per chunk.
+    Outputs:
+        chunks: generator of pd.DataFrame
+            Merged chunks.
+    """
+    pending = None
+    for chunk in chunks:
+        if pending is None:
+            pending = chunk
+        elif len(pending) < min_rows or len(chunk) < min_rows:
+            pending = pd.concat([pending, chunk], ignore_index=True)
+        else:
+            yield pending
+            pending = chunk
+    if pending is not None:
+        yield pending
+
+def fit_user_profile_transform(feature_names, chunk_size=CLUSTERING_CHUNK_SIZE):
+    """Fit the StandardScaler and a full-rank IncrementalPCA of the user profiles
+    in two streaming passes (partial_fit on each chunk).
+    The fit depends only on the data, so it is cached in PROFILE_TRANSFORMS
+    by the user profiles fingerprint: changing num_clusters or pca_variance
+    does not refit it, see truncate_pca().
+
+    Inputs:
+        feature_names: list
+            Genre feature columns.
+        chunk_size: int
+            Number of rows per chunk.
+    Outputs:
+        scaler: sklearn.preprocessing.StandardScaler
+        pca: sklearn.decomposition.IncrementalPCA
+            Fitted with all the components.
+    """
+    StandardScaler = lazy_import("sklearn.preprocessing").StandardScaler
+    IncrementalPCA = lazy_import("sklearn.decomposition").IncrementalPCA
+    # User profiles only: the model fingerprint also covers the ratings (cluster popularity)
+    key = json.dumps([get_source_fingerprint("user_profiles"), feature_names], sort_keys=True, default=str)
+    if key in PROFILE_TRANSFORMS:
+        return PROFILE_TRANSFORMS[key]
+    # Pass 1: feature means/variances
+    scaler = StandardScaler()
+    for chunk in iter_user_profile_chunks(chunk_size):
+        scaler.partial_fit(chunk[feature_names])
+    # Pass 2: principal components of the scaled features
+    pca = IncrementalPCA(n_components=len(feature_names))
+    for chunk in rebatch_chunks(iter_user_profile_chunks(chunk_size), len(feature_names)):
+        pca.partial_fit(scaler.transform(chunk[feature_names]))
+    PROFILE_TRANSFORMS.clear() # keep only the transform of the current data
+    PROFILE_TRANSFORMS[key] = (scaler, pca)
+
+    return scaler, pca
+
+def truncate_pca(pca, pca_variance):
+    """Keep the first principal components of a fitted (Incremental)PCA
+    which explain pca_variance of the variance, as PCA(n_components=pca_variance)
+    would select them; the original estimator is not modified.
+
+    Inputs:
+        pca: sklearn.decomposition.IncrementalPCA
+            Fitted PCA with all the components.
+        pca_variance: float
+            Explained variance ratio; all components are kept if >= 1.0.
+    Outputs:
+        pca: sklearn.decomposition.IncrementalPCA
+            Copy with the selected components.
+    """
+    pca = copy.deepcopy(pca)
+    if pca_variance >= 1.0:
+        return pca
+    ratio_cumsum = np.cumsum(pca.explained_variance_ratio_)
+    n_components = min(int(np.searchsorted(ratio_cumsum, pca_variance, side="right")) + 1,
+                       len(ratio_cumsum))
+    pca.components_ = pca.components_[:n_components]
+    pca.explained_variance_ = pca.explained_variance_[:n_components]
+    pca.explained_variance_ratio_ = pca.explained_variance_ratio_[:n_components]
+    pca.singular_values_ = pca.singular_values_[:n_components]
+    pca.n_components = pca.n_components_ = n_components
+
+    return pca
+
+def cluster_users_streaming(pca_variance,
+                            num_clusters,
+                            chunk_size=CLUSTERING_CHUNK_SIZE,
+                            num_epochs=STREAMING_KMEANS_EPOCHS):
+    """Out-of-core version of cluster_users(): the user profiles are read
+    in chunks and the scaler, PCA (IncrementalPCA) and K-Means (MiniBatchKMeans)
+    are fitted incrementally, so memory does not grow with the number of users.
+    The artifacts are the same as in cluster_users().
+
+    Inputs:
+        pca_variance: float
+            Explained variance ratio if PCA is applied.
+            PCA is applied only if < 1.0.
+        num_clusters: int
+            Number of clusters to find.
+        chunk_size: int
+            Number of user profiles per chunk.
+        num_epochs: int
+            Number of MiniBatchKMeans passes over the data.
+    Outputs:
+        res_dict: dict
+            Dictionary with training artifacts, incl. model.
+    """
+    MiniBatchKMeans = lazy_import("sklearn.cluster").MiniBatchKMeans
+    Pipeline = lazy_import("sklearn.pipeline").Pipeline
+    res_dict = dict()
+    first_chunk = next(iter_user_profile_chunks(chunk_size=1))
+    feature_names = [f for f in list(first_chunk.columns) if f != 'user']
+    res_dict['feature_names'] = feature_names
+    # Scale + PCA
+    scaler, pca = fit_user_profile_transform(feature_names, chunk_size)
+    pca = truncate_pca(pca, pca_variance)
+    # Mini-batch K-Means Clustering
+    kmeans = MiniBatchKMeans(n_clusters=num_clusters,
+                             init='k-means++',
+                             random_state=RANDOM_SEED)
+    for _ in range(num_epochs):
+        for chunk in rebatch_chunks(iter_user_profile_chunks(chunk_size), num_clusters):
+            kmeans.partial_fit(pca.transform(scaler.transform(chunk[feature_names])))
+    # Assemble user-cluster dataframe, chunk by chunk
+    cluster_chunks = []
+    for chunk in iter_user_profile_chunks(chunk_size):
+        clusters = kmeans.predict(pca.transform(scaler.transform(chunk[feature_names])))
+        cluster_chunks.append(pd.DataFrame({'user': chunk['user'].values,
+                                            'cluster': clusters}))
+    res_dict['cluster_df'] = pd.concat(cluster_chunks, ignore_index=True)
+
+    # Pack transformers + model into a pipeline
+    pipe = Pipeline([("scaler", scaler),
+                     ("pcs", pca),
+                     ("kmeans", kmeans)])
+    res_dict['pipe'] = pipe
+
+    return res_dict
+
+def update_user_clusters(training_artifacts, user_profiles_df):
+    """Update a clustering model with new/changed user profiles
+    instead of refitting it: the scaler and PCA are kept, the centroids
+    are updated with MiniBatchKMeans.partial_fit() (if the model was
+    fitted in streaming mode), the users are (re)assigned in cluster_df
+    and their enrollments are moved in the cluster popularity table.
+    Clusters of the other users are not recomputed.
+
+    Inputs:
+        training_artifacts: dict
+            Clustering artifacts, incl. model; not modified.
+        user_profiles_df: pd.DataFrame
+            Profiles of the new users: user id, genre features.
+    Outputs:
+        training_artifacts: dict
+            Updated copy of the artifacts.
+    """
+    training_artifacts = dict(training_artifacts)
+    pipe = copy.deepcopy(training_artifacts['pipe'])
+    feature_names = training_artifacts['feature_names']
+    features = pipe[:-1].transform(user_profiles_df[feature_names])
+    kmeans = pipe[-1]
+    if hasattr(kmeans, "partial_fit"):
+        kmeans.partial_fit(features)
+    clusters = kmeans.predict(features)
+    cluster_df = training_artifacts['cluster_df']
+    updated = cluster_df['user'].isin(user_profiles_df['user'])
+    new_cluster_df = pd.DataFrame({'user': user_profiles_df['user'].values,
+                                   'cluster': clusters})
+    if 'cluster_popularity' in training_artifacts:
+        # Move the enrollments of the users from their old cluster to the new one
+        user_ratings_df = load_user_ratings(user_profiles_df['user'].tolist())[['user', 'item']]
+        removed_df = pd.merge(user_ratings_df, cluster_df[updated], on='user').assign(enrollments=-1)
+        added_df = pd.merge(user_ratings_df, new_cluster_df, on='user').assign(enrollments=1)
+        training_artifacts['cluster_popularity'] = update_cluster_popularity(training_artifacts['cluster_popularity'],
+                                                                             pd.concat([removed_df, added_df]))
+    training_artifacts['cluster_df'] = pd.concat([cluster_df[~updated], new_cluster_df], ignore_index=True)
+    training_artifacts['pipe'] = pipe
+
+    return training_artifacts
+
 def predict_user_clusters(user_profiles_df,
                           training_artifacts):
     """Predict the cluster of the user profiles passed.
@@ -690,81 +2229,279 @@ def predict_user_clusters(user_profiles_df,
 
     return clusters
 
-def compute_user_cluster_recommendations(cluster, 
-                                         ratings_df,
-                                         training_artifacts):
-    """For a given cluster, computed the most common courses.
+def build_cluster_popularity(ratings_df, cluster_df):
+    """Count the enrollments of each course within each user cluster
+    and rank the courses of each cluster, once at training time.
+    The table is stored as a ragged array (values + offsets, as in CSR):
+    the ranked courses of cluster clusters[i] are items[offsets[i]:offsets[i+1]].
+
+    Inputs:
+        ratings_df: pd.DataFrame
+            User-course ratings: user, item, rating.
+        cluster_df: pd.DataFrame
+            User cluster labels: user, cluster.
+    Outputs:
+        cluster_popularity: dict
+            "clusters": numpy.array (n_clusters,), cluster labels,
+            "offsets": numpy.array (n_clusters+1,),
+            "items": numpy.array (n_entries,), course ids,
+            "enrollments": numpy.array (n_entries,), enrollment counts;
+            sorted by descending enrollments, then by course id.
+    """
+    # Join ratings (user-course) with user cluster labels
+    ratings_labelled_df = pd.merge(ratings_df[['user', 'item']], cluster_df, on='user')
+    # Count enrollments for each (cluster, course)
+    counts_df = ratings_labelled_df.groupby(['cluster', 'item']).size().reset_index(name='enrollments')
+
+    return pack_cluster_popularity(counts_df)
+
+def pack_cluster_popularity(counts_df):
+    """Rank a (cluster, item, enrollments) table into the ragged
+    cluster popularity arrays, see build_cluster_popularity()."""
+    counts_df = counts_df[counts_df['enrollments'] > 0]
+    counts_df = counts_df.sort_values(['cluster', 'enrollments', 'item'],
+                                      ascending=[True, False, True],
+                                      kind='mergesort')
+    cluster_values = counts_df['cluster'].to_numpy()
+    clusters, starts = np.unique(cluster_values, return_index=True)
+    offsets = np.append(starts, len(cluster_values)).astype(np.int64)
+    cluster_popularity = {
+        "clusters": clusters,
+        "offsets": offsets,
+        "items": counts_df['item'].to_numpy(dtype=object),
+        "enrollments": counts_df['enrollments'].to_numpy(dtype=np.int64),
+    }
+
+    return cluster_popularity
+
+def update_cluster_popularity(cluster_popularity, deltas_df):
+    """Apply enrollment count changes to a cluster popularity table,
+    e.g., the new ratings of a user whose cluster is known;
+    the table is compact (clusters x courses), so it is simply re-ranked.
+
+    Inputs:
+        cluster_popularity: dict
+            See build_cluster_popularity(); not modified.
+        deltas_df: pd.DataFrame
+            Count changes: cluster, item, enrollments (+1/-1 per rating).
+    Outputs:
+        cluster_popularity: dict
+            Updated table.
+    """
+    lengths = np.diff(cluster_popularity["offsets"])
+    counts_df = pd.DataFrame({'cluster': np.repeat(cluster_popularity["clusters"], lengths),
+                              'item': cluster_popularity["items"],
+                              'enrollments': cluster_popularity["enrollments"]})
+    counts_df = pd.concat([counts_df, deltas_df[['cluster', 'item', 'enrollments']]], ignore_index=True)
+    counts_df = counts_df.groupby(['cluster', 'item'])['enrollments'].sum().reset_index()
+
+    return pack_cluster_popularity(counts_df)
+
+def add_cluster_ratings(training_artifacts, user_id, course_ids):
+    """Add the new ratings of a user whose cluster is known
+    to the cluster popularity table, instead of retraining.
+
+    Inputs:
+        training_artifacts: dict
+            Clustering artifacts; not modified.
+        user_id: int
+            User id, in training_artifacts['cluster_df'].
+        course_ids: list
+            Newly rated course ids.
+    Outputs:
+        training_artifacts: dict
+            Updated copy of the artifacts.
+    """
+    cluster_df = training_artifacts['cluster_df']
+    user_clusters = cluster_df.loc[cluster_df['user'] == user_id, 'cluster']
+    if user_clusters.empty:
+        raise KeyError(f"User {user_id} has no cluster; use update_user_clusters() first.")
+    deltas_df = pd.DataFrame({'cluster': user_clusters.iloc[0],
+                              'item': list(course_ids),
+                              'enrollments': 1})
+    training_artifacts = dict(training_artifacts)
+    training_artifacts['cluster_popularity'] = update_cluster_popularity(training_artifacts['cluster_popularity'],
+                                                                         deltas_df)
+
+    return training_artifacts
+
+def lookup_cluster_popularity(cluster_popularity, cluster, top_k=None, threshold=None):
+    """Get the most popular courses of a cluster: a slice of the ranked table.
+
+    Inputs:
+        cluster_popularity: dict
+            See build_cluster_popularity().
+        cluster: int
+            Cluster id.
+        top_k: int
+            Number of courses returned; None returns all.
+        threshold: float
+            Minimum number of enrollments; None keeps all.
+    Outputs:
+        res: dict
+            Key: course id, str; value: score (=num enrollments).
+    """
+    position = np.searchsorted(cluster_popularity["clusters"], cluster)
+    if position == len(cluster_popularity["clusters"]) or cluster_popularity["clusters"][position] != cluster:
+        return {}
+    start, end = cluster_popularity["offsets"][position:position+2]
+    enrollments = cluster_popularity["enrollments"][start:end]
+    if threshold is not None:
+        # Descending order: the courses above the threshold are a prefix
+        end = start + int(np.count_nonzero(enrollments >= threshold))
+    if top_k is not None and top_k > 0:
+        end = min(end, start + top_k)
+    courses = cluster_popularity["items"][start:end].tolist()
+    scores = cluster_popularity["enrollments"][start:end].tolist()
+
+    return dict(zip(courses, scores))
+
+def compute_user_cluster_recommendations(cluster,
+                                         training_artifacts,
+                                         top_k=None,
+                                         threshold=None):
+    """For a given cluster, get the most common courses
+    from the popularity table precomputed at training time.
 
     Inputs:
         cluster: int
             Cluster id.
-        ratings_df: pandas.DataFrame
-            All user-course ratings.
         training_artifacts: dict
-            List of selected courses, i.e., user enrolled courses.
+            Clustering artifacts, incl. "cluster_popularity".
+        top_k: int
+            Number of courses returned; None returns all.
+        threshold: float
+            Minimum number of enrollments; None keeps all.
     Outputs:
         res: dict
             Key: course id, str; value: score (=num enrollments).
     """
-    # Initialize return dict as empty
-    res = {}
-    # Get cluster labels per user
-    cluster_df = training_artifacts['cluster_df']
-    # Join ratings (user-course) with user cluster labels
-    ratings_labelled_df = pd.merge(ratings_df, cluster_df, left_on='user', right_on='user')
-    # Aggregate/group by cluster and count enrollments for each course 
-    courses_cluster = ratings_labelled_df[['item', 'cluster']]
-    courses_cluster['count'] = [1] * len(courses_cluster)
-    courses_cluster = courses_cluster.groupby(['cluster','item']).agg(enrollments = ('count','sum')).reset_index()
-    # Take the rows with the required cluster values
-    # and sort them according to the number of enrollments
-    recommended_courses = (courses_cluster
-                               .loc[courses_cluster.cluster==cluster,
-                                    ["item", "enrollments"]]
-                               .sort_values(by="enrollments",
-                                            ascending=False)
-                          )
-    # Extract courses & enrollments (=scores) and pack them in a dictionary
-    courses = list(recommended_courses.item)
-    scores = list(recommended_courses.enrollments)
-    res = {courses[i]:scores[i] for i in range(len(courses))}
+    return lookup_cluster_popularity(training_artifacts['cluster_popularity'],
+                                     cluster,
+                                     top_k,
+                                     threshold)
 
-    return res
+def keep_top_neighbors(sim_matrix, num_neighbors):
+    """Keep only the num_neighbors largest values of each row
+    of a sparse similarity matrix.
 
-def compute_course_user_similarities(rating_sparse_df):
+    Inputs:
+        sim_matrix: scipy.sparse.csr_matrix (n_items, n_items)
+            Item similarity matrix.
+        num_neighbors: int
+            Number of neighbors kept per item.
+    Outputs:
+        sim_matrix: scipy.sparse.csr_matrix (n_items, n_items)
+            Pruned item similarity matrix.
+    """
+    sim_matrix = sim_matrix.tocsr()
+    row_lengths = np.diff(sim_matrix.indptr)
+    keep = np.ones(sim_matrix.nnz, dtype=bool)
+    for row in np.flatnonzero(row_lengths > num_neighbors):
+        start, end = sim_matrix.indptr[row], sim_matrix.indptr[row+1]
+        row_data = sim_matrix.data[start:end]
+        drop = np.argpartition(-row_data, num_neighbors-1)[num_neighbors:]
+        keep[start + drop] = False
+    sim_matrix.data[~keep] = 0
+    sim_matrix.eliminate_zeros()
+
+    return sim_matrix
+
+def compute_course_user_similarities(rating_matrix,
+                                     item_ids,
+                                     num_neighbors=None):
     """Build course descriptor vectors taking the ratings
     provided by each user. Then, compute the cosine similarity between the
-    course vectors.
+    course vectors: columns are L2-normalized and the similarity
+    matrix is obtained with one sparse matrix product.
 
     Args:
-        rating_sparse_df: pd.DataFrame
-            Sparse dataframe of user-course ratings.
+        rating_matrix: scipy.sparse matrix (n_users, n_items)
+            Sparse matrix of user-course ratings.
+        item_ids: list
+            Course id of each column in rating_matrix.
+        num_neighbors: int
+            If passed, only the num_neighbors most similar
+            courses of each course are kept.
 
     Returns:
-        item_sim_df: pd.DataFrame
-            Table wth item similarity values, matrix.
-    """
-    # Extract item list
-    item_list = rating_sparse_df.columns[1:]
-    item_list_df = pd.DataFrame(data=item_list, columns = ['item'])
-    # Empts similarity matrix
-    item_sim = np.zeros((len(item_list), len(item_list)))
-    # Compare items pairwise
-    for i, this_item in enumerate(item_list):
-        this_item_ratings = rating_sparse_df[this_item].values
-        for j, other_item in enumerate(item_list):
-            other_item_ratings = rating_sparse_df[other_item].values
-            similarity = 1 - cosine(this_item_ratings, other_item_ratings)
-            # FIXME: matrix is symmetric, only half needs to be computed!
-            item_sim[i,j] = similarity
-    # Assemble similarity dataframe
-    item_sim_df = pd.DataFrame(data=item_sim, columns=item_list)
-    item_sim_df = pd.concat([item_list_df, item_sim_df], axis=1)
-    # index, item, AI011EN, BC...
-    # course_list = item_sim_df.columns[1:]
-    # course_list = item_sim_df.item.values
-    
-    return item_sim_df
+        course_sim: dict
+            Compact item similarity artifact:
+            "item_ids": numpy.array with the course id of each row/column,
+            "item_id2idx_dict": dict course id -> row/column index,
+            "sim_matrix": scipy.sparse.csr_matrix (n_items, n_items), float32.
+    """
+    rating_matrix = sparse.csc_matrix(rating_matrix, dtype=np.float64)
+    # L2-normalize item columns; empty columns stay zero
+    norms = np.sqrt(np.asarray(rating_matrix.multiply(rating_matrix).sum(axis=0))).ravel()
+    inv_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    normalized = rating_matrix @ sparse.diags(inv_norms)
+    # Cosine similarity between all item pairs: (items x users) @ (users x items)
+    sim_matrix = (normalized.T @ normalized).tocsr().astype(np.float32)
+    if num_neighbors is not None and num_neighbors > 0:
+        sim_matrix = keep_top_neighbors(sim_matrix, num_neighbors)
+    item_ids = np.asarray(item_ids)
+    course_sim = {
+        "item_ids": item_ids,
+        "item_id2idx_dict": {item: i for i, item in enumerate(item_ids.tolist())},
+        "sim_matrix": sim_matrix,
+    }
+
+    return course_sim
+
+def compute_knn_courses_batch(enrolled_course_ids_list,
+                              idx_id_dict,
+                              training_artifacts,
+                              top_k=None,
+                              threshold=None):
+    """Batched version of compute_knn_courses: the item-to-course
+    mapping is built once and each user gathers the rows
+    of their enrolled courses in the sparse similarity matrix.
+
+    Inputs:
+        enrolled_course_ids_list: list
+            List of lists of enrolled course ids, one per user.
+        idx_id_dict: dict
+            Key: course index, int; value: course id, str.
+        training_artifacts: dict
+            KNN training artifacts, incl. "course_sim_df".
+        top_k: int
+            Number of courses per user; None returns all.
+        threshold: float
+            Minimum similarity; None keeps all.
+    Outputs:
+        res_list: list
+            One dict per user; key: course id, str; value: similarity.
+    """
+    # Get course similarity matrix
+    course_sim = training_artifacts["course_sim_df"]
+    sim_matrix = course_sim["sim_matrix"]
+    item_id2idx_dict = course_sim["item_id2idx_dict"]
+    # Map item columns to course indices; courses without ratings score 0
+    id_idx_dict = {v: k for k, v in idx_id_dict.items()}
+    num_courses = max(idx_id_dict.keys()) + 1
+    item_positions = [(id_idx_dict[item], i) for i, item in enumerate(course_sim["item_ids"].tolist())
+                      if item in id_idx_dict]
+    course_indices, item_indices = (np.array(item_positions, dtype=np.int64).T
+                                    if len(item_positions) > 0
+                                    else (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)))
+    scores = np.full((len(enrolled_course_ids_list), num_courses), -np.inf)
+    for i, enrolled_course_ids in enumerate(enrolled_course_ids_list):
+        enrolled_rows = [item_id2idx_dict[course] for course in enrolled_course_ids
+                         if course in item_id2idx_dict]
+        if len(enrolled_rows) == 0:
+            continue
+        # Largest similarity of each item to any of the enrolled courses;
+        # similarities are non-negative, so missing entries count as 0
+        item_scores = sim_matrix[enrolled_rows].max(axis=0).toarray().ravel()
+        scores[i] = 0.0
+        scores[i, course_indices] = item_scores[item_indices]
+        # Mask out the enrolled courses
+        enrolled_indices = [id_idx_dict[course] for course in enrolled_course_ids
+                            if course in id_idx_dict]
+        scores[i, enrolled_indices] = -np.inf
+
+    return score_rows_to_dicts(scores, idx_id_dict, top_k, threshold)
 
 def compute_knn_courses(enrolled_course_ids,
                         idx_id_dict,
@@ -782,110 +2519,353 @@ def compute_knn_courses(enrolled_course_ids,
     Outputs:
         res: dict
     """
-    # Initialize return dict as empty
-    res = {}
-    # Get course similarity matrix
-    course_sim_df = training_artifacts["course_sim_df"]
-    # Sets of attended/unattended courses
-    all_courses = set(idx_id_dict.values())
-    unselected_course_ids = all_courses.difference(enrolled_course_ids)
-    # Get course score
-    # FIXME: this could be one matrix multiplication
-    for selected_course in enrolled_course_ids:
-        # Get all similarities
-        course_sim_row = course_sim_df.loc[course_sim_df.item==selected_course]
-        for unselected_course in unselected_course_ids:
-            score = 0
-            if unselected_course in course_sim_row.columns:
-                score = course_sim_row[unselected_course].values[0]
-            if unselected_course not in res:
-                res[unselected_course] = score
-            else:
-                if score >= res[unselected_course]:
-                    res[unselected_course] = score    
-        res = {k: v for k, v in sorted(res.items(), key=lambda item: item[1], reverse=True)}
+    res = compute_knn_courses_batch([enrolled_course_ids],
+                                    idx_id_dict,
+                                    training_artifacts)[0]
 
     return res
 
+def build_user_rating_vectors(user_ratings_df, user_ids, item_ids):
+    """Build the sparse rating vectors of some users only,
+    in a fixed item/column order (e.g., the one stored with a trained model).
+
+    Inputs:
+        user_ratings_df: pd.DataFrame
+            Ratings (user, item, rating) of the requested users;
+            rows of other users are ignored.
+        user_ids: list
+            Requested user ids; one row per user, in this order.
+        item_ids: list
+            Course id of each column.
+    Outputs:
+        user_vectors: scipy.sparse.csr_matrix (n_users, n_items)
+            User ratings; ratings of unknown items are ignored.
+    """
+    user_positions = pd.Index(user_ids).get_indexer(user_ratings_df['user'])
+    item_positions = pd.Index(item_ids).get_indexer(user_ratings_df['item'])
+    ratings = user_ratings_df['rating'].to_numpy(dtype=np.float64)
+    found = (user_positions >= 0) & (item_positions >= 0)
+    user_vectors = sparse.csr_matrix((ratings[found],
+                                      (user_positions[found], item_positions[found])),
+                                     shape=(len(user_ids), len(item_ids)))
+
+    return user_vectors
+
+def compute_nmf_recommendations_batch(user_vectors,
+                                      training_artifacts,
+                                      top_k=None,
+                                      threshold=None):
+    """Fold a batch of user rating vectors into the NMF latent space,
+    one user at a time, and predict the ratings of the unseen courses.
+
+    Inputs:
+        user_vectors: scipy.sparse.csr_matrix (n_users, n_items)
+            User ratings in the item order of training_artifacts["item_ids"],
+            see build_user_rating_vectors().
+        training_artifacts: dict
+            NMF training artifacts: "components", "item_ids".
+        top_k: int
+            Number of courses per user; None returns all unseen courses.
+        threshold: float
+            Minimum predicted rating; None keeps all.
+    Outputs:
+        res_list: list
+            One dict per user; key: course id, str; value: predicted rating.
+    """
+    H = training_artifacts["components"] # (n_components, n_items)
+    item_ids = training_artifacts["item_ids"]
+    nnls = lazy_import("scipy.optimize").nnls
+    # H (components) are constant, W (transformed X) changes every time.
+    # The model is fitted with the Frobenius loss and no regularization (see train()),
+    # so the W row of a user is the non-negative least squares fit of its ratings
+    # on H, as in nmf.transform(), but solved exactly and one user at a time:
+    # the scores of a user do not depend on the other users of the batch
+    user_vectors = sparse.csr_matrix(user_vectors)
+    components = np.asarray(H.T, dtype=np.float64) # (n_items, n_components)
+    scores = np.empty(user_vectors.shape, dtype=np.float64)
+    x = np.zeros(user_vectors.shape[1], dtype=np.float64)
+    for row in range(user_vectors.shape[0]):
+        start, end = user_vectors.indptr[row], user_vectors.indptr[row + 1]
+        x[:] = 0.0
+        x[user_vectors.indices[start:end]] = user_vectors.data[start:end]
+        w, _ = nnls(components, x) # (n_components,)
+        scores[row] = w @ H
+    # Mask out the rated courses
+    seen = user_vectors.tocoo()
+    scores[seen.row, seen.col] = -np.inf
+
+    return score_rows_to_dicts(scores, dict(enumerate(item_ids)), top_k, threshold)
+
+def build_embedding_feature_index(serving):
+    """Build the id -> embedding row mappings of an exported RecommenderNet,
+    used to gather the embedding features of (user, item) pairs.
+
+    Inputs:
+        serving: dict
+            Serving form of the RecommenderNet, see export_recommender_net().
+    Outputs:
+        feature_index: dict
+            "user_index": pd.Index, user id of each embedding row,
+            "item_index": pd.Index, course id of each embedding row,
+            "user_embeddings": numpy.array (n_users, embedding_size), float32,
+            "item_embeddings": numpy.array (n_items, embedding_size), float32.
+    """
+    feature_index = {
+        "user_index": pd.Index(serving["user_ids"]),
+        "item_index": pd.Index(serving["item_ids"]),
+        "user_embeddings": np.asarray(serving["user_embeddings"], dtype=np.float32),
+        "item_embeddings": np.asarray(serving["item_embeddings"], dtype=np.float32),
+    }
+
+    return feature_index
+
+def build_embedding_features(user_rows, item_rows, feature_index, chunk_size=EMBEDDING_CHUNK_SIZE):
+    """Sum the user and item embeddings of (user, item) pairs
+    by gathering their rows, in chunks of pairs.
+
+    Inputs:
+        user_rows: numpy.array (n_pairs,)
+            User embedding rows; -1 for unknown users (zero embedding).
+        item_rows: numpy.array (n_pairs,)
+            Item embedding rows; -1 for unknown items (zero embedding).
+        feature_index: dict
+            See build_embedding_feature_index().
+        chunk_size: int
+            Pairs per chunk, to bound the temporary arrays.
+    Outputs:
+        X: numpy.array (n_pairs, embedding_size), float32
+            Features: user embedding + item embedding.
+    """
+    user_embeddings = feature_index["user_embeddings"]
+    item_embeddings = feature_index["item_embeddings"]
+    X = np.empty((len(user_rows), user_embeddings.shape[1]), dtype=np.float32)
+    for start in range(0, len(user_rows), chunk_size):
+        stop = start + chunk_size
+        users = user_rows[start:stop]
+        items = item_rows[start:stop]
+        X_chunk = X[start:stop]
+        # Row -1 gathers the last row: it is zeroed afterwards
+        np.take(user_embeddings, users, axis=0, out=X_chunk)
+        X_chunk[users < 0] = 0
+        item_features = np.take(item_embeddings, items, axis=0)
+        item_features[items < 0] = 0
+        X_chunk += item_features
+
+    return X
+
 def preprocess_embeddings(ratings_df,
-                          user_embeddings_df,
-                          item_embeddings_df):
-    """Join the ANN embeddings to the ratings dataframe
-    and generate the features.
+                          feature_index,
+                          chunk_size=EMBEDDING_CHUNK_SIZE):
+    """Generate the ANN embedding features of the ratings:
+    the sum of the user and the course embeddings of each rating.
 
     Inputs:
         ratings_df: pd.DataFrame
-        user_embeddings_df: pd.DataFrame
-        item_embeddings_df: pd.DataFrame
-
-    Outputs:
-        X, y: np.array
-    """
-    # Merge user embedding features
-    user_emb_merged = pd.merge(ratings_df, 
-                                user_embeddings_df, 
-                                how='left', 
-                                left_on='user', 
-                                right_on='user').fillna(0)
-    # Merge course embedding features
-    merged_df = pd.merge(user_emb_merged, 
-                            item_embeddings_df, 
-                            how='left', 
-                            left_on='item', 
-                            right_on='item').fillna(0)
-
-    # Sum embedding features and create new dataset
-    u_feautres = [f"UFeature{i}" for i in range(16)]
-    c_features = [f"CFeature{i}" for i in range(16)]
-
-    user_embeddings = merged_df[u_feautres]
-    course_embeddings = merged_df[c_features]
-    ratings = merged_df['rating']
-
-    # Aggregate the two feature columns using element-wise add
-    embedding_dataset = user_embeddings + course_embeddings.values
-    embedding_dataset.columns = [f"Feature{i}" for i in range(16)]
-    embedding_dataset['rating'] = ratings
-    
-    # Extract features and target        
-    X = embedding_dataset.iloc[:, :-1]
-    y = embedding_dataset.iloc[:, -1]
+            Ratings: user, item, rating.
+        feature_index: dict
+            See build_embedding_feature_index().
+        chunk_size: int
+            Ratings per chunk of the feature gather.
+
+    Outputs:
+        X: np.array (n_ratings, embedding_size), float32
+        y: np.array (n_ratings,)
+    """
+    # Map the ids to embedding rows once; unknown ids get a zero embedding
+    user_rows = feature_index["user_index"].get_indexer(ratings_df['user'])
+    item_rows = feature_index["item_index"].get_indexer(ratings_df['item'].astype(str))
+    X = build_embedding_features(user_rows, item_rows, feature_index, chunk_size)
+    y = ratings_df['rating'].to_numpy()
 
     return X, y
 
-def create_embeddings_frame(user_id, user_embeddings_df, item_embeddings_df):
-    """Given a new series of ratings, create a
-    dataframe which contains the corresponding embeddings
-    for each user-item row.
+def create_embeddings_frame(user_id, enrolled_course_ids, course_ids, feature_index):
+    """Create the embedding features of a user
+    with each course the user has not rated yet.
 
     Inputs:
         user_id: int
-        user_embeddings_df: pd.DataFrame
-        item_embeddings_df: pd.DataFrame
+        enrolled_course_ids: list
+            Courses rated by the user.
+        course_ids: list
+            All course ids.
+        feature_index: dict
+            See build_embedding_feature_index().
 
     Outputs:
-        X: np.array
+        X: np.array (n_unselected_courses, embedding_size), float32
         unselected_course_ids: list
     """
-    # Generate/load data
-    ratings_df = load_ratings()
-    idx_id_dict, _ = get_doc_dicts()
-    user_ratings = ratings_df[ratings_df['user'] == user_id]
-    enrolled_course_ids = user_ratings['item'].to_list() 
-    all_courses = set(idx_id_dict.values())
-    unselected_course_ids = list(all_courses.difference(enrolled_course_ids))            
-    # Create dataframe with courses for which we predict ratings
-    ratings_pred_df = pd.DataFrame(unselected_course_ids, columns=['item'])
-    ratings_pred_df['user'] = [user_id]*len(unselected_course_ids)
-    ratings_pred_df['rating'] = -1
-    # Preprocess ratings dataframe
-    X, _ = preprocess_embeddings(ratings_pred_df,
-                        user_embeddings_df,
-                        item_embeddings_df)
+    enrolled_course_ids = set(enrolled_course_ids)
+    unselected_course_ids = [course_id for course_id in course_ids if course_id not in enrolled_course_ids]
+    user_rows = np.full(len(unselected_course_ids),
+                        feature_index["user_index"].get_indexer([user_id])[0])
+    item_rows = feature_index["item_index"].get_indexer([str(course_id) for course_id in unselected_course_ids])
+    X = build_embedding_features(user_rows, item_rows, feature_index)
 
     return X, unselected_course_ids
 
-def train(model_name, params):
+class ArtifactStore:
+    """Persistent on-disk store of training artifacts.
+
+    Each entry is a pickled training_artifacts dict, keyed by the model name,
+    the params that affect its training and a fingerprint of the input data.
+    Entries survive process restarts; when the total size exceeds the
+    disk budget, the least recently used entries are evicted
+    (the file mtime is refreshed on every hit).
+    """
+
+    def __init__(self, root=ARTIFACTS_ROOT, max_bytes=ARTIFACT_STORE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_key(self, model_name, params, data_fingerprint):
+        """Build the entry key: a hash of model name, training params and data."""
+        model_index = get_model_index(model_name)
+        param_names = TRAINING_PARAMS[model_index] if model_index is not None else ()
+        key_dict = {
+            "version": ARTIFACT_FORMAT_VERSION,
+            "model_name": model_name,
+            "params": {name: params[name] for name in param_names if name in params},
+            "data": data_fingerprint,
+        }
+        key_str = json.dumps(key_dict, sort_keys=True, default=str)
+        return hashlib.sha256(key_str.encode("utf-8")).hexdigest()
+
+    def get_filepath(self, key):
+        return os.path.join(self.root, key + ".pkl")
+
+    def load(self, key):
+        """Get the stored artifacts of a key, or None."""
+        filepath = self.get_filepath(key)
+        try:
+            with open(filepath, "rb") as f:
+                training_artifacts = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        # Mark as recently used
+        try:
+            os.utime(filepath)
+        except OSError:
+            pass
+        self.hits += 1
+        return training_artifacts
+
+    def save(self, key, training_artifacts):
+        """Persist artifacts atomically and evict entries above the budget."""
+        os.makedirs(self.root, exist_ok=True)
+        filepath = self.get_filepath(key)
+        tmp_filepath = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_filepath, "wb") as f:
+            pickle.dump(training_artifacts, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filepath, filepath)
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the store fits the budget."""
+        with self._lock:
+            entries = []
+            for filename in os.listdir(self.root):
+                if not filename.endswith(".pkl"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.root, filename))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, filename))
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, filename in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.root, filename))
+                    total_bytes -= size
+                except OSError:
+                    pass
+
+    def stats(self):
+        """Get the store counters and disk usage."""
+        entries = []
+        if os.path.isdir(self.root):
+            entries = [os.path.getsize(os.path.join(self.root, f))
+                       for f in os.listdir(self.root) if f.endswith(".pkl")]
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "entries": len(entries),
+                "bytes": sum(entries)}
+
+ARTIFACTS = ArtifactStore()
+
+def get_data_fingerprint(model_name):
+    """Fingerprint of the datasets read by the training of a model.
+
+    Inputs:
+        model_name: str
+            Model name as in MODELS.
+    Outputs:
+        fingerprint: dict
+            Key: dataset name; value: content version of the dataset.
+    """
+    model_index = get_model_index(model_name)
+    sources = TRAINING_SOURCES[model_index] if model_index is not None else ()
+    fingerprint = {}
+    for source in sources:
+        fingerprint[source] = get_source_fingerprint(source)
+
+    return fingerprint
+
+def get_source_fingerprint(source):
+    """Content version of a dataset: "ratings", "bows" or "user_profiles"."""
+    if source == "ratings" and RATINGS_STORE == "sqlite":
+        # Source file hash + change counter of the store (inserts, updates, deletes)
+        return get_ratings_store_version()
+    if source == "user_profiles":
+        load_user_profiles(get_df=False)
+    filepath = {"ratings": FILEPATH_RATINGS,
+                "bows": FILEPATH_BOWS,
+                "user_profiles": FILEPATH_USER_PROFILES}[source]
+    filepath = find_binary_filepath(filepath) or filepath
+
+    return get_file_fingerprint(filepath)
+
+def train(model_name, params, use_store=True):
+    """Train the selected model, or get its artifacts from the
+    persistent artifact store if it was already trained with the same
+    params and data (see ArtifactStore).
+
+    Inputs:
+        model_name: str
+            Model name as in MODELS.
+        params: dict
+            Parameters collected in the UI.
+        use_store: bool
+            Whether to use the artifact store. Defaults to True.
+    Outputs:
+        training_artifacts: dict
+            Training artifacts, sometimes the model/inference pipeline is included.
+    """
+    check_model_available(model_name)
+    with STAGE_TIMINGS.request(model_name), STAGE_TIMINGS.stage("train"):
+        if not use_store:
+            with STAGE_TIMINGS.stage("train_model"):
+                return train_model(model_name, params)
+        with STAGE_TIMINGS.stage("data_fingerprint"):
+            key = ARTIFACTS.get_key(model_name, params, get_data_fingerprint(model_name))
+        with STAGE_TIMINGS.stage("artifact_load"):
+            training_artifacts = ARTIFACTS.load(key)
+        if training_artifacts is None:
+            with STAGE_TIMINGS.stage("train_model"):
+                training_artifacts = train_model(model_name, params)
+            with STAGE_TIMINGS.stage("artifact_save"):
+                ARTIFACTS.save(key, training_artifacts)
+
+    return training_artifacts
+
+def train_model(model_name, params):
     """Train the selected model.
     
     Each model has a dedicated case and produces a specific
@@ -909,45 +2889,42 @@ def train(model_name, params):
         # Nothing to train here
         pass
     elif model_name == MODELS[2] or model_name == MODELS[3]: # 2: "Clustering", 3: "Clustering with PCA"
-        # Build user profiles and persist (if not present)
-        user_profiles_df = load_user_profiles(get_df=True)
         pca_variance = params["pca_variance"]
-        # Perform profile clustering and persist in same file
-        res_dict = cluster_users(user_profiles_df=user_profiles_df, 
-                                 pca_variance=pca_variance,
-                                 num_clusters=params["num_clusters"])
+        if params.get("clustering_mode", CLUSTERING_MODE) == "streaming":
+            # Out-of-core: the user profiles are read in chunks
+            res_dict = cluster_users_streaming(pca_variance=pca_variance,
+                                               num_clusters=params["num_clusters"])
+        else:
+            # Build user profiles and persist (if not present)
+            user_profiles_df = load_user_profiles(get_df=True)
+            # Perform profile clustering and persist in same file
+            res_dict = cluster_users(user_profiles_df=user_profiles_df, 
+                                     pca_variance=pca_variance,
+                                     num_clusters=params["num_clusters"])
         # Extend training_artifacts with the new created elements from res_dict
         training_artifacts.update(res_dict)
+        # Ranked courses of each cluster, looked up at prediction time
+        training_artifacts["cluster_popularity"] = build_cluster_popularity(load_ratings(),
+                                                                            res_dict["cluster_df"])
     elif model_name == MODELS[4]: # 4: "KNN"
         # Compute sparse ratings matrix
-        ratings_df = load_ratings()
-        ratings_sparse_df = (ratings_df.pivot(index='user',
-                                             columns='item',
-                                             values='rating')
-                                       .fillna(0)
-                                       .reset_index()
-                                       .rename_axis(index=None,
-                                                    columns=None))
+        ratings_matrix = build_ratings_matrix(load_ratings())
         # Compute course similarity matrix based on users
-        course_sim_df = compute_course_user_similarities(ratings_sparse_df)
+        course_sim_df = compute_course_user_similarities(ratings_matrix["matrix"],
+                                                         ratings_matrix["item_ids"],
+                                                         params.get("num_neighbors"))
         # Pack results to training_artifact
         training_artifacts["course_sim_df"] = course_sim_df
     elif model_name == MODELS[5]: # 5: "NMF"
         # Compute sparse ratings matrix
-        ratings_df = load_ratings()
-        ratings_sparse_df = (ratings_df.pivot(index='user',
-                                             columns='item',
-                                             values='rating')
-                                       .fillna(0)
-                                       .reset_index()
-                                       .rename_axis(index=None,
-                                                    columns=None))
+        ratings_matrix = build_ratings_matrix(load_ratings())
         # Fit NMF model
         num_components = params["num_components"]
+        NMF = lazy_import("sklearn.decomposition").NMF
         nmf = NMF(n_components=num_components,
                   init='random',
                   random_state=RANDOM_SEED)
-        nmf = nmf.fit(ratings_sparse_df.iloc[:,1:]) # (n_samples, n_components)
+        nmf = nmf.fit(ratings_matrix["matrix"]) # (n_samples, n_components)
         H = nmf.components_ # (n_components, n_features)
         # W = nmf.transform(X)
         # X_hat = W@H
@@ -955,40 +2932,35 @@ def train(model_name, params):
         # Pack results to training_artifact
         training_artifacts["components"] = H
         training_artifacts["nmf"] = nmf
-    elif model_name == MODELS[6]\
-        or model_name == MODELS[7]\
-        or model_name == MODELS[8]: # 6: "Neural Network"
-        # Load ratings dataset
-        ratings_df = load_ratings()
+        training_artifacts["item_ids"] = ratings_matrix["item_ids"]
+    elif model_name == ALL_MODELS[6]\
+        or model_name == ALL_MODELS[7]\
+        or model_name == ALL_MODELS[8]: # 6: "Neural Network"
         # Extract user parameters
         num_components = params['num_components']
         num_epochs = params['num_epochs']
-        # Train ANN
-        res_dict, model = train_ann(ratings_df, num_components, num_epochs)
+        # Train ANN, streaming the ratings from disk
+        res_dict, model = train_ann(num_components, num_epochs)
         # Extend training_artifacts with the new created elements from res_dict
         training_artifacts.update(res_dict)
-        # FIXME:
-        # Tensorflow models cannot be passed in a dict,
-        # because they're not hashable.
-        # A quick and dirty solution is to compute the prediction here...
-        #training_artifacts["model"] = model
-        new_id = params["new_id"]
-        idx_id_dict, _ = get_doc_dicts()
-        all_courses = set(idx_id_dict.values())
-        user_ratings = ratings_df[ratings_df['user'] == new_id]
-        enrolled_course_ids = user_ratings['item'].to_list()
-        unselected_course_ids = all_courses.difference(enrolled_course_ids)        
-        result = predict_ann_values(model,
-                                    unselected_course_ids,
-                                    new_id,
-                                    training_artifacts)
-        training_artifacts["result"] = result
+        # Approximate MIPS index over the item embeddings and biases, persisted with the artifacts
+        serving = training_artifacts["serving"]
+        ann_index = build_item_ann_index(serving["item_embeddings"],
+                                         serving["item_ids"],
+                                         item_biases=serving["item_biases"])
+        training_artifacts["item_ann_index"] = ann_index
+        user_embeddings = serving["user_embeddings"]
+        sample_size = min(len(user_embeddings), 1000)
+        sample = np.random.default_rng(RANDOM_SEED).choice(len(user_embeddings), sample_size, replace=False)
+        training_artifacts["item_ann_recall"] = compute_ann_recall_report(ann_index,
+                                                                          user_embeddings[sample])
+        if model_name == ALL_MODELS[6]: # 6: "Neural Network" needs no embedding features
+            return training_artifacts
         # Prepare inputs for sub-options: regression & classification with embeddings
-        user_embeddings_df = training_artifacts["user_embeddings_df"]
-        item_embeddings_df = training_artifacts["item_embeddings_df"]        
-        X, y = preprocess_embeddings(ratings_df,
-                                    user_embeddings_df,
-                                    item_embeddings_df)
+        feature_index = build_embedding_feature_index(serving)
+        training_artifacts["embedding_feature_index"] = feature_index
+        X, y = preprocess_embeddings(load_ratings(), feature_index)
+        train_test_split = lazy_import("sklearn.model_selection").train_test_split
         X_train, X_test, y_train, y_test = train_test_split(
             X, # predictive variables
             y, # target
@@ -996,20 +2968,25 @@ def train(model_name, params):
             random_state=RANDOM_SEED # we are setting the seed here, ALWAYS DO IT!
         )
         # Run sub-options
-        if model_name == MODELS[7]: # 7: "Regression with Embedding Features"
+        if model_name == ALL_MODELS[7]: # 7: "Regression with Embedding Features"
             # Define and train model
+            LinearRegression = lazy_import("sklearn.linear_model").LinearRegression
+            mean_squared_error = lazy_import("sklearn.metrics").mean_squared_error
             lr = LinearRegression()
             lr.fit(X_train, y_train)
             pred = lr.predict(X_test)
-            rmse = mean_squared_error(y_test, pred, squared=False)
+            rmse = np.sqrt(mean_squared_error(y_test, pred))
             # Pack results
             training_artifacts["lr_model"] = lr
             training_artifacts["rmse_lr"] = rmse
-        elif model_name == MODELS[8]: # 8: "Classification with Embedding Features"
+        elif model_name == ALL_MODELS[8]: # 8: "Classification with Embedding Features"
             # Encode labels
+            LabelEncoder = lazy_import("sklearn.preprocessing").LabelEncoder
+            RandomForestClassifier = lazy_import("sklearn.ensemble").RandomForestClassifier
+            precision_recall_fscore_support = lazy_import("sklearn.metrics").precision_recall_fscore_support
             label_encoder = LabelEncoder()
-            y_train_ = label_encoder.fit_transform(y_train.values.ravel())
-            y_test_ = label_encoder.transform(y_test.values.ravel())
+            y_train_ = label_encoder.fit_transform(y_train)
+            y_test_ = label_encoder.transform(y_test)
             # Define and train model
             rf = RandomForestClassifier(random_state=RANDOM_SEED,
                                         max_depth=20,
@@ -1025,213 +3002,322 @@ def train(model_name, params):
     
     return training_artifacts
 
-def predict(model_name, user_ids, params, training_artifacts):
-    """Predict with the trained model.
-    
-    Each model has its dedicated part.
-    
+@timed_stage("enrolled_courses")
+def get_enrolled_course_ids(user_ids):
+    """Get the rated/enrolled courses of a batch of users.
+
+    Inputs:
+        user_ids: list
+            User ids.
+    Outputs:
+        enrolled_course_ids_list: list
+            List of lists of course ids, one per user, in the order of user_ids.
+    """
+    user_ratings = load_user_ratings(user_ids)
+    grouped = user_ratings.groupby('user', sort=False)['item'].agg(list).to_dict()
+    enrolled_course_ids_list = [grouped.get(user_id, []) for user_id in user_ids]
+
+    return enrolled_course_ids_list
+
+def get_score_threshold(model_name, params):
+    """Get the minimum score of the recommendations of a model."""
+    score_threshold = -1.0
+    if model_name == MODELS[0]: # 0: "Course Similarity"
+        sim_threshold = 0.2
+        if "sim_threshold" in params:
+            sim_threshold = params["sim_threshold"] / 100.0
+        score_threshold = sim_threshold
+    elif model_name == MODELS[1]: # 1: "User Profile"
+        profile_threshold = 0.0
+        if "profile_threshold" in params:
+            profile_threshold = params["profile_threshold"]
+        score_threshold = profile_threshold
+
+    return score_threshold
+
+def score_users(model_name, user_ids, params, training_artifacts):
+    """Compute the recommendations of a batch of users.
+    Models with a batched implementation score all users at once
+    with matrix operations; the rest loop over the users.
+
     Inputs:
         model_name: str
             Model name as in MODELS.
-        user_ids: int
-            New user id.
+        user_ids: list
+            User ids.
         params: dict
             Parameters collected from the UI.
         training_artifacts: dict
-            Training objects/artifacts, sometimes the model/inference pipeline is included.
+            Training objects/artifacts.
     Outputs:
-        res_df: dict
-            Results packed in a dictionary which contains pairs
-            course:score
-        score_description: str
-            String which describes the score.
+        res_list: list
+            One dict per user; key: course id, str; value: score.
+            The scores are already filtered with the score threshold
+            and restricted to params["top_courses"] for the models
+            with a vectorized implementation.
     """
-    users = []
-    courses = []
-    scores = []
-    res_dict = dict()
-    score_threshold = -1.0
-    score_description = ""
-    try:
-        assert "model_name" in training_artifacts
-    except AssertionError as err:
-        print("You need to train the model before predicting!")
-        raise(err)
-    for user_id in user_ids: # usually, we'll have a unique user id
-        if model_name == MODELS[0]: # 0: "Course Similarity"
-            # Extract params
-            sim_threshold = 0.2
-            if "sim_threshold" in params:
-                sim_threshold = params["sim_threshold"] / 100.0
-            score_threshold = sim_threshold
-            # Generated/load data
-            idx_id_dict, id_idx_dict = get_doc_dicts()
-            sim_matrix = load_course_sims().to_numpy()
-            ratings_df = load_ratings()       
-            # Predict
-            user_ratings = ratings_df[ratings_df['user'] == user_id]
-            enrolled_course_ids = user_ratings['item'].to_list()
-            res = course_similarity_recommendations(idx_id_dict,
-                                                    id_idx_dict,
-                                                    enrolled_course_ids,
-                                                    sim_matrix)
-            score_description = "Note: the score is the cosine similarity\
-                                 between the selected and the recommended\
-                                 courses."
-        elif model_name == MODELS[1]: # 1: "User Profile"
-            # Extract params
-            profile_threshold = 0.0
-            if "profile_threshold" in params:
-                profile_threshold = params["profile_threshold"]
-            score_threshold = profile_threshold
-            # Generate/load data
-            course_genres_df = load_course_genres()
-            idx_id_dict, _ = get_doc_dicts()
-            ratings_df = load_ratings()
-            # Create user profile vector: (1,14)
-            user_ratings = ratings_df[ratings_df['user'] == user_id]
-            enrolled_course_ids = user_ratings['item'].to_list()
-            user_profile = create_user_profile(enrolled_course_ids,
-                                               course_genres_df)
-            # Predict
-            user_ratings = ratings_df[ratings_df['user'] == user_id]
-            enrolled_course_ids = user_ratings['item'].to_list()
-            res = compute_user_profile_recommendations(user_profile,
-                                                       idx_id_dict, 
-                                                       enrolled_course_ids,
-                                                       course_genres_df)
-            score_description = "Note: the score is the alignment (dot product)\
-                                 between the user profile built with the selected\
-                                 courses and the recommended ones."
-        elif model_name == MODELS[2] or model_name == MODELS[3] : # 2: "Clustering", 3: "Clustering with PCA"
-            # Generate/load data
-            course_genres_df = load_course_genres()
-            idx_id_dict, _ = get_doc_dicts()
-            ratings_df = load_ratings()
-            # Create user profile vector: (1,14)
-            user_ratings = ratings_df[ratings_df['user'] == user_id]
-            enrolled_course_ids = user_ratings['item'].to_list()
-            user_profile = create_user_profile(enrolled_course_ids,
-                                               course_genres_df)
-            user_profile_df = pd.DataFrame(data=user_profile,
-                                           columns=course_genres_df.columns[2:])
-            # Get user cluster
-            cluster = predict_user_clusters(user_profile_df,
-                                            training_artifacts)[0]
-            # Compute recommendations based on user cluster
-            res = compute_user_cluster_recommendations(cluster, 
-                                         ratings_df,
+    res_list = []
+    score_threshold = get_score_threshold(model_name, params)
+    top_courses = params.get("top_courses")
+    if model_name == MODELS[0]: # 0: "Course Similarity"
+        # Generated/load data
+        idx_id_dict, id_idx_dict = get_doc_dicts()
+        sim_matrix = load_course_sim_matrix()
+        enrolled_course_ids_list = get_enrolled_course_ids(user_ids)
+        # Predict
+        res_list = course_similarity_recommendations_batch(idx_id_dict,
+                                                           id_idx_dict,
+                                                           enrolled_course_ids_list,
+                                                           sim_matrix,
+                                                           aggregation=params.get("sim_aggregation", "max"),
+                                                           top_k=top_courses,
+                                                           threshold=score_threshold)
+    elif model_name == MODELS[1]: # 1: "User Profile"
+        # Generate/load data
+        course_genres_df = load_course_genres()
+        idx_id_dict, id_idx_dict = get_doc_dicts()
+        genre_matrix = build_course_genre_matrix(course_genres_df, idx_id_dict)
+        enrolled_course_ids_list = get_enrolled_course_ids(user_ids)
+        # Create user profile vectors: (n_users,14)
+        index_lists = [[id_idx_dict[course] for course in enrolled_course_ids
+                        if course in id_idx_dict]
+                       for enrolled_course_ids in enrolled_course_ids_list]
+        enrolled_indices, offsets = build_ragged_indices(index_lists)
+        user_profiles = create_user_profiles_batch(enrolled_indices, offsets, genre_matrix)
+        # Predict
+        res_list = compute_user_profile_recommendations_batch(user_profiles,
+                                                              idx_id_dict,
+                                                              id_idx_dict,
+                                                              enrolled_course_ids_list,
+                                                              genre_matrix,
+                                                              top_k=top_courses,
+                                                              threshold=score_threshold)
+    elif model_name == MODELS[2] or model_name == MODELS[3] : # 2: "Clustering", 3: "Clustering with PCA"
+        # Generate/load data
+        course_genres_df = load_course_genres()
+        idx_id_dict, id_idx_dict = get_doc_dicts()
+        genre_matrix = build_course_genre_matrix(course_genres_df, idx_id_dict)
+        enrolled_course_ids_list = get_enrolled_course_ids(user_ids)
+        # Create user profile vectors: (n_users,14)
+        index_lists = [[id_idx_dict[course] for course in enrolled_course_ids
+                        if course in id_idx_dict]
+                       for enrolled_course_ids in enrolled_course_ids_list]
+        enrolled_indices, offsets = build_ragged_indices(index_lists)
+        user_profiles = create_user_profiles_batch(enrolled_indices, offsets, genre_matrix)
+        user_profile_df = pd.DataFrame(data=user_profiles,
+                                       columns=course_genres_df.columns[2:])
+        # Get user clusters
+        clusters = predict_user_clusters(user_profile_df,
                                          training_artifacts)
-            score_description = "Note: the score is the number of enrollments\
-                of each recommended course, which belongs to the user\
-                cluster of the interacting user."
-        elif model_name == MODELS[4]: # 4: "KNN"
-            # Generate/load data
-            #course_genres_df = load_course_genres()
-            idx_id_dict, _ = get_doc_dicts()
-            ratings_df = load_ratings()
-            # Get selected courses by user
-            user_ratings = ratings_df[ratings_df['user'] == user_id]
-            enrolled_course_ids = user_ratings['item'].to_list()
-            # Compute k nearest neighbors to those users with the similarity matrix
-            res = compute_knn_courses(enrolled_course_ids,
-                                      idx_id_dict,
-                                      training_artifacts)
-            score_description = "Note: the score is the cosine similarity\
-                of the suggested course with respect to one\
-                of the selected courses."
-        elif model_name == MODELS[5]: # 5: "NMF"
-            # Generate/load data
-            #course_genres_df = load_course_genres()
-            #idx_id_dict, _ = get_doc_dicts()
-            ratings_df = load_ratings()
-            # Create sparse version
-            #FIXME: We should not make sparse the complete frame, but only the user rows!
-            ratings_sparse_df = (ratings_df.pivot(index='user',
-                                        columns='item',
-                                        values='rating')
-                                .fillna(0)
-                                .reset_index()
-                                .rename_axis(index=None,
-                                            columns=None))
-            # Get user rows
-            user_ratings_sparse = ratings_sparse_df[ratings_sparse_df['user'] == user_id]
-            #print(user_ratings_sparse)
-            # Transform user ratings to latent feature space
-            # H (components) are constant, W (transformed X) changes every time
-            H = training_artifacts["components"]
-            nmf = training_artifacts["nmf"]            
-            W = nmf.transform(user_ratings_sparse.iloc[:, 1:])            
-            X_hat = W@H
-            items = list(user_ratings_sparse.columns[1:])
-            ratings = list(X_hat.ravel())
-            res = {items[i]:ratings[i] for i in range(len(items))}                
-            # Pack results to training_artifact
-            score_description = "Note: the score is the rating predicted\
-                by the Non-Negative Matrix Factorization (NMF) model."
-        elif model_name == MODELS[6]: # 6: "Neural Network"
-            res = training_artifacts["result"]
-            score_description = "Note: the score is the rating predicted\
-                by the neural network model."
-        elif model_name == MODELS[7]: # 7: "Regression with Embedding Features"
-            # Extract model
-            lr = training_artifacts["lr_model"]
-            # Generate/load data
-            user_embeddings_df = training_artifacts["user_embeddings_df"]
-            item_embeddings_df = training_artifacts["item_embeddings_df"]        
+        # Compute recommendations once per cluster
+        cluster_res = {cluster: compute_user_cluster_recommendations(cluster,
+                                                                     training_artifacts,
+                                                                     top_k=top_courses,
+                                                                     threshold=score_threshold)
+                       for cluster in set(clusters.tolist())}
+        res_list = [cluster_res[cluster] for cluster in clusters.tolist()]
+    elif model_name == MODELS[4]: # 4: "KNN"
+        # Generate/load data
+        idx_id_dict, _ = get_doc_dicts()
+        enrolled_course_ids_list = get_enrolled_course_ids(user_ids)
+        # Compute k nearest neighbors to those users with the similarity matrix
+        res_list = compute_knn_courses_batch(enrolled_course_ids_list,
+                                             idx_id_dict,
+                                             training_artifacts,
+                                             top_k=top_courses,
+                                             threshold=score_threshold)
+    elif model_name == MODELS[5]: # 5: "NMF"
+        # Build only the user rating vectors, with the item columns used in training
+        user_ratings = load_user_ratings(user_ids)
+        user_vectors = build_user_rating_vectors(user_ratings,
+                                                 user_ids,
+                                                 training_artifacts["item_ids"])
+        # Fold the users into the latent space and score unseen courses
+        res_list = compute_nmf_recommendations_batch(user_vectors,
+                                                     training_artifacts,
+                                                     top_k=top_courses,
+                                                     threshold=score_threshold)
+    elif model_name == ALL_MODELS[6]: # 6: "Neural Network"
+        # Generate/load data
+        _, id_idx_dict = get_doc_dicts()
+        enrolled_course_ids_list = get_enrolled_course_ids(user_ids)
+        # Score with the exported weights: no TensorFlow, no retraining
+        res_list = compute_recommender_net_recommendations_batch(training_artifacts["serving"],
+                                                                 user_ids,
+                                                                 enrolled_course_ids_list,
+                                                                 id_idx_dict,
+                                                                 top_k=top_courses,
+                                                                 threshold=score_threshold)
+    elif model_name == ALL_MODELS[7]: # 7: "Regression with Embedding Features"
+        # Extract model
+        lr = training_artifacts["lr_model"]
+        # Generate/load data
+        feature_index = training_artifacts["embedding_feature_index"]
+        idx_id_dict, _ = get_doc_dicts()
+        course_ids = list(idx_id_dict.values())
+        enrolled_course_ids_list = get_enrolled_course_ids(user_ids)
+        for user_id, enrolled_course_ids in zip(user_ids, enrolled_course_ids_list):
             X, unselected_course_ids = create_embeddings_frame(user_id,
-                                                               user_embeddings_df,
-                                                               item_embeddings_df)
+                                                               enrolled_course_ids,
+                                                               course_ids,
+                                                               feature_index)
             # Predict dataframe
             pred = lr.predict(X)
             # Pack results
             ratings = pred.ravel()
-            res = {unselected_course_ids[i]:ratings[i] for i in range(len(unselected_course_ids))}                
-            score_description = "Note: the score is the rating predicted\
-                by the regression model which works\
-                with the embeddings created by a neural network."
-        elif model_name == MODELS[8]: # 8: "Classification with Embedding Features"
-            # Extract model
-            rf = training_artifacts["rf_model"]
-            label_encoder = training_artifacts["le_rf"]
-            # Generate/load data
-            user_embeddings_df = training_artifacts["user_embeddings_df"]
-            item_embeddings_df = training_artifacts["item_embeddings_df"]        
+            res_list.append({unselected_course_ids[i]:ratings[i] for i in range(len(unselected_course_ids))})
+    elif model_name == ALL_MODELS[8]: # 8: "Classification with Embedding Features"
+        # Extract model
+        rf = training_artifacts["rf_model"]
+        label_encoder = training_artifacts["le_rf"]
+        # Generate/load data
+        feature_index = training_artifacts["embedding_feature_index"]
+        idx_id_dict, _ = get_doc_dicts()
+        course_ids = list(idx_id_dict.values())
+        enrolled_course_ids_list = get_enrolled_course_ids(user_ids)
+        for user_id, enrolled_course_ids in zip(user_ids, enrolled_course_ids_list):
             X, unselected_course_ids = create_embeddings_frame(user_id,
-                                                               user_embeddings_df,
-                                                               item_embeddings_df)
+                                                               enrolled_course_ids,
+                                                               course_ids,
+                                                               feature_index)
             # Predict dataframe and process output
             pred = rf.predict(X)
             y_pred = label_encoder.inverse_transform(pred)
             prob = rf.predict_proba(X)
             ratings = y_pred*np.max(prob,axis=1)
             # Pack results
-            res = {unselected_course_ids[i]:ratings[i] for i in range(len(unselected_course_ids))}                
-            score_description = "Note: the score is the rating x probability predicted\
-                by the classification model which works\
-                with the embeddings created by a neural network."
-
-    # Filter results depending on score
-    for key, score in res.items():
-        if score >= score_threshold:
-            users.append(user_id)
-            courses.append(key)
-            scores.append(score)
-
-    # Create dataframe with results
-    res_dict['USER'] = users
-    res_dict['COURSE_ID'] = courses
-    res_dict['SCORE'] = scores
-    res_df = pd.DataFrame(res_dict, columns=['USER', 'COURSE_ID', 'SCORE'])
-    res_df = res_df.drop_duplicates(subset=['COURSE_ID']).reset_index(drop=True)
-    
-    # Restrict number of results, if required
-    if "top_courses" in params:
-        top_courses = params["top_courses"]
-        if res_df.shape[0] > top_courses and top_courses > 0:
-            # Sort according to score
-            res_df.sort_values(by='SCORE', ascending=False, inplace=True)
-            # Select top_courses
-            res_df = res_df.reset_index(drop=True).iloc[:top_courses, :]
+            res_list.append({unselected_course_ids[i]:ratings[i] for i in range(len(unselected_course_ids))})
+
+    return res_list
+
+def score_users_chunk(args):
+    """Process pool entry point of score_users(); args is a tuple
+    (model_name, user_ids, params, training_artifacts)."""
+    return score_users(*args)
+
+def filter_recommendations(res, score_threshold, top_courses=None):
+    """Keep the recommendations of a user with a score above the threshold
+    and, if required, only the top_courses ones, sorted by descending score.
+
+    Inputs:
+        res: dict
+            Key: course id, str; value: score.
+        score_threshold: float
+            Minimum score.
+        top_courses: int
+            Maximum number of courses; None or <= 0 keeps all.
+    Outputs:
+        courses, scores: list
+            Selected course ids and their scores.
+    """
+    all_courses = list(res.keys())
+    all_scores = list(res.values())
+    # Threshold and partial top-k selection in one pass
+    top_indices, top_scores = select_top_k(all_scores, top_courses, score_threshold)
+    top_indices = top_indices[0][top_scores[0] > -np.inf].tolist()
+    courses = [all_courses[i] for i in top_indices]
+    scores = [all_scores[i] for i in top_indices]
+
+    return courses, scores
+
+def predict_batch(model_name, user_ids, params, training_artifacts, num_workers=None, executor=None):
+    """Predict with the trained model for many users at once.
+
+    Models with a batched implementation score all users with matrix
+    operations in this process; the others are fanned out over a
+    process pool. The results of each user are the same as in a
+    single-user call.
+
+    Inputs:
+        model_name: str
+            Model name as in MODELS.
+        user_ids: list
+            User ids.
+        params: dict
+            Parameters collected from the UI.
+        training_artifacts: dict
+            Training objects/artifacts, sometimes the model/inference pipeline is included.
+        num_workers: int
+            Size of the process pool for the models without batched
+            implementation; defaults to params["num_workers"] or PREDICT_WORKERS.
+        executor: concurrent.futures.ProcessPoolExecutor
+            Optional; process pool used instead of a new one per call,
+            the users are then split in num_workers chunks.
+    Outputs:
+        res_df: pd.DataFrame
+            Long-format results: USER, COURSE_ID, SCORE.
+        score_description: str
+            String which describes the score.
+    """
+    try:
+        assert "model_name" in training_artifacts
+    except AssertionError as err:
+        print("You need to train the model before predicting!")
+        raise(err)
+    with STAGE_TIMINGS.request(model_name), STAGE_TIMINGS.stage("predict"):
+        user_ids = list(user_ids)
+        if num_workers is None:
+            num_workers = params.get("num_workers", PREDICT_WORKERS)
+        model_index = get_model_index(model_name)
+        batched = model_index is not None and model_index in BATCHED_MODELS
+        with STAGE_TIMINGS.stage("score"):
+            if batched or num_workers <= 1 or len(user_ids) <= 1:
+                res_list = score_users(model_name, user_ids, params, training_artifacts)
+            else:
+                # Fan users out over a process pool, in contiguous chunks
+                num_chunks = min(num_workers, len(user_ids))
+                chunks = [chunk.tolist() for chunk in np.array_split(np.asarray(user_ids, dtype=object), num_chunks)]
+                chunk_args = [(model_name, chunk, params, training_artifacts) for chunk in chunks]
+                if executor is not None:
+                    chunk_results = executor.map(score_users_chunk, chunk_args)
+                    res_list = [res for chunk_res in chunk_results for res in chunk_res]
+                else:
+                    with ProcessPoolExecutor(max_workers=num_chunks) as pool:
+                        chunk_results = pool.map(score_users_chunk, chunk_args)
+                        res_list = [res for chunk_res in chunk_results for res in chunk_res]
+
+        # Filter results depending on score and restrict number of results, if required
+        with STAGE_TIMINGS.stage("threshold"):
+            score_threshold = get_score_threshold(model_name, params)
+            top_courses = params.get("top_courses")
+            users = []
+            courses = []
+            scores = []
+            for user_id, res in zip(user_ids, res_list):
+                user_courses, user_scores = filter_recommendations(res, score_threshold, top_courses)
+                users += [user_id] * len(user_courses)
+                courses += user_courses
+                scores += user_scores
+
+        # Create dataframe with results
+        with STAGE_TIMINGS.stage("dataframe"):
+            res_dict = dict()
+            res_dict['USER'] = users
+            res_dict['COURSE_ID'] = courses
+            res_dict['SCORE'] = scores
+            res_df = pd.DataFrame(res_dict, columns=['USER', 'COURSE_ID', 'SCORE'])
+        score_description = SCORE_DESCRIPTIONS[model_index] if model_index is not None else ""
 
     return res_df, score_description
+
+def predict(model_name, user_ids, params, training_artifacts):
+    """Predict with the trained model.
+    
+    Each model has its dedicated part, see score_users().
+    
+    Inputs:
+        model_name: str
+            Model name as in MODELS.
+        user_ids: list
+            User ids; usually, a unique new user id.
+        params: dict
+            Parameters collected from the UI.
+        training_artifacts: dict
+            Training objects/artifacts, sometimes the model/inference pipeline is included.
+    Outputs:
+        res_df: pd.DataFrame
+            Results of all users: USER, COURSE_ID, SCORE.
+        score_description: str
+            String which describes the score.
+    """
+    return predict_batch(model_name, user_ids, params, training_artifacts)
@@ -0,0 +1,335 @@
+"""This script benchmarks how the training and prediction
+of every model in backend.MODELS scale with the data size.
+
+For each scale, a synthetic dataset is generated with the same files
+and columns as DATA_ROOT (ratings.csv, course_genre.csv, courses_bows.csv,
+sim.csv, course_processed.csv and user_profile.csv). Then each model
+is benchmarked in a fresh process, started from the generated data:
+
+- train_s: backend.train() without artifact store, excluding
+  train_import_s: the first import of the model dependencies
+- predict_batch_s, predict_users_per_s: backend.predict_batch() for a sample of users
+- predict_single_s: backend.predict() for one user
+- train_peak_mb, predict_peak_mb: peak RSS increase of each phase
+
+The datasets are preloaded before timing, so parsing is not included.
+Results are written as JSON; with --compare, they are checked against
+a stored baseline and the regressions are reported (exit code 1).
+
+Usage:
+
+    python benchmark.py --scales small medium --output bench.json
+    python benchmark.py --scales small --compare bench.json
+    python benchmark.py --users 20000 --courses 500 --density 0.02 --genres 14
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+SCALES = {
+    # name: (num_users, num_courses, ratings density, num_genres)
+    "small": (1000, 100, 0.05, 14),
+    "medium": (10000, 300, 0.03, 14),
+    "large": (50000, 1000, 0.01, 14),
+}
+BENCHMARK_ROOT = "benchmarks"
+NUM_PREDICT_USERS = 1000
+BENCHMARK_PARAMS = {
+    "num_clusters": 20,
+    "pca_variance": 0.9,
+    "num_components": 16,
+    "num_epochs": 1,
+    "top_courses": 10,
+    "sim_threshold": 20,
+    "profile_threshold": 0,
+}
+# Per-model overrides of BENCHMARK_PARAMS (by model index)
+MODEL_PARAMS = {
+    2: {"pca_variance": 1.0}, # 2: "Clustering", without PCA
+}
+# Metrics checked in --compare mode and the absolute change below which
+# a relative increase is considered noise
+COMPARED_METRICS = {
+    "train_s": 0.05,
+    "predict_batch_s": 0.05,
+    "predict_single_s": 0.01,
+    "train_peak_mb": 10.0,
+    "predict_peak_mb": 10.0,
+}
+TOLERANCE = 0.25 # relative increase flagged as regression
+
+def generate_dataset(data_root,
+                     num_users,
+                     num_courses,
+                     density,
+                     num_genres=14,
+                     num_tokens=200,
+                     random_state=42):
+    """Generate a synthetic dataset with the files and columns of DATA_ROOT.
+
+    Inputs:
+        data_root: str
+            Output directory.
+        num_users: int
+            Number of users; each has at least one rating.
+        num_courses: int
+            Number of courses.
+        density: float
+            Fraction of the user x course matrix which is rated.
+        num_genres: int
+            Number of genre columns of the course genre table.
+        num_tokens: int
+            Vocabulary size of the course bags-of-words.
+        random_state: int
+            Seed.
+    Outputs:
+        num_ratings: int
+            Number of generated ratings.
+    """
+    os.makedirs(data_root, exist_ok=True)
+    # Files derived by a previous run (ratings store, binary versions) would shadow the new CSVs
+    for filename in os.listdir(data_root):
+        if filename.endswith((".db", ".db-wal", ".db-shm", ".db-journal", ".parquet", ".npy")):
+            os.remove(os.path.join(data_root, filename))
+    rng = np.random.default_rng(random_state)
+    course_ids = np.array([f"course{i:05d}" for i in range(num_courses)])
+    # Courses: id, title, description
+    courses_df = pd.DataFrame({"COURSE_ID": course_ids,
+                               "TITLE": [f"Course {i}" for i in range(num_courses)],
+                               "DESCRIPTION": [f"Description of course {i}" for i in range(num_courses)]})
+    courses_df.to_csv(os.path.join(data_root, "course_processed.csv"), index=False)
+    # Genres: binary descriptors, at least one genre per course
+    genres = (rng.random((num_courses, num_genres)) < 0.2).astype(int)
+    genres[np.arange(num_courses), rng.integers(0, num_genres, num_courses)] = 1
+    course_genres_df = pd.DataFrame(genres, columns=[f"Genre{i}" for i in range(num_genres)])
+    course_genres_df.insert(0, "TITLE", courses_df["TITLE"])
+    course_genres_df.insert(0, "COURSE_ID", course_ids)
+    course_genres_df.to_csv(os.path.join(data_root, "course_genre.csv"), index=False)
+    # Bags-of-words: ~10 tokens per course with counts; sim.csv is their cosine similarity
+    bow_counts = rng.poisson(10 / num_tokens, (num_courses, num_tokens))
+    bow_counts[np.arange(num_courses), rng.integers(0, num_tokens, num_courses)] += 1
+    doc_index, token_index = np.nonzero(bow_counts)
+    bows_df = pd.DataFrame({"doc_index": doc_index,
+                            "doc_id": course_ids[doc_index],
+                            "token": [f"token{t}" for t in token_index],
+                            "bow": bow_counts[doc_index, token_index]})
+    bows_df.to_csv(os.path.join(data_root, "courses_bows.csv"), index=False)
+    bow_vectors = bow_counts / np.linalg.norm(bow_counts, axis=1, keepdims=True)
+    pd.DataFrame(bow_vectors @ bow_vectors.T).to_csv(os.path.join(data_root, "sim.csv"), index=False)
+    # Ratings (2: audited, 3: completed): one per user plus random (user, course) pairs,
+    # with a popularity skew on the courses
+    num_pairs = int(num_users * num_courses * density)
+    popularity = rng.zipf(1.5, num_courses).astype(float)
+    popularity /= popularity.sum()
+    users = np.concatenate([np.arange(num_users), rng.integers(0, num_users, num_pairs)])
+    items = np.concatenate([rng.integers(0, num_courses, num_users),
+                            rng.choice(num_courses, num_pairs, p=popularity)])
+    pairs = np.unique(users.astype(np.int64) * num_courses + items)
+    ratings_df = pd.DataFrame({"user": pairs // num_courses + 1,
+                               "item": course_ids[pairs % num_courses],
+                               "rating": rng.choice([2.0, 3.0], len(pairs))})
+    ratings_df.to_csv(os.path.join(data_root, "ratings.csv"), index=False)
+    # User profiles, as the backend would build them on first use
+    import backend
+    backend.build_user_profiles(course_genres_df, ratings_df, os.path.join(data_root, "user_profile.csv"))
+
+    return len(ratings_df)
+
+def get_peak_rss_mb():
+    """Peak RSS of the process in MB (ru_maxrss is in KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+def benchmark_model(work_dir, model_name, params, num_predict_users):
+    """Benchmark the training and prediction of one model; run in a fresh process.
+
+    Inputs:
+        work_dir: str
+            Directory containing the generated data/ directory.
+        model_name: str
+            Model name as in backend.MODELS.
+        params: dict
+            Model params.
+        num_predict_users: int
+            Number of users of the batch prediction.
+    Outputs:
+        result: dict
+            Timings (s), throughput (users/s) and peak RSS increases (MB).
+    """
+    os.chdir(work_dir)
+    import backend
+    backend.preload_datasets()
+    user_ids = np.sort(backend.load_ratings()["user"].unique())
+    rng = np.random.default_rng(0)
+    sample = rng.choice(user_ids, min(num_predict_users, len(user_ids)), replace=False).tolist()
+    rss_loaded = get_peak_rss_mb()
+
+    tic = time.perf_counter()
+    training_artifacts = backend.train(model_name, params, use_store=False)
+    # The first use of the lazily imported model dependencies is reported apart
+    train_import_s = sum(backend.IMPORT_TIMES.values())
+    train_s = time.perf_counter() - tic - train_import_s
+    rss_trained = get_peak_rss_mb()
+
+    tic = time.perf_counter()
+    backend.predict_batch(model_name, sample, params, training_artifacts)
+    predict_batch_s = time.perf_counter() - tic
+    tic = time.perf_counter()
+    backend.predict(model_name, sample[:1], params, training_artifacts)
+    predict_single_s = time.perf_counter() - tic
+    rss_predicted = get_peak_rss_mb()
+
+    result = {
+        "model": model_name,
+        "train_s": train_s,
+        "train_import_s": train_import_s,
+        "train_peak_mb": rss_trained - rss_loaded,
+        "predict_users": len(sample),
+        "predict_batch_s": predict_batch_s,
+        "predict_users_per_s": len(sample) / predict_batch_s,
+        "predict_single_s": predict_single_s,
+        "predict_peak_mb": max(rss_predicted - rss_trained, 0.0),
+    }
+
+    return result
+
+def run_benchmarks(scales, root=BENCHMARK_ROOT, num_predict_users=NUM_PREDICT_USERS):
+    """Generate the datasets and benchmark all models at each scale.
+
+    Inputs:
+        scales: dict
+            name: (num_users, num_courses, density, num_genres), see SCALES.
+        root: str
+            Directory of the generated datasets.
+        num_predict_users: int
+            Number of users of the batch prediction.
+    Outputs:
+        report: dict
+            "meta" (environment) and "results" (one entry per scale and model).
+    """
+    import backend
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": [],
+    }
+    # One fresh process per model: isolated caches and peak RSS
+    context = multiprocessing.get_context("spawn")
+    for scale_name, (num_users, num_courses, density, num_genres) in scales.items():
+        work_dir = os.path.abspath(os.path.join(root, scale_name))
+        data_root = os.path.join(work_dir, backend.DATA_ROOT)
+        tic = time.perf_counter()
+        num_ratings = generate_dataset(data_root, num_users, num_courses, density, num_genres)
+        print(f"[{scale_name}] {num_users} users, {num_courses} courses, {num_ratings} ratings"
+              f" (generated in {time.perf_counter() - tic:.1f} s)")
+        for model_index, model_name in enumerate(backend.MODELS):
+            params = dict(BENCHMARK_PARAMS, **MODEL_PARAMS.get(model_index, {}))
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(benchmark_model, work_dir, model_name,
+                                         params, num_predict_users).result()
+            result.update({"scale": scale_name,
+                           "num_users": num_users,
+                           "num_courses": num_courses,
+                           "num_ratings": num_ratings})
+            report["results"].append(result)
+            print(f"  {model_name:<26} train {result['train_s']:>8.3f} s {result['train_peak_mb']:>8.1f} MB"
+                  f" | predict {result['predict_batch_s']:>8.3f} s ({result['predict_users_per_s']:>9.0f} users/s)"
+                  f" single {result['predict_single_s']*1000:>7.1f} ms {result['predict_peak_mb']:>8.1f} MB")
+
+    return report
+
+def compare_reports(report, baseline, tolerance=TOLERANCE):
+    """Compare a benchmark report with a baseline report.
+
+    A metric regresses if it increases by more than tolerance (relative)
+    and by more than its noise floor in COMPARED_METRICS (absolute).
+
+    Inputs:
+        report: dict
+            Current report, see run_benchmarks().
+        baseline: dict
+            Baseline report.
+        tolerance: float
+            Relative increase flagged as regression.
+    Outputs:
+        regressions: list
+            One dict per regressed (scale, model, metric).
+    """
+    baseline_results = {(result["scale"], result["model"]): result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        base = baseline_results.get((result["scale"], result["model"]))
+        if base is None:
+            continue
+        for metric, noise_floor in COMPARED_METRICS.items():
+            if metric not in base or metric not in result:
+                continue
+            change = result[metric] - base[metric]
+            if change > noise_floor and change > tolerance * abs(base[metric]):
+                regressions.append({"scale": result["scale"],
+                                    "model": result["model"],
+                                    "metric": metric,
+                                    "baseline": base[metric],
+                                    "current": result[metric],
+                                    "change_pct": 100 * change / abs(base[metric]) if base[metric] else float("inf")})
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the training and prediction of all models.")
+    parser.add_argument("--scales", nargs="+", choices=sorted(SCALES), default=["small"],
+                        help="Preset scales to run (default: small).")
+    parser.add_argument("--users", type=int, help="Custom scale: number of users (with --courses).")
+    parser.add_argument("--courses", type=int, help="Custom scale: number of courses (with --users).")
+    parser.add_argument("--density", type=float, default=0.02, help="Custom scale: ratings density.")
+    parser.add_argument("--genres", type=int, default=14, help="Custom scale: number of genres.")
+    parser.add_argument("--predict-users", type=int, default=NUM_PREDICT_USERS,
+                        help="Users per batch prediction.")
+    parser.add_argument("--root", default=BENCHMARK_ROOT, help="Directory of the generated datasets.")
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file.")
+    parser.add_argument("--compare", default=None, help="Baseline JSON report to compare with.")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="Relative increase flagged as regression (default: 0.25).")
+    args = parser.parse_args()
+    if (args.users is None) != (args.courses is None):
+        parser.error("--users and --courses must be given together for a custom scale")
+
+    if args.users is not None:
+        scales = {"custom": (args.users, args.courses, args.density, args.genres)}
+    else:
+        scales = {name: SCALES[name] for name in args.scales}
+    report = run_benchmarks(scales, args.root, args.predict_users)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION [{regression['scale']}] {regression['model']} {regression['metric']}:"
+                  f" {regression['baseline']:.3f} -> {regression['current']:.3f}"
+                  f" (+{regression['change_pct']:.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""This script converts the CSV datasets under DATA_ROOT
+to a binary columnar form, which backend.load_*() prefer when present:
+
+- tables (ratings, courses, BoWs, course genres, user profiles) -> Parquet
+- the numeric course similarity matrix -> .npy (memory-mapped on load)
+
+The CSV files are kept as fallback; a binary file older than its CSV
+is ignored by the backend. For each dataset, the parse time of both
+formats and the process RSS before/after the conversion are reported.
+
+Usage:
+
+    python convert_data.py
+    python convert_data.py --data-root data --datasets ratings sim
+"""
+
+import argparse
+import os
+import resource
+import time
+
+import numpy as np
+import pandas as pd
+
+import backend
+
+DATASETS = {
+    "ratings": backend.FILEPATH_RATINGS,
+    "sim": backend.FILEPATH_COURSE_SIMS,
+    "courses": backend.FILEPATH_COURSES,
+    "bows": backend.FILEPATH_BOWS,
+    "course_genres": backend.FILEPATH_COURSE_GENRES,
+    "user_profiles": backend.FILEPATH_USER_PROFILES,
+}
+
+def get_rss_mb():
+    """Current resident set size of the process in MB;
+    falls back to the peak RSS where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        # ru_maxrss is in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+def load_binary(binary_filepath):
+    """Load a converted dataset; .npy files are memory-mapped."""
+    if binary_filepath.endswith(".npy"):
+        return np.load(binary_filepath, mmap_mode="r")
+    return pd.read_parquet(binary_filepath)
+
+def convert_dataset(csv_filepath, binary_filepath):
+    """Convert one CSV dataset to its binary form.
+
+    Inputs:
+        csv_filepath: str
+            Source CSV file.
+        binary_filepath: str
+            Target .parquet or .npy file.
+    Outputs:
+        report: dict
+            Parse times (s), file sizes (MB) and RSS (MB) before/after.
+    """
+    rss_before = get_rss_mb()
+    tic = time.perf_counter()
+    df = pd.read_csv(csv_filepath)
+    csv_time = time.perf_counter() - tic
+    if binary_filepath.endswith(".npy"):
+        np.save(binary_filepath, df.to_numpy())
+    else:
+        df.to_parquet(binary_filepath, index=False)
+    del df
+    tic = time.perf_counter()
+    dataset = load_binary(binary_filepath)
+    binary_time = time.perf_counter() - tic
+    del dataset
+    rss_after = get_rss_mb()
+    report = {
+        "csv_parse_s": csv_time,
+        "binary_load_s": binary_time,
+        "csv_mb": os.path.getsize(csv_filepath) / 2**20,
+        "binary_mb": os.path.getsize(binary_filepath) / 2**20,
+        "rss_before_mb": rss_before,
+        "rss_after_mb": rss_after,
+    }
+
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the CSV datasets to Parquet/.npy.")
+    parser.add_argument("--data-root", default=backend.DATA_ROOT,
+                        help="Directory with the CSV datasets.")
+    parser.add_argument("--datasets", nargs="+", choices=sorted(DATASETS), default=sorted(DATASETS),
+                        help="Datasets to convert (default: all).")
+    args = parser.parse_args()
+    if not backend.HAS_PARQUET:
+        print("Warning: pyarrow is not installed; tables are skipped, only .npy files are written.")
+
+    print(f"{'dataset':<15}{'csv s':>9}{'binary s':>10}{'csv MB':>9}{'bin MB':>9}"
+          f"{'RSS before':>12}{'RSS after':>11}")
+    for name in args.datasets:
+        filename = os.path.basename(DATASETS[name])
+        csv_filepath = os.path.join(args.data_root, filename)
+        binary_filepath = backend.get_binary_filepath(csv_filepath,
+                                                      backend.BINARY_FORMATS[DATASETS[name]])
+        if not os.path.isfile(csv_filepath):
+            print(f"{name:<15}missing: {csv_filepath}")
+            continue
+        if binary_filepath.endswith(".parquet") and not backend.HAS_PARQUET:
+            continue
+        report = convert_dataset(csv_filepath, binary_filepath)
+        print(f"{name:<15}{report['csv_parse_s']:>9.3f}{report['binary_load_s']:>10.3f}"
+              f"{report['csv_mb']:>9.2f}{report['binary_mb']:>9.2f}"
+              f"{report['rss_before_mb']:>12.1f}{report['rss_after_mb']:>11.1f}")
+
+if __name__ == "__main__":
+    main()
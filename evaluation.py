@@ -0,0 +1,325 @@
+"""This module contains the offline evaluation of the recommender models.
+
+A holdout split hides some ratings of the users (a number or a share
+of each user's ratings): the models are trained on the remaining
+ratings and the hidden courses should appear among the top-k
+recommendations of their users. The split is written as a separate
+data directory, with the same files as DATA_ROOT, so that the backend
+can be run on it unchanged (the backend reads its datasets relative
+to the working directory).
+
+The harness trains each model of backend.MODELS on the split, in a fresh
+process, scores all test users in batches and reports the ranking metrics
+(precision@k, recall@k, hit rate@k, NDCG@k, catalogue coverage)
+next to the training time, the prediction throughput and the peak memory.
+
+Usage:
+
+    python evaluation.py
+    python evaluation.py --holdout-fraction 0.2 --k 10 --output evaluation.json
+    python evaluation.py --models "5. KNN" "6. NMF" --eval-users 10000
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import backend
+from benchmark import BENCHMARK_PARAMS, MODEL_PARAMS, get_peak_rss_mb
+
+EVALUATION_ROOT = "evaluation"
+TOP_K = 10
+HOLDOUT_FRACTION = 0.2
+PREDICT_CHUNK_SIZE = 10000 # users scored per predict_batch() call
+# No score thresholds: the metrics are computed on the top-k ranking
+EVALUATION_PARAMS = dict(BENCHMARK_PARAMS, sim_threshold=0, profile_threshold=0)
+
+# Files copied to the split data directory; derived files
+# (user profiles, ratings store, binary versions) are rebuilt there
+SPLIT_FILEPATHS = (
+    backend.FILEPATH_COURSE_SIMS,
+    backend.FILEPATH_COURSES,
+    backend.FILEPATH_BOWS,
+    backend.FILEPATH_COURSE_GENRES,
+)
+# Files derived by the backend from the split (ratings store, user profiles,
+# binary versions): removed when a new split is written, since they would shadow it
+SPLIT_DERIVED_FILEPATHS = (
+    (backend.FILEPATH_RATINGS_DB,)
+    + tuple(backend.FILEPATH_RATINGS_DB + suffix for suffix in ("-journal", "-wal", "-shm"))
+    + (backend.FILEPATH_USER_PROFILES,)
+    + tuple(backend.get_binary_filepath(filepath) for filepath in backend.BINARY_FORMATS)
+)
+
+def create_holdout_split(work_dir,
+                         num_users=None,
+                         holdout_per_user=1,
+                         holdout_fraction=None,
+                         min_ratings=2,
+                         random_state=backend.RANDOM_SEED):
+    """Hide some ratings of the users and write the remaining
+    dataset to work_dir/DATA_ROOT. The current directory must contain DATA_ROOT.
+
+    Inputs:
+        work_dir: str
+            Directory of the split; created if needed.
+            Its DATA_ROOT must not be the source DATA_ROOT.
+        num_users: int
+            Number of evaluated users, sampled among the eligible ones;
+            None evaluates all of them.
+        holdout_per_user: int
+            Ratings hidden per evaluated user, if holdout_fraction is None.
+        holdout_fraction: float
+            Share of the ratings hidden per evaluated user (at least one).
+        min_ratings: int
+            Users need at least min_ratings ratings; at least one rating
+            of each user is kept for training.
+        random_state: int
+            Seed.
+    Outputs:
+        holdout_df: pd.DataFrame
+            Hidden ratings: user, item.
+    """
+    data_root = os.path.join(work_dir, backend.DATA_ROOT)
+    if os.path.realpath(data_root) == os.path.realpath(backend.DATA_ROOT):
+        raise ValueError(f"The split directory {work_dir} would overwrite the source data {backend.DATA_ROOT}")
+    ratings_df = backend.load_ratings()
+    rng = np.random.default_rng(random_state)
+    counts = ratings_df['user'].value_counts()
+    eligible = counts.index[counts >= max(min_ratings, 2)].to_numpy()
+    if num_users is not None and num_users < len(eligible):
+        eligible = rng.choice(eligible, num_users, replace=False)
+    # Random ratings of the evaluated users: shuffle, then take the first ones per user
+    candidates = ratings_df[ratings_df['user'].isin(eligible)]
+    candidates = candidates.iloc[rng.permutation(len(candidates))]
+    user_counts = counts.loc[candidates['user']].to_numpy()
+    if holdout_fraction is not None:
+        quota = np.maximum(np.floor(holdout_fraction * user_counts), 1)
+    else:
+        quota = np.full(len(candidates), holdout_per_user)
+    quota = np.minimum(quota, user_counts - 1)
+    holdout = candidates[candidates.groupby('user').cumcount().to_numpy() < quota]
+    train_df = ratings_df.drop(index=holdout.index)
+
+    os.makedirs(data_root, exist_ok=True)
+    for filepath in SPLIT_DERIVED_FILEPATHS:
+        split_filepath = os.path.join(work_dir, filepath)
+        if os.path.isfile(split_filepath):
+            os.remove(split_filepath)
+    train_df.to_csv(os.path.join(data_root, os.path.basename(backend.FILEPATH_RATINGS)), index=False)
+    for filepath in SPLIT_FILEPATHS:
+        shutil.copyfile(filepath, os.path.join(data_root, os.path.basename(filepath)))
+    holdout_df = holdout[['user', 'item']].sort_values(['user', 'item']).reset_index(drop=True)
+
+    return holdout_df
+
+def evaluate_recommendations(res_df, holdout_df, k=TOP_K, num_items=None):
+    """Compute ranking metrics of the recommendations of the evaluated users
+    against their hidden ratings, with vectorized NumPy operations:
+    (user, course) pairs are encoded as integer keys and matched by sorting,
+    and the per-user sums are bincounts.
+
+    Inputs:
+        res_df: pd.DataFrame
+            Recommendations, as returned by backend.predict_batch():
+            USER, COURSE_ID, SCORE; sorted by descending score per user.
+        holdout_df: pd.DataFrame
+            Hidden ratings: user, item.
+        k: int
+            Cut-off rank.
+        num_items: int
+            Catalogue size, for the coverage; None skips it.
+    Outputs:
+        metrics: dict
+            "precision_at_k": hidden courses in the top-k / k, averaged over users,
+            "recall_at_k": fraction of hidden courses in the top-k, averaged over users,
+            "hit_rate_at_k": fraction of users with at least one hidden course in the top-k,
+            "ndcg_at_k": normalized discounted cumulative gain at k, averaged over users,
+            "coverage_at_k": fraction of the catalogue recommended in some top-k (if num_items).
+    """
+    # Top-k of each user: rank = position within the user's rows
+    rec_users = res_df['USER'].to_numpy()
+    starts = np.r_[0, np.flatnonzero(rec_users[1:] != rec_users[:-1]) + 1]
+    lengths = np.diff(np.r_[starts, len(rec_users)])
+    ranks = np.arange(len(rec_users)) - np.repeat(starts, lengths)
+    top = ranks < k
+    rec_users, ranks = rec_users[top], ranks[top]
+    rec_items = res_df['COURSE_ID'].to_numpy()[top]
+    # Shared integer codes of users and courses
+    user_codes, users = pd.factorize(np.concatenate([holdout_df['user'].to_numpy(), rec_users]))
+    item_codes, items = pd.factorize(np.concatenate([holdout_df['item'].to_numpy(), rec_items]))
+    num_hidden_pairs = len(holdout_df)
+    keys = user_codes.astype(np.int64) * len(items) + item_codes
+    hidden_keys, rec_keys = keys[:num_hidden_pairs], keys[num_hidden_pairs:]
+    # Match the hidden pairs with the recommended pairs
+    if len(rec_keys) > 0:
+        order = np.argsort(rec_keys, kind='stable')
+        sorted_keys = rec_keys[order]
+        positions = np.minimum(np.searchsorted(sorted_keys, hidden_keys), len(sorted_keys) - 1)
+        hit = sorted_keys[positions] == hidden_keys
+        hit_ranks = ranks[order][positions]
+    else:
+        hit = np.zeros(num_hidden_pairs, dtype=bool)
+        hit_ranks = np.zeros(num_hidden_pairs, dtype=np.int64)
+    gain = np.where(hit, 1.0 / np.log2(hit_ranks + 2), 0.0)
+    # Per evaluated user sums
+    hidden_users = user_codes[:num_hidden_pairs]
+    num_users = len(users)
+    num_hidden = np.bincount(hidden_users, minlength=num_users)
+    num_hits = np.bincount(hidden_users, weights=hit, minlength=num_users)
+    dcg = np.bincount(hidden_users, weights=gain, minlength=num_users)
+    evaluated = num_hidden > 0
+    num_hidden, num_hits, dcg = num_hidden[evaluated], num_hits[evaluated], dcg[evaluated]
+    # Ideal DCG: all hidden courses (up to k) at the top ranks
+    discounts = np.cumsum(1.0 / np.log2(np.arange(k) + 2))
+    idcg = discounts[np.minimum(num_hidden, k) - 1]
+    metrics = {
+        "precision_at_k": float(np.mean(num_hits / k)),
+        "recall_at_k": float(np.mean(num_hits / num_hidden)),
+        "hit_rate_at_k": float(np.mean(num_hits > 0)),
+        "ndcg_at_k": float(np.mean(dcg / idcg)),
+    }
+    if num_items is not None:
+        metrics["coverage_at_k"] = len(np.unique(rec_items)) / num_items
+
+    return metrics
+
+def evaluate_model(work_dir, model_name, params, holdout_df, k=TOP_K, chunk_size=PREDICT_CHUNK_SIZE):
+    """Train a model on a holdout split and evaluate it; run in a fresh process.
+
+    Inputs:
+        work_dir: str
+            Directory of the split (containing DATA_ROOT).
+        model_name: str
+            Model name as in backend.MODELS.
+        params: dict
+            Model params.
+        holdout_df: pd.DataFrame
+            Hidden ratings: user, item.
+        k: int
+            Cut-off rank.
+        chunk_size: int
+            Users scored per predict_batch() call, to bound memory.
+    Outputs:
+        result: dict
+            Quality metrics, training time, prediction throughput
+            and peak RSS increases (MB).
+    """
+    os.chdir(work_dir)
+    backend.preload_datasets()
+    idx_id_dict, _ = backend.get_doc_dicts()
+    rss_loaded = get_peak_rss_mb()
+    params = dict(params, top_courses=k)
+
+    # Lazy imports of the model libraries are not counted as training time
+    import_s = sum(backend.IMPORT_TIMES.values())
+    tic = time.perf_counter()
+    training_artifacts = backend.train(model_name, params, use_store=False)
+    train_s = time.perf_counter() - tic - (sum(backend.IMPORT_TIMES.values()) - import_s)
+    rss_trained = get_peak_rss_mb()
+
+    user_ids = holdout_df['user'].unique().tolist()
+    res_chunks = []
+    tic = time.perf_counter()
+    for start in range(0, len(user_ids), chunk_size):
+        res_df, _ = backend.predict_batch(model_name, user_ids[start:start+chunk_size],
+                                          params, training_artifacts)
+        res_chunks.append(res_df)
+    predict_s = time.perf_counter() - tic
+    rss_predicted = get_peak_rss_mb()
+
+    result = {"model": model_name,
+              "num_users": len(user_ids),
+              "num_hidden": len(holdout_df)}
+    result.update(evaluate_recommendations(pd.concat(res_chunks, ignore_index=True),
+                                           holdout_df, k, num_items=len(idx_id_dict)))
+    result.update({"train_s": train_s,
+                   "predict_s": predict_s,
+                   "predict_users_per_s": len(user_ids) / predict_s if predict_s > 0 else float("inf"),
+                   "train_peak_mb": rss_trained - rss_loaded,
+                   "predict_peak_mb": max(rss_predicted - rss_trained, 0.0)})
+
+    return result
+
+def run_evaluation(model_names,
+                   work_dir=EVALUATION_ROOT,
+                   k=TOP_K,
+                   holdout_fraction=HOLDOUT_FRACTION,
+                   num_users=None):
+    """Create a holdout split and evaluate several models on it,
+    each in a fresh process (isolated caches and peak memory).
+    The current directory must contain DATA_ROOT.
+
+    Inputs:
+        model_names: list
+            Model names as in backend.MODELS.
+        work_dir: str
+            Directory of the split.
+        k: int
+            Cut-off rank.
+        holdout_fraction: float
+            Share of the ratings hidden per evaluated user.
+        num_users: int
+            Number of evaluated users; None evaluates all.
+    Outputs:
+        report_df: pd.DataFrame
+            One row per model: metrics, times, throughput, memory.
+    """
+    tic = time.perf_counter()
+    holdout_df = create_holdout_split(work_dir,
+                                      num_users=num_users,
+                                      holdout_fraction=holdout_fraction)
+    print(f"Holdout: {holdout_df['user'].nunique()} users, {len(holdout_df)} hidden ratings"
+          f" ({time.perf_counter() - tic:.1f} s)")
+    work_dir = os.path.abspath(work_dir)
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for model_name in model_names:
+        model_index = backend.get_model_index(model_name)
+        params = dict(EVALUATION_PARAMS, **MODEL_PARAMS.get(model_index, {}))
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(evaluate_model, work_dir, model_name, params, holdout_df, k).result()
+        results.append(result)
+        print(f"  {model_name:<26} ndcg@{k} {result['ndcg_at_k']:.4f} recall@{k} {result['recall_at_k']:.4f}"
+              f" | train {result['train_s']:.2f} s, {result['predict_users_per_s']:.0f} users/s,"
+              f" peak {max(result['train_peak_mb'], result['predict_peak_mb']):.0f} MB")
+
+    return pd.DataFrame(results)
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline evaluation of the recommender models.")
+    parser.add_argument("--models", nargs="+", choices=backend.MODELS, default=list(backend.MODELS),
+                        help="Models to evaluate (default: all).")
+    parser.add_argument("--k", type=int, default=TOP_K, help="Cut-off rank of the metrics.")
+    parser.add_argument("--holdout-fraction", type=float, default=HOLDOUT_FRACTION,
+                        help="Share of each user's ratings hidden for testing.")
+    parser.add_argument("--eval-users", type=int, default=None,
+                        help="Number of evaluated users (default: all eligible users).")
+    parser.add_argument("--work-dir", default=EVALUATION_ROOT, help="Directory of the holdout split.")
+    parser.add_argument("--output", default=None, help="Write the report to this JSON file.")
+    args = parser.parse_args()
+    if os.path.realpath(os.path.join(args.work_dir, backend.DATA_ROOT)) == os.path.realpath(backend.DATA_ROOT):
+        parser.error(f"--work-dir {args.work_dir} would overwrite the source data {backend.DATA_ROOT}")
+
+    report_df = run_evaluation(args.models,
+                               work_dir=args.work_dir,
+                               k=args.k,
+                               holdout_fraction=args.holdout_fraction,
+                               num_users=args.eval_users)
+    print(report_df.to_string(index=False))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"k": args.k,
+                       "holdout_fraction": args.holdout_fraction,
+                       "results": report_df.to_dict(orient="records")}, f, indent=2)
+        print(f"Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""This script searches the hyperparameters of a model in backend.MODELS.
+
+The candidates of a grid or random search space are trained in parallel
+over a process pool and scored offline: the models are trained on a
+holdout split of the ratings (see evaluation.py) and ranked by how well
+they recover the hidden courses of the evaluated users (NDCG@k by default).
+
+The datasets are loaded once in the parent process before the pool
+is started; with the "fork" start method (Linux/macOS) the workers
+share them copy-on-write instead of each one parsing its own copy.
+
+Each finished candidate is appended to a JSON-lines leaderboard file
+and the ranked leaderboard is printed; an interrupted sweep is resumed
+by running the same command again: the candidates already
+in the leaderboard are skipped and the same holdout split is reused.
+
+Usage:
+
+    python hyperparameter_search.py --model "3. Clustering" \\
+        --space '{"num_clusters": [5, 10, 20, 30], "pca_variance": [1.0]}'
+    python hyperparameter_search.py --model "6. NMF" --random 20 \\
+        --space '{"num_components": {"low": 2, "high": 64, "log": true, "int": true}}'
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import backend
+import evaluation
+
+SEARCH_ROOT = "search"
+NUM_EVAL_USERS = 1000
+TOP_K = 10
+RANK_METRIC = "ndcg_at_k"
+
+# Holdout of the current search, set in the parent (inherited by forked workers)
+# or by the pool initializer (spawned workers)
+HOLDOUT_DF = None
+
+def expand_grid(space):
+    """All the combinations of a grid search space.
+
+    Inputs:
+        space: dict
+            Param name -> list of values.
+    Outputs:
+        candidates: list
+            List of param dicts.
+    """
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+def sample_random(space, num_candidates, random_state=backend.RANDOM_SEED):
+    """Sample a random search space; duplicates are dropped.
+
+    Inputs:
+        space: dict
+            Param name -> list of values (sampled uniformly)
+            or {"low", "high", "log": bool, "int": bool} (sampled in the range).
+        num_candidates: int
+            Number of samples.
+        random_state: int
+            Seed.
+    Outputs:
+        candidates: list
+            List of param dicts.
+    """
+    rng = np.random.default_rng(random_state)
+    candidates = []
+    for _ in range(num_candidates):
+        params = dict()
+        for name in sorted(space):
+            values = space[name]
+            if isinstance(values, dict):
+                low, high = values["low"], values["high"]
+                if values.get("log", False):
+                    value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+                else:
+                    value = float(rng.uniform(low, high))
+                params[name] = int(round(value)) if values.get("int", False) else value
+            else:
+                params[name] = values[rng.integers(len(values))]
+        if params not in candidates:
+            candidates.append(params)
+    return candidates
+
+def get_candidate_key(params):
+    return json.dumps(params, sort_keys=True)
+
+def init_worker(holdout_df):
+    global HOLDOUT_DF
+    HOLDOUT_DF = holdout_df
+
+def evaluate_candidate(model_name, params, top_k=TOP_K):
+    """Train a candidate on the split and score it; run in a worker.
+
+    Inputs:
+        model_name: str
+            Model name as in backend.MODELS.
+        params: dict
+            Candidate params (merged with top_courses=top_k).
+        top_k: int
+            Cut-off rank of the metrics.
+    Outputs:
+        result: dict
+            Params, metrics, train and predict times.
+    """
+    run_params = dict(params, top_courses=top_k, num_workers=1)
+    tic = time.perf_counter()
+    training_artifacts = backend.train(model_name, run_params, use_store=False)
+    train_s = time.perf_counter() - tic
+    user_ids = HOLDOUT_DF['user'].unique().tolist()
+    tic = time.perf_counter()
+    res_df, _ = backend.predict_batch(model_name, user_ids, run_params, training_artifacts)
+    predict_s = time.perf_counter() - tic
+    result = {"params": params,
+              "train_s": train_s,
+              "predict_s": predict_s}
+    result.update(evaluation.evaluate_recommendations(res_df, HOLDOUT_DF, top_k))
+
+    return result
+
+def load_leaderboard(filepath):
+    """Read the finished candidates of a leaderboard file (JSON lines);
+    a line truncated by an interruption is ignored."""
+    results = []
+    if os.path.isfile(filepath):
+        with open(filepath) as f:
+            for line in f:
+                try:
+                    results.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return results
+
+def rank_leaderboard(results, metric=RANK_METRIC):
+    """Rank the finished candidates by descending metric.
+
+    Outputs:
+        leaderboard_df: pd.DataFrame
+            One row per candidate: rank, metrics, times, params.
+    """
+    leaderboard_df = pd.DataFrame([dict(result, params=get_candidate_key(result["params"]))
+                                   for result in results])
+    if leaderboard_df.empty:
+        return leaderboard_df
+    leaderboard_df = leaderboard_df.sort_values(metric, ascending=False, kind="mergesort").reset_index(drop=True)
+    leaderboard_df.insert(0, "rank", np.arange(1, len(leaderboard_df) + 1))
+
+    return leaderboard_df
+
+def run_search(model_name,
+               candidates,
+               search_dir=SEARCH_ROOT,
+               num_workers=None,
+               top_k=TOP_K,
+               num_eval_users=NUM_EVAL_USERS,
+               metric=RANK_METRIC):
+    """Evaluate the candidates in parallel, streaming the results to
+    search_dir/leaderboard.jsonl; candidates already in it are skipped.
+    The current directory must contain DATA_ROOT; the holdout split
+    is created in search_dir on the first run and reused afterwards.
+
+    Inputs:
+        model_name: str
+            Model name as in backend.MODELS.
+        candidates: list
+            List of param dicts.
+        search_dir: str
+            Directory of the split and the leaderboard;
+            its DATA_ROOT must not be the source DATA_ROOT.
+        num_workers: int
+            Process pool size; defaults to the number of CPUs.
+        top_k: int
+            Cut-off rank of the metrics.
+        num_eval_users: int
+            Number of evaluated users of the split.
+        metric: str
+            Ranking metric of the leaderboard.
+    Outputs:
+        leaderboard_df: pd.DataFrame
+            Ranked leaderboard, incl. the candidates of previous runs.
+    """
+    global HOLDOUT_DF
+    # The split is written to search_dir/DATA_ROOT: it must not be the source data
+    if os.path.realpath(os.path.join(search_dir, backend.DATA_ROOT)) == os.path.realpath(backend.DATA_ROOT):
+        raise ValueError(f"The search directory {search_dir} would overwrite the source data {backend.DATA_ROOT}")
+    os.makedirs(search_dir, exist_ok=True)
+    holdout_filepath = os.path.join(search_dir, "holdout.csv")
+    leaderboard_filepath = os.path.join(search_dir, "leaderboard.jsonl")
+    if os.path.isfile(holdout_filepath):
+        holdout_df = pd.read_csv(holdout_filepath)
+    else:
+        holdout_df = evaluation.create_holdout_split(search_dir, num_users=num_eval_users)
+        holdout_df.to_csv(holdout_filepath, index=False)
+    HOLDOUT_DF = holdout_df
+
+    results = [result for result in load_leaderboard(leaderboard_filepath)
+               if result.get("model") == model_name]
+    done = {get_candidate_key(result["params"]) for result in results}
+    pending = [params for params in candidates if get_candidate_key(params) not in done]
+    print(f"{len(candidates)} candidates, {len(candidates) - len(pending)} already done, {len(pending)} to run")
+
+    # Train on the split: load its datasets once, before the workers are started
+    cwd = os.getcwd()
+    os.chdir(search_dir)
+    try:
+        backend.preload_datasets()
+        backend.load_user_profiles(get_df=False)
+        start_methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in start_methods else "spawn")
+        with ProcessPoolExecutor(max_workers=num_workers or os.cpu_count(),
+                                 mp_context=context,
+                                 initializer=init_worker,
+                                 initargs=(holdout_df,)) as executor, \
+             open(os.path.join(cwd, leaderboard_filepath), "a") as leaderboard_file:
+            futures = {executor.submit(evaluate_candidate, model_name, params, top_k): params
+                       for params in pending}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as err:
+                    print(f"Failed: {get_candidate_key(futures[future])}: {type(err).__name__}: {err}")
+                    continue
+                result["model"] = model_name
+                leaderboard_file.write(json.dumps(result) + "\n")
+                leaderboard_file.flush()
+                results.append(result)
+                best = rank_leaderboard(results, metric).iloc[0]
+                print(f"[{len(results)}/{len(candidates)}] {metric}={result[metric]:.4f}"
+                      f" train={result['train_s']:.2f}s {get_candidate_key(result['params'])}"
+                      f" | best {metric}={best[metric]:.4f} {best['params']}")
+    finally:
+        os.chdir(cwd)
+
+    return rank_leaderboard(results, metric)
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter search of a recommender model.")
+    parser.add_argument("--model", required=True, choices=backend.MODELS, help="Model name.")
+    parser.add_argument("--space", required=True,
+                        help="Search space as JSON: param -> list of values, "
+                             "or {low, high, log, int} ranges (random search only).")
+    parser.add_argument("--random", type=int, default=None,
+                        help="Number of random candidates; grid search if not set.")
+    parser.add_argument("--search-dir", default=SEARCH_ROOT, help="Directory of the split and leaderboard.")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size.")
+    parser.add_argument("--k", type=int, default=TOP_K, help="Cut-off rank of the metrics.")
+    parser.add_argument("--eval-users", type=int, default=NUM_EVAL_USERS, help="Evaluated users.")
+    parser.add_argument("--metric", default=RANK_METRIC,
+                        choices=["ndcg_at_k", "recall_at_k", "hit_rate_at_k"], help="Ranking metric.")
+    args = parser.parse_args()
+
+    if os.path.realpath(os.path.join(args.search_dir, backend.DATA_ROOT)) == os.path.realpath(backend.DATA_ROOT):
+        parser.error(f"--search-dir {args.search_dir} would overwrite the source data {backend.DATA_ROOT}")
+    space = json.loads(args.space)
+    if args.random is not None:
+        candidates = sample_random(space, args.random)
+    else:
+        candidates = expand_grid(space)
+    leaderboard_df = run_search(args.model,
+                                candidates,
+                                search_dir=args.search_dir,
+                                num_workers=args.workers,
+                                top_k=args.k,
+                                num_eval_users=args.eval_users,
+                                metric=args.metric)
+    leaderboard_filepath = os.path.join(args.search_dir, "leaderboard.csv")
+    leaderboard_df.to_csv(leaderboard_filepath, index=False)
+    print(leaderboard_df.head(10).to_string(index=False))
+    print(f"Leaderboard written to {leaderboard_filepath}")
+
+if __name__ == "__main__":
+    main()
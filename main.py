@@ -1,21 +1,16 @@
 import os
-import pickle
 import streamlit as st
 import matplotlib.pyplot as plt
+from neighbour_index import get_neighbour_index, get_neighbours
 
 
-# Load courses and similarity data
-courses_list = pickle.load(open('courses.pkl', 'rb'))
-similarity = pickle.load(open('similarity.pkl', 'rb'))
+# Load courses and their precomputed neighbours (memory-mapped, lazily)
+neighbour_index = get_neighbour_index()
 
 # Function to recommend courses
 def recommend(course):
-    index = courses_list[courses_list['course_name'] == course].index[0]
-    distances = sorted(list(enumerate(similarity[index])), reverse=True, key=lambda x: x[1])
-    recommended_course_names = []
-    for i in distances[1:7]:
-        course_name = courses_list.iloc[i[0]].course_name
-        recommended_course_names.append(course_name)
+    # The first neighbour is the course itself
+    recommended_course_names = get_neighbours(course, 6, skip_first=True)
 
     return recommended_course_names
 
@@ -137,13 +132,16 @@ st.markdown("<h2 style='text-align: center; color: blue;'>COURSE RECOMMENDATION
 st.markdown("<h4 style='text-align: center; color: black;'>Find courses according to your grasping power!</h4>", unsafe_allow_html=True)
 
 st.sidebar.header("User Settings")
-selected_course = st.sidebar.selectbox("Select a course you like:", courses_list['course_name'].values)
+selected_course = st.sidebar.selectbox("Select a course you like:", neighbour_index['names'])
 selected_subject = st.sidebar.selectbox("Select the subject of the quiz:", ['Finance for Managers', 'History'])
 
 if st.sidebar.button('Show Recommended Courses'):
     st.write("Recommended Courses based on your interests are:")
     recommended_course_names = recommend(selected_course)
-    st.write(recommended_course_names)
+    if not recommended_course_names:
+        st.write("No recommendations available for this course.")
+    else:
+        st.write(recommended_course_names)
 
 st.sidebar.markdown("<h6 style='text-align: center; color: red;'>Find the right course for you!</h6>", unsafe_allow_html=True)
 
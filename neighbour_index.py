@@ -0,0 +1,224 @@
+"""This module builds and loads the course neighbour index used by main.py.
+
+Instead of unpickling the full dense similarity matrix at startup,
+the top-N neighbours of each course are precomputed once and stored
+as compact arrays, which are memory-mapped on first use:
+
+    neighbours/<version>/indices.npy: int32 (n_courses, N), neighbour course indices
+    neighbours/<version>/scores.npy: float32 (n_courses, N), neighbour similarities
+    neighbours/<version>/names.json: course names, in course index order
+    neighbours/current: name of the version directory in use
+
+Each build writes a new version directory and then switches the
+"current" pointer atomically: the files of a version are never
+rewritten, so processes which have memory-mapped an older version
+keep reading consistent arrays while the index is rebuilt.
+
+Neighbours are sorted by descending similarity; the first one
+is usually the course itself. A recommendation is then a slice of a row.
+
+Usage:
+
+    python neighbour_index.py
+    python neighbour_index.py --num-neighbours 50
+"""
+
+import argparse
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from ranking import select_top_k
+
+COURSES_FILEPATH = "courses.pkl"
+SIMILARITY_FILEPATH = "similarity.pkl"
+NEIGHBOURS_ROOT = "neighbours"
+NUM_NEIGHBOURS = 20
+CURRENT_FILENAME = "current"
+
+NEIGHBOUR_INDEX = None
+NEIGHBOUR_INDEX_LOCK = threading.Lock()
+
+def build_neighbour_index(course_names,
+                          similarity,
+                          root=NEIGHBOURS_ROOT,
+                          num_neighbours=NUM_NEIGHBOURS,
+                          chunk_size=1024):
+    """Compute and persist the top-N neighbours of each course.
+
+    Inputs:
+        course_names: list
+            Course names, in the row order of similarity.
+        similarity: numpy.array (n_courses, n_courses)
+            Course similarity matrix.
+        root: str
+            Output directory.
+        num_neighbours: int
+            Number of neighbours kept per course (incl. the course itself).
+        chunk_size: int
+            Number of similarity rows processed at once.
+    Outputs:
+        None.
+    """
+    os.makedirs(root, exist_ok=True)
+    previous_dir = get_current_dir(root)
+    version_dir = tempfile.mkdtemp(prefix="index-", dir=root)
+    num_courses = len(course_names)
+    num_neighbours = min(num_neighbours, num_courses)
+    indices = np.zeros((num_courses, num_neighbours), dtype=np.int32)
+    scores = np.zeros((num_courses, num_neighbours), dtype=np.float32)
+    for start in range(0, num_courses, chunk_size):
+        rows = np.asarray(similarity[start:start+chunk_size])
+        top_indices, top_scores = select_top_k(rows, num_neighbours)
+        indices[start:start+chunk_size] = top_indices
+        scores[start:start+chunk_size] = top_scores
+    np.save(os.path.join(version_dir, "indices.npy"), indices)
+    np.save(os.path.join(version_dir, "scores.npy"), scores)
+    # Names are written last: they mark the version as complete
+    with open(os.path.join(version_dir, "names.json"), "w") as f:
+        json.dump(list(course_names), f)
+    # Switch the readers to the new version
+    pointer_filepath = os.path.join(version_dir, CURRENT_FILENAME)
+    with open(pointer_filepath, "w") as f:
+        f.write(os.path.basename(version_dir))
+    os.replace(pointer_filepath, os.path.join(root, CURRENT_FILENAME))
+    remove_old_versions(root, keep=[version_dir, previous_dir])
+
+def get_current_dir(root=NEIGHBOURS_ROOT):
+    """Directory of the current version of an index; None if there is none."""
+    try:
+        with open(os.path.join(root, CURRENT_FILENAME)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(root, version)
+
+def remove_old_versions(root, keep):
+    """Remove the complete versions of an index older than the kept ones.
+
+    The previous version is kept for the readers which have just read the
+    pointer; versions still being written by another build are skipped.
+
+    Inputs:
+        root: str
+            Index directory.
+        keep: list
+            Version directories to keep (None entries are ignored).
+    Outputs:
+        None.
+    """
+    keep = [os.path.abspath(version_dir) for version_dir in keep if version_dir is not None]
+    keep_mtimes = [os.path.getmtime(os.path.join(version_dir, "names.json"))
+                   for version_dir in keep if os.path.isfile(os.path.join(version_dir, "names.json"))]
+    if not keep_mtimes:
+        return
+    for entry in os.listdir(root):
+        version_dir = os.path.abspath(os.path.join(root, entry))
+        names_filepath = os.path.join(version_dir, "names.json")
+        if version_dir in keep or not os.path.isfile(names_filepath):
+            continue
+        if os.path.getmtime(names_filepath) < min(keep_mtimes):
+            shutil.rmtree(version_dir, ignore_errors=True)
+
+def load_neighbour_index(root=NEIGHBOURS_ROOT):
+    """Load the current version of a neighbour index;
+    the arrays are memory-mapped (read-only).
+
+    Inputs:
+        root: str
+            Index directory.
+    Outputs:
+        neighbour_index: dict
+            "indices", "scores": numpy.memmap (n_courses, N),
+            "names": list of course names,
+            "name_idx_dict": dict course name -> course index (first occurrence).
+    """
+    version_dir = get_current_dir(root)
+    if version_dir is None:
+        raise FileNotFoundError(f"No neighbour index in {root}/, run neighbour_index.py")
+    with open(os.path.join(version_dir, "names.json")) as f:
+        names = json.load(f)
+    name_idx_dict = {}
+    for i, name in enumerate(names):
+        name_idx_dict.setdefault(name, i)
+    neighbour_index = {
+        "indices": np.load(os.path.join(version_dir, "indices.npy"), mmap_mode="r"),
+        "scores": np.load(os.path.join(version_dir, "scores.npy"), mmap_mode="r"),
+        "names": names,
+        "name_idx_dict": name_idx_dict,
+    }
+
+    return neighbour_index
+
+def is_index_stale(root=NEIGHBOURS_ROOT):
+    """Whether the index is missing or older than the pickled sources."""
+    pointer_filepath = os.path.join(root, CURRENT_FILENAME)
+    if not os.path.isfile(pointer_filepath):
+        return True
+    index_mtime = os.path.getmtime(pointer_filepath)
+    return any(os.path.isfile(filepath) and os.path.getmtime(filepath) > index_mtime
+               for filepath in (COURSES_FILEPATH, SIMILARITY_FILEPATH))
+
+def build_from_pickles(root=NEIGHBOURS_ROOT, num_neighbours=NUM_NEIGHBOURS):
+    """Build the index from courses.pkl and similarity.pkl."""
+    with open(COURSES_FILEPATH, "rb") as f:
+        courses_list = pickle.load(f)
+    with open(SIMILARITY_FILEPATH, "rb") as f:
+        similarity = pickle.load(f)
+    build_neighbour_index(courses_list['course_name'].tolist(),
+                          similarity,
+                          root=root,
+                          num_neighbours=num_neighbours)
+
+def get_neighbour_index(root=NEIGHBOURS_ROOT):
+    """Get the process-wide neighbour index, loading it lazily
+    on first use; it is (re)built first if missing or stale."""
+    global NEIGHBOUR_INDEX
+    if NEIGHBOUR_INDEX is None:
+        with NEIGHBOUR_INDEX_LOCK:
+            if NEIGHBOUR_INDEX is None:
+                if is_index_stale(root):
+                    build_from_pickles(root)
+                NEIGHBOUR_INDEX = load_neighbour_index(root)
+    return NEIGHBOUR_INDEX
+
+def get_neighbours(course_name, num_neighbours, skip_first=True):
+    """Get the names of the nearest neighbours of a course: O(1) slice.
+
+    Inputs:
+        course_name: str
+            Course name.
+        num_neighbours: int
+            Number of neighbours returned.
+        skip_first: bool
+            Whether to skip the first neighbour, i.e., the course itself.
+    Outputs:
+        neighbour_names: list
+            Names of the most similar courses; empty for an unknown course.
+    """
+    neighbour_index = get_neighbour_index()
+    index = neighbour_index["name_idx_dict"].get(course_name)
+    if index is None:
+        return []
+    start = 1 if skip_first else 0
+    row = neighbour_index["indices"][index, start:start+num_neighbours]
+    names = neighbour_index["names"]
+
+    return [names[i] for i in row.tolist()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the course neighbour index for main.py.")
+    parser.add_argument("--root", default=NEIGHBOURS_ROOT, help="Output directory.")
+    parser.add_argument("--num-neighbours", type=int, default=NUM_NEIGHBOURS,
+                        help="Neighbours kept per course, incl. the course itself.")
+    args = parser.parse_args()
+    build_from_pickles(args.root, args.num_neighbours)
+    print(f"Neighbour index written to {args.root}/")
+
+if __name__ == "__main__":
+    main()
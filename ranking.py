@@ -0,0 +1,60 @@
+"""This module contains the ranking utilities shared
+by the recommender backend and the Streamlit apps.
+
+It only depends on NumPy, so that the apps can rank
+recommendations without importing the model libraries.
+"""
+
+import numpy as np
+
+def select_top_k(scores, k=None, threshold=None):
+    """Select the k largest scores of each row, sorted in descending order.
+
+    A partial selection (argpartition) finds the k winners in O(n)
+    and only those are sorted, so a row costs O(n + k log k)
+    instead of O(n log n). The score threshold is applied in the same pass:
+    scores below it are replaced by -inf, so they are never selected
+    ahead of a valid score. Ties are ordered by ascending column index,
+    also at the k-th position: the result is a prefix of the full ranking.
+
+    Inputs:
+        scores: numpy.array (n_rows, n_columns) or (n_columns,)
+            Score matrix, e.g., users x courses.
+        k: int
+            Number of elements to select; None or <= 0 selects all.
+        threshold: float
+            Minimum score; None keeps all scores.
+    Outputs:
+        top_indices: numpy.array (n_rows, k)
+            Column indices of the selected scores.
+        top_scores: numpy.array (n_rows, k)
+            Selected scores; -inf marks masked/invalid entries,
+            which callers should drop.
+    """
+    scores = np.atleast_2d(np.asarray(scores, dtype=np.float64))
+    if threshold is not None:
+        scores = np.where(scores >= threshold, scores, -np.inf)
+    # NaN scores (e.g., similarities of empty vectors) are never selected ahead of valid ones
+    nan_mask = np.isnan(scores)
+    if nan_mask.any():
+        scores = np.where(nan_mask, -np.inf, scores)
+    num_rows, num_columns = scores.shape
+    if k is None or k <= 0 or k >= num_columns:
+        candidates = np.broadcast_to(np.arange(num_columns), scores.shape)
+    else:
+        # Partial selection of the k-th largest score of each row
+        kth_scores = -np.partition(-scores, k-1, axis=1)[:, k-1:k]
+        # Winners: the scores above it, then the tied ones of lowest index,
+        # so that the selection does not depend on the partition order
+        above = scores > kth_scores
+        tied = scores == kth_scores
+        num_tied = k - above.sum(axis=1, keepdims=True)
+        selected = above | (tied & (np.cumsum(tied, axis=1) <= num_tied))
+        candidates = np.nonzero(selected)[1].reshape(num_rows, k)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    # Sort only the winners: by descending score, then ascending index
+    order = np.lexsort((candidates, -candidate_scores), axis=-1)
+    top_indices = np.take_along_axis(candidates, order, axis=1)
+    top_scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+    return top_indices, top_scores
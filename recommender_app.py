@@ -67,7 +67,8 @@ def init_recommender_app():
     """
     # Load all dataframes
     with st.spinner('Loading datasets...'):
-       
+        # Load the core datasets concurrently (cached after the first run)
+        backend.preload_datasets()
         course_df = load_courses()
     
     st.success('Datasets loaded successfully...')
@@ -176,6 +177,8 @@ def predict(model_name, params, training_artifacts):
             st.success('Recommendations generated!')
             st.write(f"**{backend.MODELS[model_index][3:]}**: {backend.MODEL_DESCRIPTIONS[model_index]}")          
             st.write(descr)
+            with st.expander("Timing breakdown"):
+                st.table(backend.STAGE_TIMINGS.last_request())
         else:
             st.write("Sorry, the Neural Networks model is not active at the moment\
                 due to the slug memory quota on Heroku. \
@@ -0,0 +1,187 @@
+"""This module contains the Keras model of the "Neural Network"
+recommender, RecommenderNet, and the TensorFlow objects used to train it.
+
+It is kept apart from the backend so that TensorFlow is imported
+only when a neural network model is trained: the backend imports
+this module lazily, see backend.lazy_import().
+
+The training input is streamed from the rating shards written by
+backend.write_ann_shards() with a tf.data pipeline, see make_ratings_dataset().
+"""
+
+import logging
+import time
+
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+from tensorflow.keras.optimizers import Adam # noqa: F401
+from tensorflow.keras.metrics import RootMeanSquaredError # noqa: F401
+from tensorflow.keras.losses import MeanSquaredError # noqa: F401
+
+class RecommenderNet(keras.Model):
+    
+    def __init__(self, num_users, num_items, embedding_size=16, **kwargs):
+        """Constructor.
+           :param int num_users: number of users
+           :param int num_items: number of items
+           :param int embedding_size: the size of embedding vector
+        """
+        super(RecommenderNet, self).__init__(**kwargs)
+        self.num_users = num_users
+        self.num_items = num_items
+        self.embedding_size = embedding_size
+        
+        # Define a user_embedding vector
+        # Input dimension is the num_users
+        # Output dimension is the embedding size
+        self.user_embedding_layer = layers.Embedding(
+            input_dim=num_users,
+            output_dim=embedding_size,
+            name='user_embedding_layer',
+            embeddings_initializer="he_normal",
+            embeddings_regularizer=keras.regularizers.l2(1e-6),
+        )
+        # Define a user bias layer
+        self.user_bias = layers.Embedding(
+            input_dim=num_users,
+            output_dim=1,
+            name="user_bias")
+        
+        # Define an item_embedding vector
+        # Input dimension is the num_items
+        # Output dimension is the embedding size
+        self.item_embedding_layer = layers.Embedding(
+            input_dim=num_items,
+            output_dim=embedding_size,
+            name='item_embedding_layer',
+            embeddings_initializer="he_normal",
+            embeddings_regularizer=keras.regularizers.l2(1e-6),
+        )
+        # Define an item bias layer
+        self.item_bias = layers.Embedding(
+            input_dim=num_items,
+            output_dim=1,
+            name="item_bias")
+        
+    def call(self, inputs):
+        """Method to be called during model fitting.
+           
+           :param inputs: user and item one-hot vectors
+        """
+        # Compute the user embedding vector
+        user_vector = self.user_embedding_layer(inputs[:, 0])
+        user_bias = self.user_bias(inputs[:, 0])
+        item_vector = self.item_embedding_layer(inputs[:, 1])
+        item_bias = self.item_bias(inputs[:, 1])
+        # Row-wise dot product: one score per (user, item) pair of the batch
+        dot_user_item = tf.reduce_sum(user_vector * item_vector, axis=1, keepdims=True)
+        # Add all the components (including bias)
+        x = dot_user_item + user_bias + item_bias
+        # Sigmoid output layer to output the probability
+        return tf.nn.relu(x)
+
+logger = logging.getLogger(__name__)
+
+# Bytes of a shard record: user row (int32), item row (int32), scaled rating (float32)
+RECORD_BYTES = 12
+# Shard files read concurrently
+NUM_PARALLEL_READS = 4
+
+def decode_records(records):
+    """Decode a batch of raw shard records to the model inputs and targets.
+
+    Inputs:
+        records: tf.Tensor (batch,), tf.string
+            Raw records of RECORD_BYTES bytes.
+    Outputs:
+        x: tf.Tensor (batch, 2), tf.int32
+            User and item embedding rows.
+        y: tf.Tensor (batch,), tf.float32
+            Scaled ratings.
+    """
+    fields = tf.io.decode_raw(records, tf.int32, little_endian=True) # (batch, 3)
+    x = fields[:, :2]
+    y = tf.bitcast(fields[:, 2], tf.float32)
+    return x, y
+
+def make_ratings_dataset(filepaths,
+                         batch_size,
+                         shuffle_buffer=None,
+                         seed=None,
+                         num_parallel_reads=NUM_PARALLEL_READS):
+    """Create the tf.data input pipeline of a split of the rating shards:
+    the shard files are read concurrently (interleaved), the records shuffled
+    in a bounded buffer, batched, decoded and prefetched on the CPU,
+    so that only the buffers are held in memory.
+
+    Inputs:
+        filepaths: list
+            Shard files of the split.
+        batch_size: int
+            Batch size.
+        shuffle_buffer: int
+            Records in the shuffle buffer; None does not shuffle
+            (validation and test).
+        seed: int
+            Shuffle seed; the order changes every epoch.
+        num_parallel_reads: int
+            Shard files read concurrently.
+    Outputs:
+        dataset: tf.data.Dataset
+            Batches of (x, y), see decode_records().
+    """
+    with tf.device("/cpu:0"):
+        files = tf.data.Dataset.from_tensor_slices(list(filepaths))
+        if shuffle_buffer:
+            files = files.shuffle(max(len(filepaths), 1), seed=seed, reshuffle_each_iteration=True)
+        dataset = files.interleave(lambda filepath: tf.data.FixedLengthRecordDataset(filepath, RECORD_BYTES),
+                                   cycle_length=num_parallel_reads,
+                                   num_parallel_calls=tf.data.AUTOTUNE,
+                                   deterministic=not shuffle_buffer)
+        if shuffle_buffer:
+            dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+        # Decode whole batches: one vectorized op per batch
+        dataset = dataset.batch(batch_size)
+        dataset = dataset.map(decode_records, num_parallel_calls=tf.data.AUTOTUNE)
+        dataset = dataset.prefetch(tf.data.AUTOTUNE)
+
+    return dataset
+
+class ThroughputCallback(keras.callbacks.Callback):
+    """Measure the training throughput of each epoch (examples/s),
+    excluding its validation pass; it is added to the epoch logs
+    as "examples_per_s" and logged at INFO level (the backend also records
+    the epoch times in STAGE_TIMINGS, stage "ann_epoch")."""
+
+    def __init__(self, num_examples):
+        """Constructor.
+           :param int num_examples: training examples per epoch
+        """
+        super(ThroughputCallback, self).__init__()
+        self.num_examples = num_examples
+        self.epochs = []
+        self._epoch_tic = None
+        self._test_tic = None
+        self._test_seconds = 0.0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_tic = time.perf_counter()
+        self._test_seconds = 0.0
+
+    def on_test_begin(self, logs=None):
+        self._test_tic = time.perf_counter()
+
+    def on_test_end(self, logs=None):
+        self._test_seconds += time.perf_counter() - self._test_tic
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self._epoch_tic - self._test_seconds
+        examples_per_s = self.num_examples / seconds if seconds > 0 else float("inf")
+        self.epochs.append({"epoch": epoch,
+                            "seconds": seconds,
+                            "examples": self.num_examples,
+                            "examples_per_s": examples_per_s})
+        if logs is not None:
+            logs["examples_per_s"] = examples_per_s
+        logger.info("Epoch %d: %.0f examples/s", epoch + 1, examples_per_s)
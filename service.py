@@ -0,0 +1,401 @@
+"""This module is a headless HTTP/JSON recommendation service
+built on the backend functions, for clients other than the Streamlit app
+(e.g., an LMS). It only uses the standard library HTTP server.
+
+The datasets are preloaded once at startup and the training artifacts
+of each (model, params, data) are kept in memory after the first
+train/predict request (backed by the persistent artifact store):
+only the latest data version of each (model, params) is kept, and at most
+MAX_CACHED_ARTIFACTS entries, the least recently used ones being evicted.
+Requests are executed in a bounded worker pool with a timeout,
+and the latency of each endpoint is tracked (p50/p99).
+The models without batched prediction share a single process pool
+owned by the service; its size is set at startup, not by the clients.
+The params of a request are checked against REQUEST_PARAMS.
+
+Endpoints:
+
+    GET  /health          status, trained models and latency stats
+    GET  /stats           latency stats per endpoint
+    POST /train           {"model_name": str, "params": {...}}
+    POST /predict         {"model_name": str, "user_id": int, "params": {...}}
+    POST /predict_batch   {"model_name": str, "user_ids": [int], "params": {...}}
+
+Usage:
+
+    python service.py
+    python service.py --port 8000 --workers 8 --processes 4 --timeout 30
+
+    curl -X POST localhost:8000/predict \\
+         -d '{"model_name": "1. Course Similarity", "user_id": 2, "params": {"top_courses": 10}}'
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import backend
+
+HOST = "127.0.0.1"
+PORT = 8000
+NUM_WORKERS = 8
+REQUEST_TIMEOUT = 30.0 # s
+LATENCY_WINDOW = 10000 # latest requests kept per endpoint for the percentiles
+MAX_CACHED_ARTIFACTS = 16 # training artifacts kept in memory (LRU)
+NUM_PROCESSES = backend.PREDICT_WORKERS # process pool of the models without batched prediction
+
+# Params accepted from the clients: name -> (type, (min, max) or allowed values).
+# The prediction params are accepted for all models, the training params
+# only for their model (see backend.TRAINING_PARAMS); "num_workers" is ignored
+REQUEST_PARAMS = {
+    "top_courses": (int, (1, 1000)),
+    "sim_threshold": (float, (0, 100)),
+    "sim_aggregation": (str, backend.SIM_AGGREGATIONS),
+    "profile_threshold": (float, (0, 100)),
+    "num_clusters": (int, (1, 100)),
+    "pca_variance": (float, (0.0, 1.0)),
+    "clustering_mode": (str, ("batch", "streaming")),
+    "num_neighbors": (int, (1, 1000)),
+    "num_components": (int, (1, 100)),
+}
+PREDICT_PARAMS = ("top_courses", "sim_threshold", "sim_aggregation", "profile_threshold")
+
+class ServiceError(Exception):
+    """Error returned to the client with an HTTP status code."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class LatencyTracker:
+    """Latency of the latest requests of each endpoint, thread-safe."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._latencies = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds):
+        with self._lock:
+            if endpoint not in self._latencies:
+                self._latencies[endpoint] = deque(maxlen=self.window)
+                self._counts[endpoint] = 0
+            self._latencies[endpoint].append(seconds)
+            self._counts[endpoint] += 1
+
+    def summary(self):
+        """Get the request count and the p50/p99 latency (ms) of each endpoint."""
+        with self._lock:
+            latencies = {endpoint: np.array(values) for endpoint, values in self._latencies.items()}
+            counts = dict(self._counts)
+        summary = dict()
+        for endpoint, values in latencies.items():
+            p50, p99 = np.percentile(values, [50, 99]) * 1000
+            summary[endpoint] = {"count": counts[endpoint],
+                                 "p50_ms": float(p50),
+                                 "p99_ms": float(p99)}
+        return summary
+
+class RecommendationService:
+    """State and endpoint logic of the service, independent of HTTP.
+
+    Inputs:
+        num_workers: int
+            Size of the worker pool which executes the requests.
+        timeout: float
+            Request timeout (s); the client gets a 504 after it.
+        preload: bool
+            Whether to preload the datasets at construction.
+        max_artifacts: int
+            Training artifacts kept in memory.
+        num_processes: int
+            Size of the process pool of the models without batched prediction;
+            the pool is started on first use.
+    """
+
+    def __init__(self, num_workers=NUM_WORKERS, timeout=REQUEST_TIMEOUT, preload=True,
+                 max_artifacts=MAX_CACHED_ARTIFACTS, num_processes=NUM_PROCESSES):
+        self.timeout = timeout
+        self.max_artifacts = max_artifacts
+        self.num_processes = num_processes
+        self.executor = ThreadPoolExecutor(max_workers=num_workers)
+        self._process_pool = None
+        self.latency = LatencyTracker()
+        self.started = time.time()
+        # Training artifacts in memory, by artifact store key, in LRU order:
+        # key -> (model key, training_artifacts); the model key ignores the data
+        self._artifacts = OrderedDict()
+        # Model key -> artifact store key of its latest data version
+        self._model_keys = {}
+        self._train_locks = {}
+        self._lock = threading.Lock()
+        if preload:
+            backend.preload_datasets()
+
+    def get_artifacts(self, model_name, params):
+        """Get the training artifacts of a model, training it only on the first
+        request for the same params and data (concurrent requests wait for it)."""
+        key = backend.ARTIFACTS.get_key(model_name, params, backend.get_data_fingerprint(model_name))
+        with self._lock:
+            entry = self._artifacts.get(key)
+            if entry is not None:
+                self._artifacts.move_to_end(key)
+                return entry[1]
+            train_lock = self._train_locks.setdefault(key, threading.Lock())
+        with train_lock:
+            with self._lock:
+                entry = self._artifacts.get(key)
+            if entry is not None:
+                return entry[1]
+            training_artifacts = backend.train(model_name, params)
+            self._insert_artifacts(backend.ARTIFACTS.get_key(model_name, params, None),
+                                   key,
+                                   training_artifacts)
+            with self._lock:
+                self._train_locks.pop(key, None)
+        return training_artifacts
+
+    def _insert_artifacts(self, model_key, key, training_artifacts):
+        """Cache new artifacts: the previous data version of the same model
+        and params is dropped, then the least recently used entries above the limit."""
+        with self._lock:
+            previous_key = self._model_keys.get(model_key)
+            if previous_key is not None and previous_key != key:
+                self._artifacts.pop(previous_key, None)
+            self._model_keys[model_key] = key
+            self._artifacts[key] = (model_key, training_artifacts)
+            self._artifacts.move_to_end(key)
+            while len(self._artifacts) > self.max_artifacts:
+                evicted_key, (evicted_model_key, _) = self._artifacts.popitem(last=False)
+                if self._model_keys.get(evicted_model_key) == evicted_key:
+                    del self._model_keys[evicted_model_key]
+
+    def get_process_pool(self):
+        """Get the process pool of the service, started on first use."""
+        with self._lock:
+            if self._process_pool is None and self.num_processes > 1:
+                self._process_pool = ProcessPoolExecutor(max_workers=self.num_processes)
+            return self._process_pool
+
+    def train(self, payload):
+        model_name, params = parse_model_request(payload)
+        tic = time.perf_counter()
+        self.get_artifacts(model_name, params)
+        return {"model_name": model_name,
+                "train_s": time.perf_counter() - tic}
+
+    def predict(self, payload):
+        if "user_id" not in payload:
+            raise ServiceError(400, "Missing field: user_id")
+        result = self.predict_batch(dict(payload, user_ids=[payload["user_id"]]))
+        return dict(result["results"][0], score_description=result["score_description"])
+
+    def predict_batch(self, payload):
+        model_name, params = parse_model_request(payload)
+        user_ids = payload.get("user_ids")
+        if not isinstance(user_ids, list):
+            raise ServiceError(400, "Missing field: user_ids (list)")
+        training_artifacts = self.get_artifacts(model_name, params)
+        model_index = backend.get_model_index(model_name)
+        if model_index in backend.BATCHED_MODELS or len(user_ids) <= 1:
+            executor = None
+        else:
+            executor = self.get_process_pool()
+        res_df, score_description = backend.predict_batch(model_name,
+                                                          user_ids,
+                                                          params,
+                                                          training_artifacts,
+                                                          num_workers=self.num_processes if executor else 1,
+                                                          executor=executor)
+        recommendations = {user_id: [] for user_id in user_ids}
+        for user_id, course_id, score in zip(res_df['USER'].tolist(),
+                                             res_df['COURSE_ID'].tolist(),
+                                             res_df['SCORE'].tolist()):
+            recommendations[user_id].append({"course_id": course_id, "score": float(score)})
+        return {"model_name": model_name,
+                "results": [{"user_id": user_id, "recommendations": recommendations[user_id]}
+                            for user_id in user_ids],
+                "score_description": score_description}
+
+    def health(self, payload=None):
+        with self._lock:
+            trained = sorted({artifacts["model_name"] for _, artifacts in self._artifacts.values()})
+            cached_artifacts = len(self._artifacts)
+        return {"status": "ok",
+                "uptime_s": time.time() - self.started,
+                "models": list(backend.MODELS),
+                "trained": trained,
+                "cached_artifacts": cached_artifacts,
+                "datasets": backend.DATASETS.stats(),
+                "latency": self.latency.summary()}
+
+    def stats(self, payload=None):
+        return self.latency.summary()
+
+    def handle(self, endpoint, payload):
+        """Run an endpoint in the worker pool, with the request timeout.
+
+        Outputs:
+            status: int
+                HTTP status code.
+            body: dict
+                JSON response.
+        """
+        routes = {
+            ("GET", "/health"): self.health,
+            ("GET", "/stats"): self.stats,
+            ("POST", "/train"): self.train,
+            ("POST", "/predict"): self.predict,
+            ("POST", "/predict_batch"): self.predict_batch,
+        }
+        tic = time.perf_counter()
+        try:
+            if endpoint not in routes:
+                raise ServiceError(404, f"Unknown endpoint: {endpoint[0]} {endpoint[1]}")
+            future = self.executor.submit(routes[endpoint], payload)
+            try:
+                status, body = 200, future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                # The worker finishes in the background; its result is dropped
+                raise ServiceError(504, f"Request timed out after {self.timeout} s")
+        except ServiceError as err:
+            status, body = err.status, {"error": err.message}
+        except Exception as err:
+            status, body = 500, {"error": f"{type(err).__name__}: {err}"}
+        if endpoint in routes:
+            self.latency.record(endpoint[1], time.perf_counter() - tic)
+
+        return status, body
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+        with self._lock:
+            if self._process_pool is not None:
+                self._process_pool.shutdown(wait=False)
+                self._process_pool = None
+
+def parse_model_request(payload):
+    """Validate the model name and params of a request payload;
+    see parse_params()."""
+    model_name = payload.get("model_name")
+    if model_name not in backend.MODELS:
+        raise ServiceError(400, f"Unknown model_name: {model_name}; available: {list(backend.MODELS)}")
+    return model_name, parse_params(model_name, payload.get("params", {}))
+
+def parse_params(model_name, params):
+    """Check the params of a request against REQUEST_PARAMS.
+
+    Inputs:
+        model_name: str
+            Model name as in backend.MODELS.
+        params: dict
+            Params of the request.
+    Outputs:
+        params: dict
+            Checked params, without "num_workers".
+    """
+    if not isinstance(params, dict):
+        raise ServiceError(400, "params must be a JSON object")
+    allowed = PREDICT_PARAMS + backend.TRAINING_PARAMS[backend.get_model_index(model_name)]
+    checked = dict()
+    for name, value in params.items():
+        if name == "num_workers":
+            continue
+        if name not in allowed:
+            raise ServiceError(400, f"Unknown param for {model_name}: {name}; allowed: {list(allowed)}")
+        value_type, values = REQUEST_PARAMS[name]
+        if value_type is str:
+            valid = isinstance(value, str) and value in values
+        else:
+            # bool is an int subclass, but never a valid number here
+            types = (int, float) if value_type is float else (int,)
+            valid = (isinstance(value, types) and not isinstance(value, bool)
+                     and values[0] <= value <= values[1])
+        if not valid:
+            raise ServiceError(400, f"Invalid param {name}: {value!r}; expected {value_type.__name__} in {values}")
+        checked[name] = value
+    return checked
+
+def make_handler(service):
+    """Create the HTTP request handler class bound to a service."""
+
+    class RequestHandler(BaseHTTPRequestHandler):
+
+        def _respond(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._respond(*service.handle(("GET", self.path), None))
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(payload, dict):
+                    raise ValueError("expected a JSON object")
+            except ValueError as err:
+                self._respond(400, {"error": f"Invalid JSON body: {err}"})
+                return
+            self._respond(*service.handle(("POST", self.path), payload))
+
+        def log_message(self, format, *args):
+            # Latencies are tracked by the service; skip the per-request stderr log
+            pass
+
+    return RequestHandler
+
+def create_server(host=HOST, port=PORT, num_workers=NUM_WORKERS, timeout=REQUEST_TIMEOUT, preload=True,
+                  max_artifacts=MAX_CACHED_ARTIFACTS, num_processes=NUM_PROCESSES):
+    """Create the HTTP server and its service; port 0 picks a free port.
+
+    Outputs:
+        server: http.server.ThreadingHTTPServer
+            Server, started with serve_forever(); server.service is the service.
+    """
+    service = RecommendationService(num_workers=num_workers, timeout=timeout, preload=preload,
+                                    max_artifacts=max_artifacts, num_processes=num_processes)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the HTTP/JSON recommendation service.")
+    parser.add_argument("--host", default=HOST, help="Interface to bind; local only by default.")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="Worker pool size.")
+    parser.add_argument("--processes", type=int, default=NUM_PROCESSES,
+                        help="Process pool size of the models without batched prediction.")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT, help="Request timeout (s).")
+    parser.add_argument("--no-preload", action="store_true", help="Do not preload the datasets.")
+    parser.add_argument("--max-artifacts", type=int, default=MAX_CACHED_ARTIFACTS,
+                        help="Training artifacts kept in memory (LRU).")
+    args = parser.parse_args()
+    server = create_server(args.host, args.port, args.workers, args.timeout, not args.no_preload,
+                           args.max_artifacts, args.processes)
+    print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.shutdown()
+        print(json.dumps(server.service.stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""This script reports the startup time of the recommender backend,
+so that it can be tracked against a budget:
+
+- module: cumulative import time of each module imported by `import backend`,
+  measured in a fresh interpreter with `python -X importtime`
+- dataset: load time of each dataset preloaded by backend.preload_datasets()
+
+The model dependencies (scikit-learn, TensorFlow) are imported lazily
+by the backend, so they should not appear in the module list;
+if they do, they are flagged.
+
+Usage:
+
+    python startup_report.py
+    python startup_report.py --budget 3.0 --json startup.json
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ("sklearn", "tensorflow", "keras")
+
+def measure_module_imports(module_name="backend"):
+    """Measure the import time of a module and of its direct imports
+    in a fresh interpreter, with python -X importtime.
+
+    Inputs:
+        module_name: str
+            Module to import.
+    Outputs:
+        import_times: dict
+            Cumulative import time (s) of the direct imports of the module,
+            by top-level package (only those not already imported
+            by the interpreter), plus the module itself.
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+                               capture_output=True, text=True, check=True)
+    # Line format: "import time: <self us> | <cumulative us> | <indent><module>";
+    # children are printed before their parent, two spaces of indent per level
+    entries = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name[1:]
+        level = (len(name) - len(name.lstrip(" "))) // 2
+        entries.append((level, name.strip(), int(cumulative) / 1e6))
+    # The direct imports are the level-1 entries just before the top-level module entry
+    end = max(i for i, (level, name, _) in enumerate(entries) if level == 0 and name == module_name)
+    start = end
+    while start > 0 and entries[start-1][0] > 0:
+        start -= 1
+    import_times = {}
+    for level, name, seconds in entries[start:end]:
+        if level == 1:
+            # Grouped by top-level package, e.g., the scipy.sparse submodules
+            package = name.split(".")[0]
+            import_times[package] = import_times.get(package, 0.0) + seconds
+    import_times[module_name] = entries[end][2]
+
+    return import_times
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the startup time of the backend.")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="Startup budget in seconds; exit code 1 if exceeded.")
+    parser.add_argument("--json", default=None, help="Write the report to this JSON file.")
+    args = parser.parse_args()
+
+    import_times = measure_module_imports("backend")
+    heavy = sorted(name for name in import_times
+                   if name.split(".")[0] in HEAVY_MODULES)
+
+    tic = time.perf_counter()
+    import backend
+    backend_import_s = time.perf_counter() - tic
+    tic = time.perf_counter()
+    dataset_times = backend.preload_datasets()
+    preload_s = time.perf_counter() - tic
+    total_s = backend_import_s + preload_s
+
+    print(f"{'kind':<9}{'name':<40}{'seconds':>10}")
+    for name, seconds in sorted(import_times.items(), key=lambda item: -item[1]):
+        print(f"{'module':<9}{name:<40}{seconds:>10.3f}")
+    for name, seconds in dataset_times.items():
+        print(f"{'dataset':<9}{name:<40}{seconds:>10.3f}")
+    print(f"\nimport backend: {backend_import_s:.3f} s, preload (concurrent): {preload_s:.3f} s,"
+          f" total: {total_s:.3f} s")
+    if heavy:
+        print(f"Warning: heavy modules imported at startup: {', '.join(heavy)}")
+
+    report = {
+        "modules": import_times,
+        "datasets": dataset_times,
+        "backend_import_s": backend_import_s,
+        "preload_s": preload_s,
+        "total_s": total_s,
+        "heavy_modules": heavy,
+        "budget_s": args.budget,
+    }
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.budget is not None and total_s > args.budget:
+        print(f"Startup budget exceeded: {total_s:.3f} s > {args.budget:.3f} s")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+# The modules live at the repository root, next to the app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend
+from benchmark import generate_dataset
+
+@pytest.fixture(scope="session")
+def synthetic_data_root(tmp_path_factory):
+    """A small synthetic dataset with the files of DATA_ROOT, generated once."""
+    data_root = str(tmp_path_factory.mktemp("synthetic") / backend.DATA_ROOT)
+    generate_dataset(data_root, num_users=300, num_courses=40, density=0.1, random_state=7)
+    return data_root
+
+@pytest.fixture
+def data_dir(synthetic_data_root, tmp_path, monkeypatch):
+    """Working directory with a private copy of the synthetic dataset
+    (the backend reads its datasets relative to the working directory)."""
+    shutil.copytree(synthetic_data_root, tmp_path / backend.DATA_ROOT)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,44 @@
+import os
+import time
+
+import numpy as np
+
+import backend
+
+def make_shard_dir(name, manifest_age=None):
+    """A fake shard directory; finished (with a manifest) if manifest_age (s) is given."""
+    shard_dir = os.path.join(backend.ANN_SHARDS_ROOT, name)
+    os.makedirs(shard_dir)
+    if manifest_age is not None:
+        manifest_filepath = os.path.join(shard_dir, "manifest.json")
+        open(manifest_filepath, "w").close()
+        last_used = time.time() - manifest_age
+        os.utime(manifest_filepath, (last_used, last_used))
+    return shard_dir
+
+def test_ann_shards_round_trip(data_dir):
+    manifest = backend.get_ann_shards(shard_size=100)
+    ratings_df = backend.load_ratings()
+    records = np.concatenate([np.fromfile(filepath, dtype=backend.ANN_RECORD_DTYPE)
+                              for split in manifest["splits"].values() for filepath in split["files"]])
+    assert len(records) == len(ratings_df)
+    assert all(os.path.getsize(filepath) <= 100 * backend.ANN_RECORD_DTYPE.itemsize
+               for split in manifest["splits"].values() for filepath in split["files"])
+    decoded = set(zip(manifest["user_ids"][records["user"]].tolist(),
+                      manifest["item_ids"][records["item"]].tolist()))
+    assert decoded == set(zip(ratings_df['user'].tolist(), ratings_df['item'].astype(str).tolist()))
+    # Reused while the ratings do not change
+    assert backend.get_ann_shards(shard_size=100)["splits"] == manifest["splits"]
+
+def test_stale_ann_shards_cleanup(data_dir):
+    os.makedirs(backend.ANN_SHARDS_ROOT)
+    stale_dir = make_shard_dir("stale", manifest_age=2 * backend.ANN_SHARDS_RETENTION)
+    recent_dir = make_shard_dir("recent", manifest_age=60)
+    writing_dir = make_shard_dir("current.123.tmp")
+    partial_dir = make_shard_dir("partial")
+    backend.get_ann_shards()
+    assert not os.path.exists(stale_dir)
+    # Possibly used by a running training job, or being written by another process
+    assert os.path.isdir(recent_dir)
+    assert os.path.isdir(writing_dir)
+    assert os.path.isdir(partial_dir)
@@ -0,0 +1,29 @@
+import os
+
+import backend
+
+def test_artifact_store_lru_eviction(tmp_path):
+    store = backend.ArtifactStore(root=str(tmp_path))
+    keys = [store.get_key(backend.MODELS[4], {"num_neighbors": n}, {"ratings": 1}) for n in range(4)]
+    assert len(set(keys)) == 4
+    payload = {"model_name": backend.MODELS[4], "data": b"x" * 1000}
+    for i, key in enumerate(keys[:3]):
+        store.save(key, payload)
+        # Explicit access times: the mtime resolution may be coarse
+        os.utime(store.get_filepath(key), ns=(i * 10**9, i * 10**9))
+    entry_bytes = os.path.getsize(store.get_filepath(keys[0]))
+    # A hit refreshes the entry: keys[1] becomes the least recently used one
+    assert store.load(keys[0]) == payload
+    store.max_bytes = 3 * entry_bytes
+    store.save(keys[3], payload)
+    assert [os.path.isfile(store.get_filepath(key)) for key in keys] == [True, False, True, True]
+    assert store.load(keys[1]) is None
+    assert store.stats() == {"hits": 1, "misses": 1, "entries": 3, "bytes": 3 * entry_bytes}
+
+def test_artifact_store_key_ignores_unrelated_params():
+    store = backend.ArtifactStore()
+    model_name = backend.MODELS[4]
+    key = store.get_key(model_name, {"num_neighbors": 5}, {"ratings": 1})
+    assert store.get_key(model_name, {"num_neighbors": 5, "top_courses": 3}, {"ratings": 1}) == key
+    assert store.get_key(model_name, {"num_neighbors": 6}, {"ratings": 1}) != key
+    assert store.get_key(model_name, {"num_neighbors": 5}, {"ratings": 2}) != key
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import backend
+
+@pytest.fixture
+def nmf_artifacts(data_dir):
+    return backend.train(backend.MODELS[5], {"num_components": 5}, use_store=False)
+
+@pytest.mark.parametrize("top_courses", [None, 3])
+def test_nmf_predict_batch_matches_single_users(nmf_artifacts, top_courses):
+    model_name = backend.MODELS[5] # 5: "NMF"
+    params = {"num_components": 5, "num_workers": 1}
+    if top_courses is not None:
+        params["top_courses"] = top_courses
+    user_ids = backend.load_ratings()['user'].unique()[:50].tolist()
+    batch_df, _ = backend.predict_batch(model_name, user_ids, params, nmf_artifacts)
+    single_df = pd.concat([backend.predict(model_name, [user_id], params, nmf_artifacts)[0]
+                           for user_id in user_ids], ignore_index=True)
+    pd.testing.assert_frame_equal(batch_df, single_df, check_exact=True)
+
+@pytest.mark.parametrize("top_k", [None, 3])
+def test_nmf_batch_matches_single_users_with_threshold(nmf_artifacts, top_k):
+    user_ids = backend.load_ratings()['user'].unique()[:50].tolist()
+    user_vectors = backend.build_user_rating_vectors(backend.load_user_ratings(user_ids),
+                                                     user_ids,
+                                                     nmf_artifacts["item_ids"])
+    all_scores = [score for res in backend.compute_nmf_recommendations_batch(user_vectors, nmf_artifacts)
+                  for score in res.values()]
+    threshold = float(np.median(all_scores))
+    batch_res = backend.compute_nmf_recommendations_batch(user_vectors, nmf_artifacts, top_k, threshold)
+    assert any(batch_res) and not all(len(res) == len(nmf_artifacts["item_ids"]) for res in batch_res)
+    for i in range(len(user_ids)):
+        single_res = backend.compute_nmf_recommendations_batch(user_vectors[i], nmf_artifacts, top_k, threshold)[0]
+        assert list(single_res.items()) == list(batch_res[i].items())
+
+def test_user_profile_transform_ignores_new_ratings(data_dir):
+    feature_names = backend.load_user_profiles().columns[1:].tolist()
+    scaler, pca = backend.fit_user_profile_transform(feature_names)
+    backend.add_new_ratings([backend.load_ratings()['item'].iloc[0]])
+    cached_scaler, cached_pca = backend.fit_user_profile_transform(feature_names)
+    assert cached_scaler is scaler and cached_pca is pca
+
+def merge_embedding_features(ratings_df, user_embeddings_df, item_embeddings_df):
+    """Reference: the merge-based features (left joins, missing embeddings filled with 0)."""
+    merged_df = pd.merge(ratings_df, user_embeddings_df, how='left', on='user').fillna(0)
+    merged_df = pd.merge(merged_df, item_embeddings_df, how='left', on='item').fillna(0)
+    embedding_size = user_embeddings_df.shape[1] - 1
+    return (merged_df[[f"UFeature{i}" for i in range(embedding_size)]].values
+            + merged_df[[f"CFeature{i}" for i in range(embedding_size)]].values)
+
+@pytest.mark.parametrize("embedding_size", [3, 16])
+def test_embedding_features_match_merges(embedding_size):
+    rng = np.random.default_rng(1)
+    serving = {"user_ids": np.array([10, 20, 30]),
+               "item_ids": np.array(["a", "b"]),
+               "user_embeddings": rng.normal(size=(3, embedding_size)).astype(np.float32),
+               "item_embeddings": rng.normal(size=(2, embedding_size)).astype(np.float32)}
+    # Unknown user 40 and unknown item "c" get zero embeddings
+    ratings_df = pd.DataFrame({"user": [10, 20, 40, 30, 10, 20],
+                               "item": ["a", "b", "a", "c", "b", "a"],
+                               "rating": [3.0, 2.0, 3.0, 3.0, 2.0, 3.0]})
+    user_embeddings_df = pd.DataFrame(serving["user_embeddings"],
+                                      columns=[f"UFeature{i}" for i in range(embedding_size)])
+    user_embeddings_df.insert(0, 'user', serving["user_ids"])
+    item_embeddings_df = pd.DataFrame(serving["item_embeddings"],
+                                      columns=[f"CFeature{i}" for i in range(embedding_size)])
+    item_embeddings_df.insert(0, 'item', serving["item_ids"])
+
+    feature_index = backend.build_embedding_feature_index(serving)
+    X, y = backend.preprocess_embeddings(ratings_df, feature_index, chunk_size=4)
+    assert X.dtype == np.float32 and X.shape == (len(ratings_df), embedding_size)
+    np.testing.assert_allclose(X, merge_embedding_features(ratings_df, user_embeddings_df, item_embeddings_df),
+                               rtol=1e-6)
+    np.testing.assert_array_equal(y, ratings_df['rating'].to_numpy())
+
+    X, unselected_course_ids = backend.create_embeddings_frame(20, ["b"], ["a", "b", "c"], feature_index)
+    assert unselected_course_ids == ["a", "c"]
+    pairs_df = pd.DataFrame({"user": [20, 20], "item": ["a", "c"]})
+    np.testing.assert_allclose(X, merge_embedding_features(pairs_df, user_embeddings_df, item_embeddings_df),
+                               rtol=1e-6)
+
+def test_ratings_store_version_reuses_its_connection(data_dir):
+    version = backend.get_source_fingerprint("ratings")
+    connections = dict(backend.RATINGS_STORE_READERS.connections)
+    backend.add_new_ratings([backend.load_ratings()['item'].iloc[0]])
+    assert backend.get_source_fingerprint("ratings") != version
+    assert backend.RATINGS_STORE_READERS.connections == connections
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backend
+import evaluation
+
+def read_source_files():
+    return {filename: open(os.path.join(backend.DATA_ROOT, filename), "rb").read()
+            for filename in sorted(os.listdir(backend.DATA_ROOT))}
+
+def test_holdout_split_does_not_touch_source_data(data_dir):
+    source_files = read_source_files()
+    for work_dir in (".", str(data_dir), os.path.join("subdir", "..")):
+        with pytest.raises(ValueError):
+            evaluation.create_holdout_split(work_dir)
+    os.makedirs(os.path.join("split", backend.DATA_ROOT))
+    notes_filepath = os.path.join("split", backend.DATA_ROOT, "notes.txt")
+    with open(notes_filepath, "w") as f:
+        f.write("kept")
+    holdout_df = evaluation.create_holdout_split("split", holdout_fraction=0.2)
+    # The ratings store may be created in DATA_ROOT on load: only the existing files are compared
+    current_files = read_source_files()
+    assert {filename: current_files.get(filename) for filename in source_files} == source_files
+    assert os.path.isfile(notes_filepath)
+
+    # Hidden ratings are removed from the split, at least one rating per user is kept
+    ratings_df = backend.load_ratings()
+    split_df = pd.read_csv(os.path.join("split", backend.FILEPATH_RATINGS))
+    assert len(split_df) + len(holdout_df) == len(ratings_df)
+    hidden = set(zip(holdout_df['user'], holdout_df['item']))
+    assert not hidden & set(zip(split_df['user'], split_df['item']))
+    assert set(holdout_df['user']) <= set(split_df['user'])
+
+def test_evaluate_recommendations():
+    res_df = pd.DataFrame({"USER": [1, 1, 1, 2, 2],
+                           "COURSE_ID": ["a", "b", "c", "a", "d"],
+                           "SCORE": [3.0, 2.0, 1.0, 2.0, 1.0]})
+    holdout_df = pd.DataFrame({"user": [1, 1, 2, 3], "item": ["b", "x", "z", "a"]})
+    metrics = evaluation.evaluate_recommendations(res_df, holdout_df, k=2, num_items=10)
+    # User 1: b at rank 2 (1 of 2 hidden); users 2 and 3: no hit
+    assert metrics["precision_at_k"] == pytest.approx(0.5 / 3)
+    assert metrics["recall_at_k"] == pytest.approx(0.5 / 3)
+    assert metrics["hit_rate_at_k"] == pytest.approx(1 / 3)
+    assert metrics["ndcg_at_k"] == pytest.approx((1 / np.log2(3)) / (1 + 1 / np.log2(3)) / 3)
+    assert metrics["coverage_at_k"] == pytest.approx(3 / 10)
@@ -0,0 +1,13 @@
+import os
+
+import pytest
+
+import backend
+import hyperparameter_search
+
+def test_search_refuses_the_source_data_dir(data_dir):
+    source_files = sorted(os.listdir(backend.DATA_ROOT))
+    with pytest.raises(ValueError):
+        hyperparameter_search.run_search(backend.MODELS[4], [{}], search_dir=".")
+    assert sorted(os.listdir(backend.DATA_ROOT)) == source_files
+    assert not os.path.exists("leaderboard.jsonl")
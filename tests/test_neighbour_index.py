@@ -0,0 +1,35 @@
+import os
+
+import numpy as np
+
+import neighbour_index
+
+def test_rebuild_does_not_touch_loaded_index(tmp_path):
+    root = str(tmp_path / "neighbours")
+    names = ["a", "b", "c", "d"]
+    similarity = np.eye(4) + np.arange(16).reshape(4, 4) / 100.0
+    neighbour_index.build_neighbour_index(names, similarity, root=root, num_neighbours=3)
+    old_index = neighbour_index.load_neighbour_index(root)
+    old_indices = np.array(old_index["indices"])
+    old_dir = neighbour_index.get_current_dir(root)
+    # Rebuild with different courses: the loaded version is left unchanged
+    neighbour_index.build_neighbour_index(["e", "f"], np.eye(2), root=root, num_neighbours=3)
+    np.testing.assert_array_equal(old_index["indices"], old_indices)
+    assert os.path.isdir(old_dir)
+    new_index = neighbour_index.load_neighbour_index(root)
+    assert new_index["names"] == ["e", "f"]
+    assert new_index["indices"].shape == (2, 2)
+    # A third build removes the oldest version only
+    # (explicit modification time: the mtime resolution may be coarse)
+    os.utime(os.path.join(old_dir, "names.json"), (0, 0))
+    new_dir = neighbour_index.get_current_dir(root)
+    neighbour_index.build_neighbour_index(names, similarity, root=root, num_neighbours=3)
+    assert not os.path.isdir(old_dir)
+    assert os.path.isdir(new_dir)
+
+def test_get_neighbours_unknown_course(tmp_path, monkeypatch):
+    root = str(tmp_path / "neighbours")
+    neighbour_index.build_neighbour_index(["a", "b", "c"], np.eye(3), root=root)
+    monkeypatch.setattr(neighbour_index, "NEIGHBOUR_INDEX", neighbour_index.load_neighbour_index(root))
+    assert neighbour_index.get_neighbours("unknown", 2) == []
+    assert len(neighbour_index.get_neighbours("a", 2)) == 2
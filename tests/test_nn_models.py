@@ -0,0 +1,99 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+import backend
+
+class StubLayer:
+
+    def __init__(self, weights):
+        self.weights = weights
+
+    def get_weights(self):
+        return [self.weights]
+
+class StubRecommenderNet:
+    """Stand-in of recommender_net.RecommenderNet: random weights,
+    fit() only checks the streamed training records."""
+
+    def __init__(self, num_users, num_items, embedding_size=16):
+        rng = np.random.default_rng(0)
+        self.num_users = num_users
+        self.num_items = num_items
+        self.layers = {
+            "user_embedding_layer": rng.normal(size=(num_users, embedding_size)).astype(np.float32),
+            "user_bias": rng.normal(size=(num_users, 1)).astype(np.float32),
+            "item_embedding_layer": rng.normal(size=(num_items, embedding_size)).astype(np.float32),
+            "item_bias": rng.normal(size=(num_items, 1)).astype(np.float32),
+        }
+
+    def compile(self, **kwargs):
+        pass
+
+    def fit(self, filepaths, validation_data=None, epochs=1, callbacks=()):
+        records = np.concatenate([np.fromfile(filepath, dtype=backend.ANN_RECORD_DTYPE)
+                                  for filepath in filepaths])
+        assert len(records) == callbacks[0].num_examples
+        assert records["user"].min() >= 0 and records["user"].max() < self.num_users
+        assert records["item"].min() >= 0 and records["item"].max() < self.num_items
+        assert records["rating"].min() >= 0 and records["rating"].max() <= 1
+        callbacks[0].epochs.append({"epoch": 0,
+                                    "seconds": 0.5,
+                                    "examples": len(records),
+                                    "examples_per_s": len(records) / 0.5})
+
+    def evaluate(self, filepaths, verbose=0):
+        return [0.1, 0.3]
+
+    def get_layer(self, name):
+        return StubLayer(self.layers[name])
+
+class StubThroughputCallback:
+
+    def __init__(self, num_examples):
+        self.num_examples = num_examples
+        self.epochs = []
+
+@pytest.fixture
+def stub_tensorflow(monkeypatch):
+    """Replace the TensorFlow module of the backend, recommender_net, with a stub."""
+    module = types.ModuleType("recommender_net")
+    module.RecommenderNet = StubRecommenderNet
+    module.ThroughputCallback = StubThroughputCallback
+    module.make_ratings_dataset = lambda filepaths, batch_size, shuffle_buffer=None, seed=None: list(filepaths)
+    module.Adam = module.MeanSquaredError = module.RootMeanSquaredError = lambda *args, **kwargs: None
+    monkeypatch.setitem(sys.modules, "recommender_net", module)
+    monkeypatch.setattr(backend, "HAS_TENSORFLOW", True)
+
+@pytest.mark.parametrize("model_name", backend.NN_MODELS)
+def test_nn_models_train_and_predict(data_dir, stub_tensorflow, model_name):
+    params = {"num_components": 8, "num_epochs": 1, "top_courses": 5, "num_workers": 1}
+    training_artifacts = backend.train(model_name, params, use_store=False)
+    assert training_artifacts["serving"]["user_embeddings"].shape[1] == 8
+    assert training_artifacts["throughput"][0]["examples"] > 0
+    assert any(stage["stage"] == "ann_epoch" and stage["model"] == model_name
+               for stage in backend.STAGE_TIMINGS.to_dict()["stages"])
+    user_ids = backend.load_ratings()['user'].unique()[:10].tolist()
+    res_df, _ = backend.predict_batch(model_name, user_ids, params, training_artifacts)
+    assert set(res_df['USER']) <= set(user_ids)
+    assert res_df.groupby('USER').size().max() <= 5
+    # No recommended course is already rated by its user
+    rated = set(zip(backend.load_ratings()['user'], backend.load_ratings()['item']))
+    assert not any((user, course) in rated for user, course in zip(res_df['USER'], res_df['COURSE_ID']))
+
+def test_nn_models_are_registered():
+    for model_index, model_name in enumerate(backend.NN_MODELS, start=len(backend.MODELS)):
+        assert backend.get_model_index(model_name) == model_index
+        # Not offered in the app, the service, the benchmarks and the evaluation
+        assert model_name not in backend.MODELS
+    # The artifact key depends on the network params
+    keys = {backend.ARTIFACTS.get_key(backend.NN_MODELS[0], {"num_components": num_components, "num_epochs": 1}, {})
+            for num_components in (8, 16)}
+    assert len(keys) == 2
+
+def test_nn_models_need_tensorflow(monkeypatch):
+    monkeypatch.setattr(backend, "HAS_TENSORFLOW", False)
+    with pytest.raises(ImportError, match="TensorFlow"):
+        backend.train(backend.NN_MODELS[0], {"num_components": 8, "num_epochs": 1}, use_store=False)
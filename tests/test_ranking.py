@@ -0,0 +1,36 @@
+import numpy as np
+
+from ranking import select_top_k
+
+def full_ranking(scores):
+    """Reference: stable sort by descending score, then ascending index."""
+    indices = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    return np.lexsort((indices, -scores), axis=-1)
+
+def test_select_top_k_is_a_prefix_of_the_full_ranking_with_ties():
+    rng = np.random.default_rng(0)
+    scores = rng.integers(0, 3, size=(20, 50)).astype(float)
+    for k in (1, 7, 49, 50, None):
+        top_indices, top_scores = select_top_k(scores, k)
+        expected = full_ranking(scores)[:, :k]
+        np.testing.assert_array_equal(top_indices, expected)
+        np.testing.assert_array_equal(top_scores, np.take_along_axis(scores, expected, axis=1))
+
+def test_select_top_k_ties_at_the_boundary():
+    top_indices, top_scores = select_top_k(np.array([1.0, 2.0, 1.0, 1.0, 2.0]), 3)
+    np.testing.assert_array_equal(top_indices, [[1, 4, 0]])
+    np.testing.assert_array_equal(top_scores, [[2.0, 2.0, 1.0]])
+
+def test_select_top_k_threshold():
+    scores = np.array([[0.5, 0.9, 0.1, 0.7],
+                       [0.2, 0.1, 0.3, 0.0]])
+    top_indices, top_scores = select_top_k(scores, 3, threshold=0.5)
+    np.testing.assert_array_equal(top_indices[0], [1, 3, 0])
+    np.testing.assert_array_equal(top_scores[0], [0.9, 0.7, 0.5])
+    # Below the threshold: masked with -inf, to be dropped by the callers
+    assert np.all(top_scores[1] == -np.inf)
+
+def test_select_top_k_nan_scores_are_last():
+    top_indices, top_scores = select_top_k(np.array([np.nan, 0.2, np.nan, 0.1]), 3)
+    np.testing.assert_array_equal(top_indices, [[1, 3, 0]])
+    assert top_scores[0, 2] == -np.inf
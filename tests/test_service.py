@@ -0,0 +1,82 @@
+import pandas as pd
+
+import backend
+import service
+
+def make_service(monkeypatch, fingerprint, max_artifacts):
+    """A service whose training is a counter and whose data version is fingerprint[0]."""
+    trained = []
+
+    def train(model_name, params):
+        trained.append((model_name, params.get("num_neighbors")))
+        return {"model_name": model_name}
+
+    monkeypatch.setattr(backend, "train", train)
+    monkeypatch.setattr(backend, "get_data_fingerprint", lambda model_name: {"ratings": fingerprint[0]})
+    return service.RecommendationService(num_workers=1, preload=False, max_artifacts=max_artifacts), trained
+
+def test_artifacts_are_cached_per_data_version(monkeypatch):
+    fingerprint = [1]
+    recommendation_service, trained = make_service(monkeypatch, fingerprint, max_artifacts=8)
+    model_name, params = backend.MODELS[4], {"num_neighbors": 5}
+    recommendation_service.get_artifacts(model_name, params)
+    recommendation_service.get_artifacts(model_name, params)
+    assert len(trained) == 1
+    # A new rating changes the data version: retrained, the stale copy is dropped
+    fingerprint[0] = 2
+    recommendation_service.get_artifacts(model_name, params)
+    assert len(trained) == 2
+    assert len(recommendation_service._artifacts) == 1
+    recommendation_service.shutdown()
+
+def test_artifacts_lru_eviction(monkeypatch):
+    recommendation_service, trained = make_service(monkeypatch, [1], max_artifacts=2)
+    model_name = backend.MODELS[4]
+    for num_neighbors in (1, 2, 1, 3):
+        recommendation_service.get_artifacts(model_name, {"num_neighbors": num_neighbors})
+    # 2 was the least recently used entry when 3 was inserted
+    assert len(recommendation_service._artifacts) == 2
+    recommendation_service.get_artifacts(model_name, {"num_neighbors": 1})
+    assert trained == [(model_name, 1), (model_name, 2), (model_name, 3)]
+    recommendation_service.get_artifacts(model_name, {"num_neighbors": 2})
+    assert trained[-1] == (model_name, 2)
+    recommendation_service.shutdown()
+
+def test_params_are_checked(monkeypatch):
+    model_name = backend.MODELS[4] # 4: "KNN"
+    params = service.parse_params(model_name, {"num_neighbors": 5, "top_courses": 10, "num_workers": 64})
+    assert params == {"num_neighbors": 5, "top_courses": 10}
+    for params in ({"num_clusters": 5}, {"num_neighbors": "5"}, {"num_neighbors": True},
+                   {"num_neighbors": 10 ** 9}, {"sim_aggregation": "min"}, []):
+        try:
+            service.parse_params(model_name, params)
+        except service.ServiceError as err:
+            assert err.status == 400
+        else:
+            raise AssertionError(f"accepted: {params}")
+
+def test_predictions_share_the_service_process_pool(monkeypatch):
+    recommendation_service, _ = make_service(monkeypatch, [1], max_artifacts=2)
+    recommendation_service.num_processes = 2
+    calls = []
+
+    def predict_batch(model_name, user_ids, params, training_artifacts, num_workers=None, executor=None):
+        calls.append((num_workers, executor))
+        return pd.DataFrame(columns=['USER', 'COURSE_ID', 'SCORE']), ""
+
+    monkeypatch.setattr(backend, "predict_batch", predict_batch)
+    monkeypatch.setattr(backend, "BATCHED_MODELS", ())
+    payload = {"model_name": backend.MODELS[4], "user_ids": [1, 2, 3],
+               "params": {"num_neighbors": 5, "num_workers": 64}}
+    recommendation_service.predict_batch(payload)
+    recommendation_service.predict_batch(payload)
+    assert calls[0][0] == 2 and calls[0][1] is not None
+    assert calls[1][1] is calls[0][1]
+    recommendation_service.shutdown()
+
+def test_health_reads_the_cache(monkeypatch):
+    recommendation_service, _ = make_service(monkeypatch, [1], max_artifacts=2)
+    recommendation_service.get_artifacts(backend.MODELS[4], {"num_neighbors": 5})
+    health = recommendation_service.health()
+    assert health["trained"] == [backend.MODELS[4]] and health["cached_artifacts"] == 1
+    recommendation_service.shutdown()